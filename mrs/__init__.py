@@ -44,12 +44,18 @@ logger.addHandler(handler)
 # expected to be useful outside of Mrs internals.
 from . import registry
 from . import version
-from .fileformats import HexWriter, TextWriter, BinWriter, ZipWriter
+from .fileformats import (HexWriter, TextWriter, BinWriter, ZipWriter,
+        BlockWriter, VarintWriter, DelimitedWriter, CSVWriter)
 from .main import main
-from .mapreduce import MapReduce, IterativeMR, GeneratorCallbackMR
-from .serializers import (Serializer, output_serializers, raw_serializer,
-        str_serializer, int_serializer, make_struct_serializer,
-        make_primitive_serializer, make_protobuf_serializer)
+from .mapreduce import (MapReduce, IterativeMR, GeneratorCallbackMR,
+        hash_combiner, hash_reducer, batch_mapper, batch_reducer, Batch)
+from .serializers import (Serializer, OrderedSerializer, output_serializers,
+        raw_serializer, str_serializer, int_serializer, make_struct_serializer,
+        make_primitive_serializer, make_protobuf_serializer,
+        PrimitiveSerializer, BulkSerializer, numpy_serializer,
+        ordered_int_serializer, ordered_uint_serializer,
+        ordered_float_serializer, ordered_str_serializer,
+        make_ordered_tuple_serializer)
 
 __version__ = version.__version__
 
@@ -58,6 +64,12 @@ __all__ = ['MapReduce', 'main', 'logger', 'BinWriter', 'HexWriter',
     'TextWriter', 'Serializer', 'output_serializers', 'raw_serializer',
     'str_serializer', 'int_serializer', 'make_struct_serializer',
     'make_primitive_serializer', 'make_protobuf_serializer',
-    'GeneratorCallbackMR']
+    'GeneratorCallbackMR', 'hash_combiner', 'hash_reducer',
+    'batch_mapper', 'batch_reducer', 'Batch',
+    'OrderedSerializer', 'PrimitiveSerializer', 'BulkSerializer',
+    'numpy_serializer',
+    'ordered_int_serializer', 'ordered_uint_serializer',
+    'ordered_float_serializer', 'ordered_str_serializer',
+    'make_ordered_tuple_serializer']
 
 # vim: et sw=4 sts=4
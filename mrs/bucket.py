@@ -44,6 +44,8 @@ class ReadBucket(object):
         serializers: A Serializers instance: functions for serializing and
             deserializing between Python objects and bytes.
         url: A string showing a URL that can be used to read the data.
+        block_index: A list of `fileformats.BlockInfo` describing the blocks
+            of the file at the url, or None if it is not known.
     """
     def __init__(self, source, split, serializers=None):
         self._data = []
@@ -51,6 +53,28 @@ class ReadBucket(object):
         self.split = split
         self.serializers = serializers
         self.url = None
+        self.block_index = None
+
+    def presorted(self):
+        """Report whether the data at the url are known to be sorted by key."""
+        if not self.url:
+            return False
+        _, options = fileformats.split_url_options(self.url)
+        return 'sorted' in options
+
+    def read_block_index(self):
+        """Returns the block index, reading it from the url if necessary.
+
+        Returns None if the file at the url has no index (only block-compressed
+        files are indexed) or if it cannot be read without downloading the
+        whole file.
+        """
+        if self.block_index is None and self.url:
+            with fileformats.open_url(self.url) as reader:
+                read_index = getattr(reader, 'read_index', None)
+                if read_index is not None:
+                    self.block_index = read_index()
+        return self.block_index
 
     def addpair(self, kvpair):
         """Collect a single key-value pair."""
@@ -79,8 +103,7 @@ class ReadBucket(object):
         if self._data:
             buf = BytesIO()
             with fileformats.BinWriter(buf, self.serializers) as writer:
-                for pair in self._data:
-                    writer.writepair(pair)
+                writer.writepairs(self._data)
             state['_data'] = buf.getvalue()
             buf.close()
         else:
@@ -146,13 +169,17 @@ class WriteBucket(ReadBucket):
         dir: A string specifying the directory for writes.
         format: The class to be used for formatting writes.
         path: The local path of the written file.
+        sort_output: Whether the pairs are written in key-sorted order (which
+            is recorded in the url of the readonly copy).
     """
-    def __init__(self, source, split, dir=None, format=None, **kwds):
+    def __init__(self, source, split, dir=None, format=None,
+            sort_output=False, **kwds):
         super(WriteBucket, self).__init__(source, split, **kwds)
         self.dir = dir
         if format is None:
             format = fileformats.default_write_format
         self.format = format
+        self.sort_output = sort_output
 
         self._filename = None
         self._output_file = None
@@ -165,6 +192,9 @@ class WriteBucket(ReadBucket):
         b = ReadBucket(self.source, self.split, self.serializers)
         b._data = self._data
         b.url = self._filename
+        b.block_index = self.block_index
+        if self._filename and self.sort_output:
+            b.url = fileformats.join_url_options(b.url, {'sorted': ''})
         return b
 
     def open_writer(self):
@@ -185,6 +215,7 @@ class WriteBucket(ReadBucket):
         """Close the bucket for future writes."""
         if self._writer:
             self._writer.finish()
+            self.block_index = getattr(self._writer, 'blocks', None)
         # TODO: If the directory is an HDFS URL, upload the file here.
         if self._output_file:
             if do_sync:
@@ -216,12 +247,9 @@ class WriteBucket(ReadBucket):
             if not self._writer:
                 self.open_writer()
             if write_only:
-                for kvpair in pairiter:
-                    self._writer.writepair(kvpair)
+                self._writer.writepairs(pairiter)
             else:
-                for kvpair in pairiter:
-                    data.append(kvpair)
-                    self._writer.writepair(kvpair)
+                self._writer.writepairs(_appending(pairiter, data))
         elif not write_only:
             data.extend(pairiter)
 
@@ -238,6 +266,14 @@ class WriteBucket(ReadBucket):
             os.remove(self._filename)
 
 
+def _appending(pairiter, data):
+    """Yields pairs from the iterable while appending them to a list."""
+    append = data.append
+    for kvpair in pairiter:
+        append(kvpair)
+        yield kvpair
+
+
 class URLConverter(object):
     def __init__(self, addr, port, basedir):
         assert port is not None
@@ -248,14 +284,15 @@ class URLConverter(object):
 
     def local_to_global(self, path):
         """Creates a URL corresponding to the given path."""
+        path, options = fileformats.split_url_options(path)
         url_path = os.path.relpath(path, self.basedir)
         if url_path.startswith('..'):
             # Can't create a global URL because the file isn't in the HTTP dir.
-            return path
+            url = path
         else:
             url_components = ('http', self.netloc, url_path, None, None, None)
             url = urlunparse(url_components)
-            return url
+        return fileformats.join_url_options(url, options)
 
     def global_to_local(self, url, master):
         """Creates a locally accessible URL from the given URL.
@@ -271,10 +308,25 @@ class URLConverter(object):
             if result.port:
                 components[1] += ':%s' % result.port
             url = urlunparse(components)
-        elif (result.hostname == self.addr) and (result.port == self.port):
-            path = result.path.lstrip('/')
-            url = os.path.join(self.basedir, path)
+        else:
+            path = self.local_path(url)
+            if path is not None:
+                url = path
+                if result.fragment:
+                    url += '#' + result.fragment
         return url
 
+    def local_path(self, url):
+        """Returns the local path of a URL served by this bucket server.
+
+        Returns None if the URL is not served by this host's bucket server.
+        Any options in the URL's fragment are not included in the path.
+        """
+        result = urlparse(url)
+        if (result.scheme == 'http' and result.port == self.port and
+                (result.hostname or '') == self.addr):
+            return os.path.join(self.basedir, result.path.lstrip('/'))
+        return None
+
 
 # vim: et sw=4 sts=4
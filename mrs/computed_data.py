@@ -40,6 +40,9 @@ class ComputedData(datasets.RemoteData):
             the given percent of tasks are completed
         backlink: any uncompleted tasks from the given dataset will be
             "pulled forward" into place in the current dataset
+        salt_merge: whether the dataset only merges the values of keys that
+            were salted in the input, so that it can be skipped (passing the
+            input through) if the input tasks report that no keys were salted
 
     Attributes:
         task_class: the class used to carry out computation
@@ -47,7 +50,8 @@ class ComputedData(datasets.RemoteData):
         backlink_id: string id of the dataset backlinked to
     """
     def __init__(self, operation, input, splits, affinity=False,
-            blocking_ratio=1, backlink=None, async_start=False, **kwds):
+            blocking_ratio=1, backlink=None, async_start=False,
+            salt_merge=False, **kwds):
         # Create exactly one task for each split in the input.
         self.ntasks = input.splits
 
@@ -66,6 +70,7 @@ class ComputedData(datasets.RemoteData):
         self.affinity = affinity
         self.blocking_ratio = blocking_ratio
         self.async_start = async_start
+        self.salt_merge = salt_merge
         if backlink is None:
             self.backlink_id = None
         elif not isinstance(backlink, ComputedData):
@@ -14,26 +14,35 @@
 # limitations under the License.
 
 
-# TODO: add a Dataset for resplitting input (right now we assume that input
-# files are pre-split).
-
 import collections
 import heapq
-from itertools import chain
-from operator import itemgetter
+from itertools import chain, groupby, islice
+from operator import attrgetter, itemgetter
+import os
 import random
+import sys
 import tempfile
+import threading
 
 from . import bucket
 from . import fileformats
-from .serializers import (dumps_functions, loads_functions, raw_serializer,
-        Serializers)
+from .sortbuffer import SortBuffer, RECORD_OVERHEAD
+from .serializers import (dumps_functions, loads_functions,
+        loads_many_functions, raw_serializer, Serializers, is_ordered)
 from . import util
 
 from logging import getLogger
 logger = getLogger('mrs')
 
 DATASET_ID_LENGTH = 8
+# Approximate RAM used by a key-value tuple and its slot in a list.
+PAIR_OVERHEAD = sys.getsizeof((None, None)) + 8
+# Approximate RAM used by a dict entry and an empty list of values.
+TABLE_ENTRY_OVERHEAD = 100 + sys.getsizeof([])
+# Number of partitions written to disk when a hash table overflows.
+HASH_PARTITIONS = 16
+# Levels of partitioning after which a partition is grouped in RAM anyway.
+MAX_HASH_DEPTH = 3
 
 
 class BaseDataset(object):
@@ -250,7 +259,9 @@ class LocalData(BaseDataset):
     buckets will grow with the size of the iterator.
 
     Note that the `source`, which is just used for naming files, represents
-    which output source is being created.
+    which output source is being created.  If `sort_output` is True, the
+    iterator must produce pairs in key order, and the buckets record that
+    their data are sorted.
 
     >>> lst = [(4, 'to_0'), (5, 'to_1'), (7, 'to_3'), (9, 'to_1')]
     >>> o = LocalData(lst, splits=4, parter=(lambda x, n: x%n))
@@ -261,7 +272,7 @@ class LocalData(BaseDataset):
     >>>
     """
     def __init__(self, itr, splits=None, source=0, parter=None,
-            write_only=False, **kwds):
+            write_only=False, sort_output=False, **kwds):
         if parter is not None and splits is None:
             raise RuntimeError('The splits parameter is required when parter'
                     ' is specified.')
@@ -269,6 +280,7 @@ class LocalData(BaseDataset):
         super(LocalData, self).__init__(splits=splits, **kwds)
         self.id = 'local_' + self.id
         self.fixed_source = source
+        self.sort_output = sort_output
 
         self.collected = False
         self._collect(itr, parter, write_only)
@@ -280,7 +292,7 @@ class LocalData(BaseDataset):
         assert not self.collected
         assert source == self.fixed_source
         return bucket.WriteBucket(source, split, self.dir, self.format,
-                serializers=self.serializers)
+                sort_output=self.sort_output, serializers=self.serializers)
 
     def _collect(self, itr, parter, write_only):
         """Collect all of the key-value pairs from the given iterator."""
@@ -383,7 +395,7 @@ class RemoteData(BaseDataset):
             return self.data()
 
         buckets = [bucket for bucket in self[:, :] if bucket.url]
-        random.shuffle(buckets)
+        self._order_buckets(buckets)
         return self._stream_buckets(buckets, serializers)
 
     def stream_split(self, split, serializers=None, _called_in_runner=False):
@@ -392,9 +404,31 @@ class RemoteData(BaseDataset):
             return self.splitdata(split)
 
         buckets = [bucket for bucket in self[:, split] if bucket.url]
-        random.shuffle(buckets)
+        self._order_buckets(buckets)
         return self._stream_buckets(buckets, serializers)
 
+    def _order_buckets(self, buckets):
+        """Puts a list of buckets in the order in which they are streamed.
+
+        Buckets are shuffled so that tasks do not all fetch from the same
+        server at once.
+        """
+        random.shuffle(buckets)
+
+    def stream_merged_split(self, split, serializers=None,
+            _called_in_runner=False):
+        """Iterate in key order over a split whose buckets are each sorted.
+
+        The sorted streams from the buckets are merged without re-sorting.
+        """
+        self._assert_open(_called_in_runner)
+        if self._fetched:
+            streams = [iter(b) for b in self[:, split]]
+        else:
+            buckets = [bucket for bucket in self[:, split] if bucket.url]
+            streams = [b.stream(serializers) for b in buckets]
+        return merge_by_key(streams)
+
     def notify_urls_known(self):
         """Signify that all buckets have been assigned urls."""
         self._urls_known = True
@@ -404,12 +438,27 @@ class MergeSortData(BaseDataset):
     """A locally stored copy, sorted by key, of another dataset.
 
     If the dataset is small enough, it will be stored in RAM.  Otherwise,
-    it will be stored in local temporary files.
+    it will be stored in local temporary files.  Serialized pairs are held in
+    a compact `SortBuffer`, and `max_sort_size` limits the bytes actually
+    used by the buffers (including the memory needed to sort them).  Once
+    the data has spilled to disk, the limit is shared by two buffers so that
+    a full buffer can be sorted and written in a background thread while the
+    next one is filled.
+
+    If more than `merge_factor` sorted runs are spilled to disk, intermediate
+    merge passes combine them into larger runs until at most `merge_factor`
+    remain to be merged while streaming.
+
+    If a `combine` function is given, it is applied to each sorted run that
+    is written to disk, including runs from intermediate merge passes.  It
+    takes an iterator over key-sorted pairs and returns an iterator over
+    key-sorted pairs.
 
     Note that this class is very specific in its purpose and applicability.
     """
     def __init__(self, input, input_split, max_sort_size, splits=None,
-            source=None, parter=None, _called_in_runner=False, **kwds):
+            source=None, parter=None, merge_factor=None, combine=None,
+            _called_in_runner=False, **kwds):
         if parter is not None:
             raise RuntimeError('The parter paramater must not be specified')
         if source is not None:
@@ -422,9 +471,14 @@ class MergeSortData(BaseDataset):
         self.fixed_split = input_split
         self.serializers = input.serializers
         self.permanent = False
+        self._buffer = None
+        self._runs_written = 0
+        self.combine = combine
 
         self.collected = False
         self._collect(input, input_split, max_sort_size, _called_in_runner)
+        if merge_factor:
+            self._merge_runs(merge_factor)
         self.collected = True
 
     def _collect(self, input, input_split, max_sort_size, _called_in_runner):
@@ -434,68 +488,446 @@ class MergeSortData(BaseDataset):
                 raw_serializer, 'raw_serializer')
         max_ram_bytes = 1024 * 1024 * max_sort_size
 
+        # If raw keys sort in the same order as their values, sort and merge
+        # the raw bytes and only deserialize each key once (when streaming).
+        key_s = input.serializers.key_s if input.serializers else None
+        self.raw_sorted = (loads_key is None) or is_ordered(key_s)
+        if self.raw_sorted:
+            sort_keys = None
+        else:
+            # Keys are deserialized in batches as they are buffered.
+            sort_keys = loads_many_functions(input.serializers)[0]
+
+        # The first buffer may use the whole memory limit, so that data that
+        # fits in RAM is never spilled.  Once it spills, two buffers share the
+        # limit: while one is sorted and written by a background thread, the
+        # other is filled from the input.
+        buffer_bytes = max_ram_bytes
+        buf = SortBuffer(sort_keys)
+        spare_buf = SortBuffer(sort_keys)
+        flush = None
+
+        # The room left in the buffer is tracked with a cheap running
+        # estimate, and the exact size is only checked when it runs out.
+        room = buffer_bytes - buf.nbytes()
+        total_bytes = 0
+        try:
+            for raw_key, raw_value in input.stream_split(input_split,
+                    serializers=raw_serializers,
+                    _called_in_runner=_called_in_runner):
+                pair_bytes = len(raw_key) + len(raw_value)
+                total_bytes += pair_bytes
+                room -= pair_bytes + RECORD_OVERHEAD
+                if room < 0 and buf:
+                    room = (buffer_bytes - buf.nbytes() - pair_bytes -
+                            RECORD_OVERHEAD)
+                    if room < 0:
+                        if buffer_bytes == max_ram_bytes:
+                            buf.sort()
+                            self._flush_data(buf, raw_serializers,
+                                    input.serializers)
+                            buf.clear()
+                            buffer_bytes = max_ram_bytes // 2
+                        else:
+                            if flush is not None:
+                                self._finish_flush(flush)
+                            flush = self._start_flush(buf, raw_serializers,
+                                    input.serializers)
+                            buf, spare_buf = spare_buf, buf
+                        room = (buffer_bytes - buf.nbytes() - pair_bytes -
+                                RECORD_OVERHEAD)
+
+                buf.append(raw_key, raw_value)
+        except:
+            if flush is not None:
+                flush[0].join()
+            raise
+
+        if flush is not None:
+            self._finish_flush(flush)
+        buf.sort()
+        if self._data:
+            self._flush_data(buf, raw_serializers, input.serializers)
+        else:
+            self._buffer = buf
+
+        logger.debug('MergeSortData initialized %s bytes in %s buckets'
+                % (total_bytes, len(self._data)))
+
+    def _start_flush(self, buf, serializers, input_serializers):
+        """Sort and flush the given buffer in a background thread.
+
+        Returns a (thread, errors) pair to be passed to `_finish_flush`.  The
+        buffer is cleared once it has been written.
+        """
+        errors = []
+        def flush():
+            try:
+                buf.sort()
+                self._flush_data(buf, serializers, input_serializers)
+                buf.clear()
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=flush, name='Spill Thread')
+        thread.daemon = True
+        thread.start()
+        return thread, errors
+
+    def _finish_flush(self, flush):
+        """Wait for a background flush and reraise any exception from it."""
+        thread, errors = flush
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    def _flush_data(self, buf, serializers, input_serializers):
+        if not buf:
+            return
+        self._write_run(buf, serializers, input_serializers)
+
+    def _write_run(self, raw_itr, serializers, input_serializers):
+        """Write key-sorted raw pairs to a new run on disk.
+
+        If the dataset has a combiner, the pairs are deserialized, combined,
+        and serialized again.  Either way, the file holds pairs serialized
+        with the input serializers, and the bucket reads them back raw if
+        keys are sorted raw.
+        """
+        if self.combine is None:
+            b = bucket.WriteBucket(self._runs_written, self.fixed_split,
+                    self.dir, serializers=serializers)
+            b.collect(raw_itr, write_only=True)
+        else:
+            loads_key, loads_value = loads_functions(input_serializers)
+            pairs = _iter_loaded_groups(raw_itr, loads_key, loads_value)
+            b = bucket.WriteBucket(self._runs_written, self.fixed_split,
+                    self.dir, serializers=input_serializers)
+            b.collect(self.combine(pairs), write_only=True)
+        self._runs_written += 1
+        if self.raw_sorted:
+            b.serializers = serializers
+        else:
+            b.serializers = input_serializers
+        b.close_writer(False)
+        b = b.readonly_copy()
+        # A combiner could produce an empty run.
+        if b.url:
+            self._data[b.source, b.split] = b
+
+    def _merge_runs(self, merge_factor):
+        """Merge runs on disk until at most `merge_factor` runs remain.
+
+        The first pass merges just enough runs that every later pass,
+        including the final merge in `stream_data`, merges exactly
+        `merge_factor` runs.  Runs are merged oldest first, so that small
+        runs are merged before large ones, and merged runs are deleted.
+        """
+        merge_factor = max(merge_factor, 2)
+        runs = sorted(self[:, :], key=attrgetter('source'))
+        if len(runs) <= merge_factor:
+            return
+
+        raw_serializers = Serializers(raw_serializer, 'raw_serializer',
+                raw_serializer, 'raw_serializer')
+        if self.raw_sorted:
+            sort_key = None
+        else:
+            sort_key, _ = loads_functions(self.serializers)
+
+        remainder = (len(runs) - 1) % (merge_factor - 1)
+        count = remainder + 1 if remainder else merge_factor
+        passes = 0
+        while len(runs) > merge_factor:
+            group = runs[:count]
+            streams = [b.stream(raw_serializers) for b in group]
+            self._write_run(merge_by_key(streams, sort_key), raw_serializers,
+                    self.serializers)
+            for b in group:
+                del self._data[b.source, b.split]
+                os.remove(b.url)
+            runs = runs[count:]
+            merged_run = self._data.get((self._runs_written - 1,
+                self.fixed_split))
+            if merged_run is not None:
+                runs.append(merged_run)
+            count = merge_factor
+            passes += 1
+
+        logger.debug('MergeSortData merged runs in %s passes' % passes)
+
+    def delete(self):
+        super(MergeSortData, self).delete()
+        self._buffer = None
+
+    def stream_data(self, serializers=None, _called_in_runner=False):
+        """Iterate over data from all buckets in key-sorted order."""
+        if self._buffer is not None:
+            if not self.raw_sorted and serializers is None:
+                # Reuse the keys that were loaded to sort the buffer.
+                _, loads_value = loads_functions(self.serializers)
+                return _iter_loaded_values(self._buffer.loaded_pairs(),
+                        loads_value)
+            raw_itr = iter(self._buffer)
+        elif not self.raw_sorted:
+            streams = [b.stream(serializers) for b in self[:, :]]
+            return merge_by_key(streams)
+        else:
+            streams = [b.stream() for b in self[:, :]]
+            raw_itr = merge_by_key(streams)
+
+        if serializers is None:
+            serializers = self.serializers
+        loads_key, loads_value = loads_functions(serializers)
+        return _iter_loaded_groups(raw_itr, loads_key, loads_value)
+
+
+def _iter_loaded_groups(raw_itr, loads_key, loads_value):
+    """Deserialize key-sorted raw pairs, loading each distinct key once."""
+    for raw_key, group in groupby(raw_itr, key=itemgetter(0)):
+        key = raw_key if loads_key is None else loads_key(raw_key)
+        if loads_value is None:
+            for _, raw_value in group:
+                yield (key, raw_value)
+        else:
+            for _, raw_value in group:
+                yield (key, loads_value(raw_value))
+
+
+def _iter_loaded_values(pairs, loads_value):
+    """Deserialize the values of (key, raw_value) pairs."""
+    if loads_value is None:
+        return pairs
+    else:
+        return ((key, loads_value(raw_value)) for key, raw_value in pairs)
+
+
+class HashGroupData(BaseDataset):
+    """A locally grouped copy of a split of another dataset.
+
+    Pairs are grouped by key in a hash table of serialized values, whose
+    estimated size is limited to `max_sort_size` MB.  If the table overflows,
+    pairs are partitioned by a hash of the key into `HASH_PARTITIONS` buckets
+    in local temporary files.  The first partition stays in RAM for as long
+    as it fits, and each partition on disk is grouped recursively once the
+    input is exhausted (hybrid hash grouping).  After `MAX_HASH_DEPTH` levels
+    of partitioning, a partition is grouped in RAM regardless of its size.
+
+    Keys from an ordered serializer are grouped by their serialized bytes,
+    and other keys are deserialized for grouping (so they must be hashable).
+    Groups are produced in no particular order.
+    """
+    def __init__(self, input, input_split, max_sort_size,
+            _called_in_runner=False, **kwds):
+        super(HashGroupData, self).__init__(**kwds)
+        self.id = 'hashgroup_' + self.id
+        self.fixed_split = input_split
+        self.serializers = input.serializers
+        self.permanent = False
+        if max_sort_size:
+            self._max_ram_bytes = 1024 * 1024 * max_sort_size
+        else:
+            self._max_ram_bytes = None
+        self._partitions_written = 0
+
+        self._raw_serializers = Serializers(raw_serializer, 'raw_serializer',
+                raw_serializer, 'raw_serializer')
+        self._loads_key, self._loads_value = loads_functions(input.serializers)
+        key_s = input.serializers.key_s if input.serializers else None
+        self._group_by_raw_key = (self._loads_key is None) or is_ordered(key_s)
+
+        self._raw_itr = input.stream_split(input_split,
+                serializers=self._raw_serializers,
+                _called_in_runner=_called_in_runner)
+
+    def stream_groups(self):
+        """Iterate over (key, values) pairs, one for each distinct key.
+
+        The values are an iterator over the deserialized values for the key.
+        """
+        return self._group(self._raw_itr, 0)
+
+    def _group(self, raw_itr, depth):
+        getsizeof = sys.getsizeof
+        if depth < MAX_HASH_DEPTH:
+            max_ram_bytes = self._max_ram_bytes
+        else:
+            max_ram_bytes = None
+
+        table = {}
+        partitions = None
+        # Whether the first partition is still held in the table.
+        resident = True
+        current_bytes = 0
+        for raw_key, raw_value in raw_itr:
+            key = self._table_key(raw_key)
+            if partitions is not None:
+                p = hash((depth, key)) % HASH_PARTITIONS
+                if p or not resident:
+                    partitions[p].addpair((raw_key, raw_value),
+                            write_only=True)
+                    continue
+
+            try:
+                entry = table[key]
+            except KeyError:
+                entry = table[key] = [raw_key]
+                current_bytes += self._entry_overhead(key, raw_key)
+            entry.append(raw_value)
+            current_bytes += getsizeof(raw_value) + 8
+
+            if max_ram_bytes and current_bytes > max_ram_bytes:
+                if partitions is None:
+                    partitions = self._make_partitions()
+                    current_bytes = self._evict(table, partitions, depth,
+                            keep_first=True)
+                else:
+                    self._evict(table, partitions, depth, keep_first=False)
+                    resident = False
+                    current_bytes = 0
+
+        if (depth >= MAX_HASH_DEPTH and self._max_ram_bytes and
+                current_bytes > self._max_ram_bytes):
+            logger.warning('Grouping %s bytes in RAM after %s levels of hash'
+                    ' partitioning (too many values for a key?)'
+                    % (current_bytes, depth))
+
+        while table:
+            key, entry = table.popitem()
+            yield self._make_group(key, entry)
+
+        if partitions is not None:
+            for b in partitions:
+                b.close_writer(False)
+                readonly_copy = b.readonly_copy()
+                if readonly_copy.url:
+                    stream = readonly_copy.stream(self._raw_serializers)
+                    for group in self._group(stream, depth + 1):
+                        yield group
+                b.clean()
+
+    def _table_key(self, raw_key):
+        if self._group_by_raw_key:
+            return raw_key
+        else:
+            return self._loads_key(raw_key)
+
+    def _entry_overhead(self, key, raw_key):
+        overhead = TABLE_ENTRY_OVERHEAD + sys.getsizeof(raw_key)
+        if not self._group_by_raw_key:
+            overhead += sys.getsizeof(key)
+        return overhead
+
+    def _make_partitions(self):
+        partitions = []
+        for _ in range(HASH_PARTITIONS):
+            b = bucket.WriteBucket(self._partitions_written, self.fixed_split,
+                    self.dir, serializers=self._raw_serializers)
+            self._partitions_written += 1
+            partitions.append(b)
+        return partitions
+
+    def _evict(self, table, partitions, depth, keep_first):
+        """Move table entries to their partitions on disk.
+
+        If `keep_first` is True, entries in the first partition are kept.
+        Returns the estimated size of the remaining table.
+        """
+        getsizeof = sys.getsizeof
+        remaining_bytes = 0
+        for key in list(table):
+            p = hash((depth, key)) % HASH_PARTITIONS
+            entry = table[key]
+            raw_key = entry[0]
+            if keep_first and p == 0:
+                remaining_bytes += self._entry_overhead(key, raw_key)
+                remaining_bytes += sum(getsizeof(raw_value) + 8
+                        for raw_value in islice(entry, 1, None))
+                continue
+            del table[key]
+            b = partitions[p]
+            for raw_value in islice(entry, 1, None):
+                b.addpair((raw_key, raw_value), write_only=True)
+        return remaining_bytes
+
+    def _make_group(self, key, entry):
+        if self._group_by_raw_key and self._loads_key is not None:
+            key = self._loads_key(key)
+        raw_values = islice(entry, 1, None)
+        loads_value = self._loads_value
+        if loads_value is None:
+            return key, raw_values
+        else:
+            return key, (loads_value(raw_value) for raw_value in raw_values)
+
+
+class SpillSortData(BaseDataset):
+    """A locally stored copy, sorted by key, of the output of an iterator.
+
+    Key-value pairs are buffered in RAM until the buffer exceeds the given
+    `max_sort_size` (in MB).  Each full buffer is sorted, passed through the
+    optional `combine` function, and spilled to a local temporary file.  The
+    spilled runs are merged (and combined again) when the data are streamed.
+    If the data fit in a single buffer, they are never written to disk.
+
+    The `combine` function takes an iterator over key-sorted pairs and returns
+    an iterator over key-sorted pairs.  The size of each pair is estimated
+    from the in-memory size of the key and value objects.
+    """
+    def __init__(self, itr, max_sort_size, combine=None, **kwds):
+        super(SpillSortData, self).__init__(**kwds)
+        self.id = 'spillsort_' + self.id
+        self.permanent = False
+        self.combine = combine
+
+        self.collected = False
+        self._collect(itr, max_sort_size)
+        self.collected = True
+
+    def _collect(self, itr, max_sort_size):
+        assert not self.collected
+        max_ram_bytes = 1024 * 1024 * max_sort_size
+        getsizeof = sys.getsizeof
+
         current_bytes = 0
         total_bytes = 0
         data_list = []
-        for raw_key, raw_value in input.stream_split(input_split,
-                serializers=raw_serializers,
-                _called_in_runner=_called_in_runner):
-            pair_bytes = len(raw_key) + len(raw_value)
-            if current_bytes + pair_bytes > max_ram_bytes:
-                data_list.sort(key=itemgetter(0))
-                self._flush_data(data_list, raw_serializers, input.serializers)
-                data_list = []
+        for kvpair in itr:
+            key, value = kvpair
+            pair_bytes = PAIR_OVERHEAD + getsizeof(key) + getsizeof(value)
+            if data_list and current_bytes + pair_bytes > max_ram_bytes:
+                self._flush_data(data_list)
                 current_bytes = 0
 
-            if loads_key is None:
-                data_list.append((raw_key, raw_value))
-            else:
-                key = loads_key(raw_key)
-                data_list.append((key, raw_key, raw_value))
+            data_list.append(kvpair)
             current_bytes += pair_bytes
             total_bytes += pair_bytes
 
         if self._data:
-            data_list.sort(key=itemgetter(0))
-            self._flush_data(data_list, raw_serializers, input.serializers)
+            self._flush_data(data_list)
         else:
             data_list.sort(key=itemgetter(0))
-            b = bucket.WriteBucket(0, self.fixed_split)
-            data_itr = self._iter_deserialized(data_list, loads_key,
-                    loads_value)
-            b.collect(data_itr)
+            b = bucket.WriteBucket(0, 0, serializers=self.serializers)
+            b.collect(self._combined(data_list))
             self._append_bucket(b)
 
-        logger.debug('MergeSortData initialized %s bytes in %s buckets'
+        logger.debug('SpillSortData initialized %s bytes in %s buckets'
                 % (total_bytes, len(self._data)))
 
-    def _iter_deserialized(self, data_list, loads_key, loads_value):
-        """Iterate over the deserialized key-value pairs of the data list."""
-        if loads_key is None and loads_value is None:
-            return data_list
-        elif loads_key is None:
-            return ((k, loads_value(raw_v)) for (k, raw_v) in data_list)
-        elif loads_value is None:
-            return ((k, raw_v) for (k, _, raw_v) in data_list)
-        else:
-            return ((k, loads_value(raw_v)) for (k, _, raw_v) in data_list)
-
-    def _iter_serialized(self, data_list, loads_key):
-        """Iterate over the deserialized key-value pairs of the data list."""
-        if loads_key is None:
-            return data_list
+    def _combined(self, sorted_itr):
+        """Iterate over the (combined) pairs of a key-sorted iterator."""
+        if self.combine is None:
+            return iter(sorted_itr)
         else:
-            return ((raw_k, raw_v) for (k, raw_k, raw_v) in data_list)
+            return self.combine(sorted_itr)
 
-    def _flush_data(self, data_list, serializers, input_serializers):
+    def _flush_data(self, data_list):
         if not data_list:
             return
-        b = bucket.WriteBucket(len(self._data), self.fixed_split,
-                self.dir, serializers=serializers)
-        loads_key, _ = loads_functions(input_serializers)
-        data_itr = self._iter_serialized(data_list, loads_key)
-        b.collect(data_itr, write_only=True)
-        b.serializers = input_serializers
+        data_list.sort(key=itemgetter(0))
+        b = bucket.WriteBucket(len(self._data), 0, self.dir,
+                serializers=self.serializers)
+        b.collect(self._combined(data_list), write_only=True)
         b.close_writer(False)
         self._append_bucket(b)
         del data_list[:]
@@ -504,10 +936,35 @@ class MergeSortData(BaseDataset):
         b = b.readonly_copy()
         self._data[b.source, b.split] = b
 
-    def stream_data(self, serializers=None, _called_in_runner=False):
+    def stream_data(self, _called_in_runner=False):
         """Iterate over data from all buckets in key-sorted order."""
-        streams = [b.stream(serializers) for b in self[:, :]]
-        return heapq.merge(*streams)
+        buckets = list(self[:, :])
+        if len(buckets) == 1 and buckets[0].url is None:
+            return iter(buckets[0])
+        streams = [b.stream() for b in buckets]
+        return self._combined(merge_by_key(streams))
+
+
+def merge_by_key(streams, key=None):
+    """Merge key-sorted streams of key-value pairs into a single stream.
+
+    Unlike a plain `heapq.merge`, values are never compared, so they do not
+    need to be orderable.  Pairs with equal keys are yielded in stream order.
+    If a `key` function is given, the streams are sorted by the result of
+    calling it on each key.
+    """
+    decorated = [_decorate_stream(stream, i, key)
+            for i, stream in enumerate(streams)]
+    return (kvpair for _, _, kvpair in heapq.merge(*decorated))
+
+
+def _decorate_stream(stream, index, key=None):
+    if key is None:
+        for kvpair in stream:
+            yield (kvpair[0], index, kvpair)
+    else:
+        for kvpair in stream:
+            yield (key(kvpair[0]), index, kvpair)
 
 
 class FileData(RemoteData):
@@ -515,7 +972,15 @@ class FileData(RemoteData):
 
     By default, all of the files come from a single source, with one split for
     each file.  If a split is given, then the dataset will have enough sources
-    to evenly divide the files.
+    to evenly divide the files.  If a `split_size` (in bytes) is given, then
+    each large text file is divided into byte ranges of about that size (see
+    `fileformats.byte_range_urls`), and each range is a separate split.
+
+    If a `pack_size` (in bytes) is given, then consecutive files (or ranges)
+    are packed into splits with about `pack_size` bytes each, with one source
+    for each file in a split, so that a task reads all of its files in
+    sequence.  The key of each line is then a (file_index, line) pair, where
+    file_index is the position of the file in `urls`.
 
     >>> urls = ['http://aml.cs.byu.edu/', 'LICENSE']
     >>> data = FileData(urls)
@@ -532,24 +997,71 @@ class FileData(RemoteData):
     >>>
     """
     def __init__(self, urls, sources=None, splits=None,
-            first_source=0, first_split=0, **kwds):
-        n = len(urls)
-
-        if splits is None:
-            if sources is None:
-                # Nothing specified, so we assume one split per url
-                splits = n
-            else:
-                splits = first_split + n // sources
+            first_source=0, first_split=0, split_size=None, pack_size=None,
+            **kwds):
+        if pack_size:
+            urls = [fileformats.join_url_options(url, {'file': str(i)})
+                    for i, url in enumerate(urls)]
+        if split_size:
+            urls = list(chain.from_iterable(
+                fileformats.byte_range_urls(url, split_size) for url in urls))
+        if pack_size:
+            packs = pack_urls(urls, pack_size)
+            splits = len(packs)
+            locations = [(first_source + j, first_split + i, url)
+                    for i, pack in enumerate(packs)
+                    for j, url in enumerate(pack)]
+        else:
+            n = len(urls)
+            if splits is None:
+                if sources is None:
+                    # Nothing specified, so we assume one split per url
+                    splits = n
+                else:
+                    splits = first_split + n // sources
+            locations = [(first_source + i // splits,
+                first_split + i % splits, url) for i, url in enumerate(urls)]
 
         super(FileData, self).__init__(splits=splits, **kwds)
-        for i, url in enumerate(urls):
+        for source, split, url in locations:
             if url:
-                source = first_source + i // splits
-                split = first_split + i % splits
                 bucket = self[source, split]
                 bucket.url = url
         self._urls_known = True
+        # Packed files (which have a file index) are read in sequence.
+        self._packed = any('file' in fileformats.split_url_options(url)[1]
+                for _, _, url in locations if url)
+
+    def _order_buckets(self, buckets):
+        if self._packed:
+            buckets.sort(key=attrgetter('source'))
+        else:
+            super(FileData, self)._order_buckets(buckets)
+
+
+def pack_urls(urls, pack_size):
+    """Groups consecutive urls into lists with about `pack_size` bytes each.
+
+    A url whose size is unknown is put in a list by itself.
+    """
+    packs = []
+    pack = []
+    pack_bytes = 0
+    for url in urls:
+        size = fileformats.url_range_size(url)
+        if pack and (size is None or pack_bytes + size > pack_size):
+            packs.append(pack)
+            pack = []
+            pack_bytes = 0
+        pack.append(url)
+        if size is None:
+            packs.append(pack)
+            pack = []
+        else:
+            pack_bytes += size
+    if pack:
+        packs.append(pack)
+    return packs
 
 
 def test():
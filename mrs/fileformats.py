@@ -15,35 +15,91 @@
 
 from __future__ import division, print_function
 
+import bz2
 import codecs
+from collections import namedtuple
 import gzip
 from itertools import islice
+import mmap
+from operator import itemgetter, methodcaller
 import os
 import struct
 import sys
+import threading
+import zlib
 
 PY3 = sys.version_info[0] == 3
 if PY3:
     from urllib.parse import urlparse
-    from urllib.request import urlopen, URLopener
+    from urllib.request import urlopen, URLopener, Request
     import io
+    import queue
 else:
     from urlparse import urlparse
     from urllib import URLopener
-    from urllib2 import urlopen
+    from urllib2 import urlopen, Request
+    import Queue as queue
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
 
 from . import hdfs
-from .serializers import dumps_functions, loads_functions
+from .serializers import (dumps_functions, loads_functions,
+        dumps_many_functions, loads_many_functions, infer_schema,
+        schema_serializer, SchemaError)
 
 
 DEFAULT_BUFFER_SIZE = 4096
+# Size of each read by binary readers (which buffer many records at once).
+READ_BUFFER_SIZE = 1024 * 1024
+# Size of the blocks of records that binary writers write at once.
+WRITE_BUFFER_SIZE = 1024 * 1024
+# Number of records whose keys and values binary readers and writers convert
+# with each call to a bulk serializer function.
+BULK_RECORDS = 1000
 # 1 is fast and unaggressive, 9 is slow and aggressive
 COMPRESS_LEVEL = 9
 
+# Maps urls of this host's bucket server to local paths (see
+# `set_url_converter`).
+URL_CONVERTER = None
+# Names of the Mrs options that may appear in a url's fragment (see
+# `split_url_options`).
+URL_OPTIONS = frozenset(['end', 'file', 'sorted', 'start'])
+
+# Whether binary writers without serializers infer them (see
+# `set_auto_serializers`), and the number of pairs they examine first.
+AUTO_SERIALIZERS = False
+AUTO_SAMPLE_RECORDS = 100
+
+# Defaults for block-compressed files (see `set_block_defaults`).
+BLOCK_CODEC = 'zlib'
+BLOCK_COMPRESS_LEVEL = 1
+BLOCK_SIZE = 256 * 1024
+# Number of decompressed blocks that a reader may hold ahead of its consumer.
+BLOCK_PREFETCH = 2
+
 hex_encoder = codecs.getencoder('hex_codec')
 hex_decoder = codecs.getdecoder('hex_codec')
 
 len_struct = struct.Struct('<I')
+# A key length that marks a control record in the binary formats.  The value
+# of a control record gives the schemas of the keys and values that follow.
+CONTROL_LENGTH = 0xFFFFFFFF
+# Codec id, uncompressed length, and compressed length of a block.
+block_header_struct = struct.Struct('<BII')
+# The codec id of the block that holds the index of a block-compressed file.
+INDEX_CODEC_ID = 0
+# Offset, record count, uncompressed size, and compressed size of a block.
+index_entry_struct = struct.Struct('<QIII')
+# Offset of the index block, followed by INDEX_SENTINEL.
+index_trailer_struct = struct.Struct('<Q4s')
+INDEX_SENTINEL = b'MrsI'
+
+BlockInfo = namedtuple('BlockInfo', ('offset', 'records', 'raw_size', 'size',
+        'min_key', 'max_key'))
 
 
 class Writer(object):
@@ -68,6 +124,12 @@ class Writer(object):
     def writepair(self, kvpair, **kwds):
         raise NotImplementedError
 
+    def writepairs(self, kvpairs):
+        """Write all key-value pairs from the given iterable."""
+        writepair = self.writepair
+        for kvpair in kvpairs:
+            writepair(kvpair)
+
     def finish(self):
         """Flush the file object, which may be a buffering wrapper."""
         self.fileobj.flush()
@@ -94,6 +156,9 @@ class Reader(object):
             None, use pickle.  Otherwise, use its `dumps` function.  A `dumps`
             function set to None indicates that the keys are already bytes.
     """
+    # Whether the reader can read a byte range of a file (see `open_url`).
+    splittable = False
+
     def __init__(self, fileobj, serializers=None):
         self.fileobj = fileobj
         self.loads_key, self.loads_value = loads_functions(serializers)
@@ -118,47 +183,285 @@ class LineReader(Reader):
     line contents (as a string).  The input file is assumed to be encoded in
     UTF-8, and the error mode is 'replace' (invalid characters are replaced
     with u'\ufffd').
+
+    If a `start` offset is given, the file object is positioned at that byte
+    of the file, and only lines that start in the range from `start` to `end`
+    are read (see `line_range`).  Each key is then the byte offset of the line
+    instead of its line number.  If a `file_index` is given, each key is a
+    pair of the file index and the line number (or offset), so that keys are
+    unique across the files of a task.
+
+    Whether or not a range is given, lines end at '\n', '\r\n', or '\r',
+    and each line ending is translated to '\n' (as in universal newlines
+    mode).
     """
+    splittable = True
+
     def __init__(self, fileobj, *args, **kwds):
-        if PY3:
+        self.start = kwds.pop('start', None)
+        self.end = kwds.pop('end', None)
+        self.file_index = kwds.pop('file_index', None)
+        if PY3 and self.start is None:
             fileobj = io.TextIOWrapper(fileobj, encoding='utf-8',
                     errors='replace')
         super(LineReader, self).__init__(fileobj, *args, **kwds)
 
-    if PY3:
-        def __iter__(self):
-            """Iterate over key-value pairs.
+    def __iter__(self):
+        """Iterate over key-value pairs.
 
-            Inheriting classes will almost certainly override this method.
-            """
+        Inheriting classes will almost certainly override this method.
+        """
+        if self.start is None:
+            pairs = self._iter_lines()
+        else:
+            pairs = self._iter_range()
+        if self.file_index is None:
+            return pairs
+        else:
+            return _indexed_keys(self.file_index, pairs)
+
+    if PY3:
+        def _iter_lines(self):
             return enumerate(self.fileobj)
     else:
-        def __iter__(self):
-            """Iterate over key-value pairs.
+        def _iter_lines(self):
+            lines = (text for line in self.fileobj
+                    for _, text in _universal_lines(line))
+            return enumerate(lines)
+
+    def _iter_range(self):
+        for offset, line in line_range(self.fileobj, self.start, self.end):
+            for size, text in _universal_lines(line):
+                yield offset, text
+                offset += size
 
-            Inheriting classes will almost certainly override this method.
-            """
-            for i, s in enumerate(self.fileobj):
-                yield i, s.decode('utf-8', 'replace')
+
+def _universal_lines(line):
+    """Iterates over (size, text) pairs for the lines in a line of bytes.
+
+    The bytes are split at '\r' and '\r\n' as well as '\n', and each line is
+    decoded from UTF-8 with its line ending translated to '\n'.  The size is
+    the number of bytes in the line (including its original line ending).
+    """
+    if b'\r' not in line:
+        yield len(line), line.decode('utf-8', 'replace')
+        return
+    for part in line.splitlines(True):
+        text = part.decode('utf-8', 'replace')
+        if text.endswith(u'\r\n'):
+            text = text[:-2] + u'\n'
+        elif text.endswith(u'\r'):
+            text = text[:-1] + u'\n'
+        yield len(part), text
 
 
 class BytesLineReader(Reader):
     """Reads key-value pairs from a file object.
 
     In this basic reader, the key-value pair is composed of a line number
-    and line contents (as a bytes object).
+    and line contents (as a bytes object).  The `start`, `end`, and
+    `file_index` arguments are as in LineReader.
     """
+    splittable = True
+
+    def __init__(self, fileobj, *args, **kwds):
+        self.start = kwds.pop('start', None)
+        self.end = kwds.pop('end', None)
+        self.file_index = kwds.pop('file_index', None)
+        super(BytesLineReader, self).__init__(fileobj, *args, **kwds)
+
     def __iter__(self):
         """Iterate over key-value pairs.
 
         Inheriting classes will almost certainly override this method.
         """
-        return enumerate(self.fileobj)
+        if self.start is None:
+            pairs = enumerate(self.fileobj)
+        else:
+            pairs = line_range(self.fileobj, self.start, self.end)
+        if self.file_index is None:
+            return pairs
+        else:
+            return _indexed_keys(self.file_index, pairs)
+
 
+def _indexed_keys(file_index, pairs):
+    """Replaces each key with a (file_index, key) pair."""
+    for key, value in pairs:
+        yield (file_index, key), value
+
+
+def line_range(fileobj, start, end=None):
+    """Iterates over (offset, line) pairs for the lines in a byte range.
+
+    The file object must be positioned at byte `start` of the file.  A line
+    belongs to the range if its first byte is in the range from `start` to
+    `end` (inclusive), except that the partial line at a nonzero `start` is
+    skipped.  The last line is read past `end` until it is complete.  Thus if
+    a file is divided into ranges where each range's `start` is the previous
+    range's `end`, each line is read from exactly one range.
+    """
+    pos = start
+    if start > 0:
+        pos += len(fileobj.readline())
+    while end is None or pos <= end:
+        line = fileobj.readline()
+        if not line:
+            break
+        yield pos, line
+        pos += len(line)
+
+
+class DelimitedReader(Reader):
+    """Reads key-value pairs from the fields of delimited lines (e.g., TSV).
+
+    The file is read in large blocks, which are split into lines and fields
+    as bytes.  Each of `key_field` and `value_field` is the index of a field,
+    a tuple of indices (giving a tuple of fields), or None.  If the
+    `key_field` is None, the key is the line number, and if the
+    `value_field` is None, the value is the whole line.  If `maxsplit` is
+    nonnegative, each line is split into at most maxsplit + 1 fields.  Fields
+    may not contain the delimiter or newlines (quoting is not supported).
+
+    Fields are bytes unless serializers or an `encoding` are given.  A
+    serializer's `loads` function converts each key field or value field from
+    bytes; otherwise fields are decoded with the encoding (if any).  Since
+    only the selected fields are converted, unused fields are never decoded.
+
+    If `start` and `end` are given, they are as in `LineReader`, and a key
+    that would be a line number is instead the byte offset of the line.  If
+    a `file_index` is given and the key is a line number (or offset), it is
+    a (file_index, line) pair as in `LineReader`.
+    """
+    delimiter = b'\t'
+    maxsplit = -1
+    key_field = 0
+    value_field = 1
+    encoding = None
+    splittable = True
+
+    def __init__(self, fileobj, serializers=None, **kwds):
+        self.start = kwds.pop('start', None)
+        self.end = kwds.pop('end', None)
+        self.file_index = kwds.pop('file_index', None)
+        for attr in ('delimiter', 'maxsplit', 'key_field', 'value_field',
+                'encoding'):
+            if attr in kwds:
+                setattr(self, attr, kwds.pop(attr))
+        super(DelimitedReader, self).__init__(fileobj, serializers, **kwds)
+        if self.encoding is None:
+            decode = None
+        else:
+            decode = methodcaller('decode', self.encoding)
+        if serializers is None or serializers.key_s is None:
+            self.loads_key = decode
+        if serializers is None or serializers.value_s is None:
+            self.loads_value = decode
+
+    def __iter__(self):
+        """Iterate over key-value pairs."""
+        pairs = self._iter_fields()
+        if self.key_field is None and self.file_index is not None:
+            return _indexed_keys(self.file_index, pairs)
+        else:
+            return pairs
+
+    def _iter_fields(self):
+        delimiter = self.delimiter
+        maxsplit = self.maxsplit
+        get_key, loads_key = _field_getter(self.key_field, self.loads_key)
+        if get_key is None:
+            # Line numbers are not converted.
+            loads_key = None
+        get_value, loads_value = _field_getter(self.value_field,
+                self.loads_value)
+        for linenos, lines in self._line_blocks():
+            for lineno, line in zip(linenos, lines):
+                if not line:
+                    continue
+                fields = line.split(delimiter, maxsplit)
+                try:
+                    key = lineno if get_key is None else get_key(fields)
+                    value = line if get_value is None else get_value(fields)
+                except IndexError:
+                    raise RuntimeError('Line %s has too few fields' % lineno)
+                if loads_key is not None:
+                    key = loads_key(key)
+                if loads_value is not None:
+                    value = loads_value(value)
+                yield key, value
+
+    def _line_blocks(self):
+        """Iterates over (line numbers, lines) pairs for blocks of lines.
+
+        Lines are given without line endings.  In a byte range, each line is
+        numbered by its byte offset (as in `LineReader`), so that numbers are
+        unique across the ranges of a file.
+        """
+        if self.start is not None:
+            for offset, line in line_range(self.fileobj, self.start,
+                    self.end):
+                yield (offset,), (line.rstrip(b'\r\n'),)
+            return
+
+        read = self.fileobj.read
+        partial = b''
+        lineno = 0
+        while True:
+            data = read(READ_BUFFER_SIZE)
+            if not data:
+                break
+            # A '\r\n' may straddle two reads, so lines are stripped after
+            # the partial line is joined to the new data.
+            data = partial + data
+            lines = data.split(b'\n')
+            partial = lines.pop()
+            if b'\r' in data:
+                lines = [line.rstrip(b'\r') for line in lines]
+            yield range(lineno, lineno + len(lines)), lines
+            lineno += len(lines)
+        if partial:
+            yield (lineno,), (partial.rstrip(b'\r'),)
+
+
+class CSVReader(DelimitedReader):
+    """Reads key-value pairs from the fields of comma-separated lines."""
+    delimiter = b','
+
+
+class TextReader(DelimitedReader):
+    """Reads key-value pairs in the format written by TextWriter.
+
+    The key is the text before the first space, and the value is the rest of
+    the line (both are strings).
+    """
+    delimiter = b' '
+    maxsplit = 1
+    encoding = 'utf-8'
+
+
+def _field_getter(field, loads):
+    """Returns functions to get a key or value from the fields of a line.
+
+    The first function takes the list of fields (it is None if the field is
+    None), and the second converts the result (it is None if no conversion
+    is needed).
+    """
+    if field is None:
+        return None, loads
+    elif isinstance(field, tuple):
+        if len(field) == 1:
+            i = field[0]
+            get = lambda fields: (fields[i],)
+        else:
+            get = itemgetter(*field)
+        if loads is None:
+            return get, None
+        else:
+            return get, lambda values: tuple(map(loads, values))
+    else:
+        return itemgetter(field), loads
 
-# TODO: implement TextReader
-# class TextReader(LineReader) should read lines and do:
-# key, value = line.split(None, 1)
 
 class TextWriter(Writer):
     """A basic line-oriented format, primarily for user interaction.
@@ -191,6 +494,75 @@ class TextWriter(Writer):
             write('\n')
 
 
+class DelimitedWriter(Writer):
+    """Writes key-value pairs as delimited lines (e.g., TSV).
+
+    A key or value that is a tuple or list is written as several fields.
+    Fields are converted to bytes with the serializers' `dumps` functions if
+    serializers are given.  Otherwise, bytes are written unchanged and other
+    objects are converted to strings and encoded with UTF-8.  The output can
+    be read with a DelimitedReader with the same delimiter.
+    """
+    ext = 'tsv'
+    delimiter = b'\t'
+
+    def __init__(self, fileobj, serializers=None, **kwds):
+        if 'delimiter' in kwds:
+            self.delimiter = kwds.pop('delimiter')
+        super(DelimitedWriter, self).__init__(fileobj, serializers, **kwds)
+        if serializers is None or serializers.key_s is None:
+            self.dumps_key = _text_bytes
+        if serializers is None or serializers.value_s is None:
+            self.dumps_value = _text_bytes
+
+    def writepair(self, kvpair, **kwds):
+        """Write a key-value pair."""
+        self.fileobj.write(self._format_line(kvpair))
+
+    def writepairs(self, kvpairs):
+        """Write all key-value pairs from the given iterable."""
+        format_line = self._format_line
+        write = self.fileobj.write
+        kvpairs = iter(kvpairs)
+        while True:
+            lines = [format_line(kvpair) for kvpair in islice(kvpairs, 1000)]
+            if not lines:
+                break
+            write(b''.join(lines))
+
+    def _format_line(self, kvpair):
+        key, value = kvpair
+        dumps_key = self.dumps_key
+        dumps_value = self.dumps_value
+        if isinstance(key, (tuple, list)):
+            fields = [dumps_key(x) for x in key]
+        else:
+            fields = [dumps_key(key)]
+        if isinstance(value, (tuple, list)):
+            fields.extend(dumps_value(x) for x in value)
+        else:
+            fields.append(dumps_value(value))
+        return self.delimiter.join(fields) + b'\n'
+
+
+class CSVWriter(DelimitedWriter):
+    """Writes key-value pairs as comma-separated lines."""
+    ext = 'csv'
+    delimiter = b','
+
+
+if PY3:
+    def _text_bytes(x):
+        if isinstance(x, bytes):
+            return x
+        return str(x).encode('utf-8')
+else:
+    def _text_bytes(x):
+        if isinstance(x, str):
+            return x
+        return unicode(x).encode('utf-8')
+
+
 class HexReader(Reader):
     """A key-value store using ASCII hexadecimal encoding"""
 
@@ -239,88 +611,359 @@ class BinWriter(Writer):
     By default, the given file will be closed when the writer is closed,
     but the close argument makes this configurable.  Setting close to False
     is useful for StringIO/BytesIO.
+
+    Records are framed into an in-memory block, which is written to the file
+    whenever it reaches `buffer_size` bytes (and when the writer finishes).
+    The `writepairs` method serializes keys and values in bulk (see
+    `serializers.dumps_many_functions`).
+
+    If `auto_serializers` is True (by default, see `set_auto_serializers`)
+    and the keys or values have no serializer (so they would be pickled),
+    the first AUTO_SAMPLE_RECORDS pairs are held back, and any schema shared
+    by all of their keys or values (see `serializers.infer_schema`) is
+    recorded in a control record and used instead of pickle.  If a later key
+    or value does not match, a second control record switches the rest of
+    the file back to pickle.
     """
     ext = 'mrsb'
     magic = b'MrsB'
-
-    def __init__(self, fileobj, *args, **kwds):
-        super(BinWriter, self).__init__(fileobj, *args, **kwds)
-        self.fileobj.write(self.magic)
+    # Whether keys (not just values) may be encoded with an inferred schema.
+    auto_keys = True
+
+    def __init__(self, fileobj, serializers=None, **kwds):
+        self.buffer_size = kwds.pop('buffer_size', WRITE_BUFFER_SIZE)
+        auto = kwds.pop('auto_serializers', None)
+        super(BinWriter, self).__init__(fileobj, serializers, **kwds)
+        self.dumps_keys, self.dumps_values = dumps_many_functions(serializers)
+        self._block = bytearray(self.magic)
+        if auto is None:
+            auto = AUTO_SERIALIZERS
+        key_s, value_s = (None, None) if serializers is None else (
+                serializers.key_s, serializers.value_s)
+        self._auto_key = auto and self.auto_keys and key_s is None
+        self._auto_value = auto and value_s is None
+        self._default_dumps = (self.dumps_key, self.dumps_value,
+                self.dumps_keys, self.dumps_values)
+        # Pairs held back until serializers are inferred (or None).
+        if self._auto_key or self._auto_value:
+            self._sample = []
+        else:
+            self._sample = None
+        self._schema_keys = False
 
     def writepair(self, kvpair, serialized_key=None):
         """Write a key-value pair."""
-        key, value = kvpair
-        if serialized_key is not None:
-            key = serialized_key
-        elif self.dumps_key is not None:
-            key = self.dumps_key(key)
-        if self.dumps_value is not None:
-            value = self.dumps_value(value)
-        write = self.fileobj.write
+        if self._sample is not None:
+            self._sample.append(kvpair)
+            if len(self._sample) >= AUTO_SAMPLE_RECORDS:
+                self._infer_serializers()
+            return
 
-        binlen = len_struct.pack(len(key))
-        write(binlen)
-        write(key)
+        key, value = kvpair
+        try:
+            if serialized_key is not None and not self._schema_keys:
+                key = serialized_key
+            elif self.dumps_key is not None:
+                key = self.dumps_key(key)
+            if self.dumps_value is not None:
+                value = self.dumps_value(value)
+        except SchemaError:
+            self._set_schemas(None, None)
+            return self.writepair(kvpair, serialized_key)
+
+        block = self._block
+        block += len_struct.pack(len(key))
+        block += key
+        block += len_struct.pack(len(value))
+        block += value
+        if len(block) >= self.buffer_size:
+            self._write_block()
+
+    def writepairs(self, kvpairs):
+        """Write all key-value pairs from the given iterable."""
+        pack = len_struct.pack
+        buffer_size = self.buffer_size
+        kvpairs = iter(kvpairs)
+        while self._sample is not None:
+            for pair in islice(kvpairs, 1):
+                self.writepair(pair)
+                break
+            else:
+                return
+        while True:
+            chunk = list(islice(kvpairs, BULK_RECORDS))
+            if not chunk:
+                break
+            keys = [pair[0] for pair in chunk]
+            values = [pair[1] for pair in chunk]
+            try:
+                if self.dumps_keys is not None:
+                    keys = self.dumps_keys(keys)
+                if self.dumps_values is not None:
+                    values = self.dumps_values(values)
+            except SchemaError:
+                # Find the pair that breaks the schema.
+                for pair in chunk:
+                    self.writepair(pair)
+                continue
+
+            block = self._block
+            for key, value in zip(keys, values):
+                block += pack(len(key)) + key + pack(len(value)) + value
+                if len(block) >= buffer_size:
+                    self._write_block()
+                    block = self._block
 
-        binlen = len_struct.pack(len(value))
-        write(binlen)
-        write(value)
+    def finish(self):
+        if self._sample is not None:
+            self._infer_serializers()
+        self._write_block()
+        super(BinWriter, self).finish()
+
+    def _write_block(self):
+        """Write the current block to the file and start a new one."""
+        if self._block:
+            self.fileobj.write(self._block)
+            self._block = bytearray()
+
+    def _write_control(self, payload):
+        """Adds a control record with the given payload to the block."""
+        self._block += len_struct.pack(CONTROL_LENGTH)
+        self._block += len_struct.pack(len(payload))
+        self._block += payload
+
+    def _infer_serializers(self):
+        """Chooses serializers for the held-back pairs and writes them."""
+        sample = self._sample
+        self._sample = None
+        key_schema = value_schema = None
+        if self._auto_key:
+            key_schema = infer_schema(pair[0] for pair in sample)
+        if self._auto_value:
+            value_schema = infer_schema(pair[1] for pair in sample)
+        if key_schema or value_schema:
+            self._set_schemas(key_schema, value_schema)
+        self.writepairs(sample)
+
+    def _set_schemas(self, key_schema, value_schema):
+        """Writes a control record and encodes later records accordingly.
+
+        A schema of None selects the writer's own serializer (or pickle).
+        """
+        payload = ('%s %s' % (key_schema or '', value_schema or '')).encode(
+                'ascii')
+        self._write_control(payload)
+
+        self._schema_keys = key_schema is not None
+        (self.dumps_key, self.dumps_value, self.dumps_keys,
+                self.dumps_values) = self._default_dumps
+        if key_schema is not None:
+            serializer = schema_serializer(key_schema)
+            self.dumps_key = serializer.dumps
+            self.dumps_keys = serializer.dumps_many
+        if value_schema is not None:
+            serializer = schema_serializer(value_schema)
+            self.dumps_value = serializer.dumps
+            self.dumps_values = serializer.dumps_many
 
 
 class BinReader(Reader):
-    """A key-value store using a simple binary record format."""
+    """A key-value store using a simple binary record format.
+
+    Data are read in large chunks into a reusable buffer, and records are
+    sliced out of the buffer at a moving offset.  If `use_mmap` is True and
+    the file object is a local file, the whole file is instead memory-mapped
+    and records are sliced straight out of the mapping.  Keys and values are
+    deserialized in bulk (see `serializers.loads_many_functions`).
+
+    Records that follow a control record (see `BinWriter`) are decoded with
+    the schemas that it gives.  If raw keys or values were requested, they
+    are re-encoded with pickle, which is how they would have been written
+    without inferred serializers.
+    """
     magic = b'MrsB'
 
-    def __init__(self, fileobj, *args, **kwds):
-        super(BinReader, self).__init__(fileobj, *args, **kwds)
-        self._buffer = b''
+    def __init__(self, fileobj, serializers=None, **kwds):
+        use_mmap = kwds.pop('use_mmap', False)
+        self.buffer_size = kwds.pop('buffer_size', READ_BUFFER_SIZE)
+        super(BinReader, self).__init__(fileobj, serializers, **kwds)
+        self.loads_keys, self.loads_values = loads_many_functions(serializers)
+        self._requested_loads = None
+        self._buffer = bytearray()
+        self._pos = 0
+        self._mmap = None
         self._magic_read = False
+        if use_mmap:
+            self._open_mmap()
+
+    def _open_mmap(self):
+        """Map the file into memory (if it is a nonempty local file)."""
+        try:
+            fileno = self.fileobj.fileno()
+            offset = self.fileobj.tell()
+            self._mmap = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except (AttributeError, ValueError, EnvironmentError):
+            return
+        self._buffer = self._mmap
+        self._pos = offset
+
+    def close(self):
+        if self._mmap is not None:
+            self._buffer = bytearray()
+            self._mmap.close()
+            self._mmap = None
+        super(BinReader, self).close()
 
     def __iter__(self):
         """Iterate over key-value pairs."""
-        #TODO: check for 'MRSB' magic cookie
         if not self._magic_read:
-            buf = self.fileobj.read(len(self.magic))
-            if buf != self.magic:
-                raise RuntimeError('Invalid file header: "%s"'
-                    % buf.encode('hex_codec'))
-            self._magic_read = True
+            self._read_magic()
+
+        loads_keys = self.loads_keys
+        loads_values = self.loads_values
+        unpack_from = len_struct.unpack_from
+        lensize = len_struct.size
 
         while True:
-            key = self._read_record()
-            if key is None:
+            buf = self._buffer
+            pos = self._pos
+            size = len(buf)
+            # Slicing a memoryview of a bytearray copies only once (and
+            # slicing an mmap already makes bytes).
+            if PY3 and self._mmap is None:
+                view = memoryview(buf)
+            else:
+                view = buf
+            keys = []
+            values = []
+            count = 0
+            control = None
+            while count < BULK_RECORDS:
+                key_start = pos + lensize
+                if key_start > size:
+                    break
+                key_len = unpack_from(buf, pos)[0]
+                if key_len == CONTROL_LENGTH:
+                    end = key_start + lensize
+                    if end > size:
+                        break
+                    end += unpack_from(buf, key_start)[0]
+                    if end > size:
+                        break
+                    control = bytes(view[key_start + lensize:end])
+                    pos = end
+                    break
+                key_end = key_start + key_len
+                value_start = key_end + lensize
+                if value_start > size:
+                    break
+                value_end = value_start + unpack_from(buf, key_end)[0]
+                if value_end > size:
+                    break
+                pos = value_end
+
+                keys.append(bytes(view[key_start:key_end]))
+                values.append(bytes(view[value_start:value_end]))
+                count += 1
+
+            # The buffer can only be resized once the view is released.
+            del view
+            self._pos = pos
+            if count:
+                if loads_keys is not None:
+                    keys = loads_keys(keys)
+                if loads_values is not None:
+                    values = loads_values(values)
+                for pair in zip(keys, values):
+                    yield pair
+            if control is not None:
+                self._apply_control(control)
+                loads_keys = self.loads_keys
+                loads_values = self.loads_values
+                continue
+            if count == BULK_RECORDS:
+                continue
+            if not self._fill_buffer():
+                self._check_end()
                 return
-            value = self._read_record()
-            if value is None:
-                raise RuntimeError('File ended with a lone key')
-            if self.loads_key is not None:
-                key = self.loads_key(key)
-            if self.loads_value is not None:
-                value = self.loads_value(value)
-            yield (key, value)
 
-    def _fill_buffer(self, size=DEFAULT_BUFFER_SIZE):
-        self._buffer += self.fileobj.read(size)
+    def _apply_control(self, payload):
+        """Chooses the loads functions for the records after a control record.
+        """
+        if self._requested_loads is None:
+            self._requested_loads = (self.loads_keys, self.loads_values)
+        schemas = payload.decode('ascii').split(' ')
+        pickle_dumps = dumps_many_functions(None)
+        loads = []
+        for i, schema in enumerate(schemas):
+            requested = self._requested_loads[i]
+            if not schema:
+                loads.append(requested)
+            elif requested is None:
+                loads.append(_transcoder(schema_serializer(schema).loads_many,
+                    pickle_dumps[i]))
+            else:
+                loads.append(schema_serializer(schema).loads_many)
+        self.loads_keys, self.loads_values = loads
+
+    def _read_magic(self):
+        size = len(self.magic)
+        while len(self._buffer) - self._pos < size:
+            if not self._fill_buffer():
+                break
+        header = bytes(self._buffer[self._pos:self._pos + size])
+        if header != self.magic:
+            raise RuntimeError('Invalid file header: "%s"'
+                % hex_encoder(header)[0].decode('ascii'))
+        self._pos += size
+        self._magic_read = True
+
+    def _fill_buffer(self):
+        """Discards consumed data and reads more data into the buffer.
+
+        Returns False if no more data are available.
+        """
+        if self._mmap is not None:
+            return False
+        buf = self._buffer
+        del buf[:self._pos]
+        self._pos = 0
+        data = self.fileobj.read(self.buffer_size)
+        if not data:
+            return False
+        buf += data
+        return True
+
+    def _check_end(self):
+        """Raises an exception if the data end with an incomplete record."""
+        remaining = len(self._buffer) - self._pos
+        if not remaining:
+            return
+        lensize = len_struct.size
+        if remaining >= lensize:
+            key_end = (self._pos + lensize +
+                    len_struct.unpack_from(self._buffer, self._pos)[0])
+            if key_end == len(self._buffer):
+                raise RuntimeError('File ended with a lone key')
+        raise RuntimeError('File ended unexpectedly')
 
-    def _read_record(self):
-        if len(self._buffer) < len_struct.size:
-            self._fill_buffer()
-        if not self._buffer:
-            return None
 
-        lenfield = self._buffer[:len_struct.size]
-        length, = len_struct.unpack(lenfield)
+def _transcoder(loads_many, dumps_many):
+    """Returns a function that converts a list of bytes to another encoding.
+    """
+    def transcode(bs):
+        return dumps_many(loads_many(bs))
+    return transcode
 
-        end = len_struct.size + length
-        if end > len(self._buffer):
-            self._fill_buffer(end - len(self._buffer))
 
-        if end > len(self._buffer):
-            raise RuntimeError('File ended unexpectedly')
+def set_auto_serializers(enabled):
+    """Sets whether binary writers without serializers infer them.
 
-        data = self._buffer[len_struct.size:end]
-        self._buffer = self._buffer[end:]
-        return data
+    This applies to writers that are not given the `auto_serializers` option
+    explicitly (such as the writers of a dataset's buckets).
+    """
+    global AUTO_SERIALIZERS
+    AUTO_SERIALIZERS = bool(enabled)
 
 
 class ZipWriter(BinWriter):
@@ -339,6 +982,9 @@ class ZipWriter(BinWriter):
         super(ZipWriter, self).__init__(fileobj, *args, **kwds)
 
     def finish(self):
+        if self._sample is not None:
+            self._infer_serializers()
+        self._write_block()
         # Close the gzip file (which does not close the underlying file).
         self.fileobj.close()
 
@@ -350,6 +996,8 @@ class ZipReader(BinReader):
     def __init__(self, fileobj, *args, **kwds):
         self.original_file = fileobj
         fileobj = gzip.GzipFile(fileobj=fileobj, mode='rb')
+        # The compressed file cannot be memory-mapped.
+        kwds.pop('use_mmap', None)
         super(ZipReader, self).__init__(fileobj, *args, **kwds)
 
     def close(self):
@@ -358,6 +1006,641 @@ class ZipReader(BinReader):
         self.original_file.close()
 
 
+class VarintWriter(BinWriter):
+    """A key-value store with compact framing for small records.
+
+    Each record starts with a varint (LEB128) tag.  A tag of 0 is a
+    repeated-key marker: the record's serialized key is the same as the
+    previous record's key.  A tag of 1 marks a control record (see
+    `BinWriter`).  Otherwise, the first `tag - 2` bytes of the key are shared
+    with the previous key, and the tag is followed by the varint length and
+    bytes of the rest of the key.  Every record ends with the varint length
+    and bytes of its value.  If `prefix_keys` is False, shared prefixes are
+    not computed (but repeated keys are still written as markers).
+
+    Small keys and values are framed with one byte each instead of four, and
+    runs of keys in sorted output cost a byte or two per record.
+    """
+    ext = 'mrsv'
+    magic = b'MrsV'
+
+    def __init__(self, fileobj, *args, **kwds):
+        self.prefix_keys = kwds.pop('prefix_keys', True)
+        super(VarintWriter, self).__init__(fileobj, *args, **kwds)
+        self._last_key = None
+
+    def writepair(self, kvpair, serialized_key=None):
+        """Write a key-value pair."""
+        if self._sample is not None:
+            self._sample.append(kvpair)
+            if len(self._sample) >= AUTO_SAMPLE_RECORDS:
+                self._infer_serializers()
+            return
+
+        key, value = kvpair
+        try:
+            if serialized_key is not None and not self._schema_keys:
+                key = serialized_key
+            elif self.dumps_key is not None:
+                key = self.dumps_key(key)
+            if self.dumps_value is not None:
+                value = self.dumps_value(value)
+        except SchemaError:
+            self._set_schemas(None, None)
+            return self.writepair(kvpair, serialized_key)
+
+        self._frame(key, value)
+        if len(self._block) >= self.buffer_size:
+            self._write_block()
+
+    def writepairs(self, kvpairs):
+        """Write all key-value pairs from the given iterable."""
+        buffer_size = self.buffer_size
+        kvpairs = iter(kvpairs)
+        while self._sample is not None:
+            for pair in islice(kvpairs, 1):
+                self.writepair(pair)
+                break
+            else:
+                return
+        frame = self._frame
+        while True:
+            chunk = list(islice(kvpairs, BULK_RECORDS))
+            if not chunk:
+                break
+            keys = [pair[0] for pair in chunk]
+            values = [pair[1] for pair in chunk]
+            try:
+                if self.dumps_keys is not None:
+                    keys = self.dumps_keys(keys)
+                if self.dumps_values is not None:
+                    values = self.dumps_values(values)
+            except SchemaError:
+                # Find the pair that breaks the schema.
+                for pair in chunk:
+                    self.writepair(pair)
+                continue
+
+            for key, value in zip(keys, values):
+                frame(key, value)
+                if len(self._block) >= buffer_size:
+                    self._write_block()
+
+    def _frame(self, key, value):
+        """Adds a record to the block."""
+        block = self._block
+        last_key = self._last_key
+        if key == last_key:
+            # A repeated-key marker.
+            block += b'\0'
+        else:
+            shared = 0
+            if self.prefix_keys and last_key is not None:
+                shared = _shared_prefix(last_key, key)
+            block += encode_varint(shared + 2)
+            block += encode_varint(len(key) - shared)
+            block += key[shared:]
+            self._last_key = key
+        block += encode_varint(len(value))
+        block += value
+
+    def _write_control(self, payload):
+        self._block += b'\1'
+        self._block += encode_varint(len(payload))
+        self._block += payload
+
+
+class VarintReader(BinReader):
+    """A key-value store with compact framing for small records.
+
+    See `VarintWriter` for the format of the records.
+    """
+    magic = b'MrsV'
+
+    def __init__(self, fileobj, *args, **kwds):
+        if not PY3:
+            # Indexing an mmap returns a str (not an int) in Python 2.
+            kwds.pop('use_mmap', None)
+        super(VarintReader, self).__init__(fileobj, *args, **kwds)
+        self._last_key = b''
+
+    def __iter__(self):
+        """Iterate over key-value pairs."""
+        if not self._magic_read:
+            self._read_magic()
+
+        loads_keys = self.loads_keys
+        loads_values = self.loads_values
+
+        while True:
+            buf = self._buffer
+            pos = self._pos
+            size = len(buf)
+            if PY3 and self._mmap is None:
+                view = memoryview(buf)
+            else:
+                view = buf
+            keys = []
+            values = []
+            count = 0
+            control = None
+            last_key = self._last_key
+            while count < BULK_RECORDS:
+                start = pos
+                try:
+                    tag = buf[pos]
+                    pos += 1
+                    if tag & 0x80:
+                        tag, pos = _decode_varint(buf, pos, tag)
+                    if tag == 0:
+                        # A repeated-key marker.
+                        key = last_key
+                    else:
+                        n = buf[pos]
+                        pos += 1
+                        if n & 0x80:
+                            n, pos = _decode_varint(buf, pos, n)
+                        end = pos + n
+                        if end > size:
+                            raise IndexError
+                        if tag == 1:
+                            control = bytes(view[pos:end])
+                            pos = end
+                            break
+                        key = last_key[:tag - 2] + bytes(view[pos:end])
+                        pos = end
+                    n = buf[pos]
+                    pos += 1
+                    if n & 0x80:
+                        n, pos = _decode_varint(buf, pos, n)
+                    end = pos + n
+                    if end > size:
+                        raise IndexError
+                    value = bytes(view[pos:end])
+                    pos = end
+                except IndexError:
+                    # The record continues past the end of the buffer.
+                    pos = start
+                    break
+                last_key = key
+                keys.append(key)
+                values.append(value)
+                count += 1
+
+            # The buffer can only be resized once the view is released.
+            del view
+            self._pos = pos
+            self._last_key = last_key
+            if count:
+                if loads_keys is not None:
+                    keys = loads_keys(keys)
+                if loads_values is not None:
+                    values = loads_values(values)
+                for pair in zip(keys, values):
+                    yield pair
+            if control is not None:
+                self._apply_control(control)
+                loads_keys = self.loads_keys
+                loads_values = self.loads_values
+                continue
+            if count == BULK_RECORDS:
+                continue
+            if not self._fill_buffer():
+                self._check_end()
+                return
+
+    def _check_end(self):
+        """Raises an exception if the data end with an incomplete record."""
+        if len(self._buffer) > self._pos:
+            raise RuntimeError('File ended unexpectedly')
+
+
+_small_varints = [struct.pack('B', i) for i in range(0x80)]
+
+def encode_varint(n):
+    """Encodes a nonnegative integer as a LEB128 varint.
+
+    >>> bytearray(encode_varint(5)) == bytearray([5])
+    True
+    >>> bytearray(encode_varint(300)) == bytearray([0xac, 0x02])
+    True
+    >>>
+    """
+    if n < 0x80:
+        return _small_varints[n]
+    data = bytearray()
+    while n >= 0x80:
+        data.append((n & 0x7f) | 0x80)
+        n >>= 7
+    data.append(n)
+    return bytes(data)
+
+
+def _decode_varint(buf, pos, first):
+    """Decodes the rest of a varint whose first byte has been read.
+
+    Returns the value and the position after the varint.  Raises IndexError
+    if the varint continues past the end of the buffer.
+    """
+    n = first & 0x7f
+    shift = 7
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return n, pos
+        shift += 7
+
+
+def _shared_prefix(a, b):
+    """Returns the length of the longest common prefix of two byte strings.
+    """
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class BlockCodec(object):
+    """Compression functions for the blocks of a block-compressed file."""
+    def __init__(self, name, codec_id, compress, decompress):
+        self.name = name
+        self.codec_id = codec_id
+        self.compress = compress
+        self.decompress = decompress
+
+
+def _lzma_compress(data, level):
+    return lzma.compress(data, preset=level)
+
+block_codecs = [
+        BlockCodec('zlib', 1, zlib.compress, zlib.decompress),
+        BlockCodec('bz2', 2, bz2.compress, bz2.decompress),
+        ]
+if lzma is not None:
+    block_codecs.append(BlockCodec('lzma', 3, _lzma_compress,
+        lzma.decompress))
+codecs_by_name = dict((c.name, c) for c in block_codecs)
+codecs_by_id = dict((c.codec_id, c) for c in block_codecs)
+
+
+def set_block_defaults(codec=None, level=None, block_size=None):
+    """Sets the codec, compression level, and block size of BlockWriters.
+
+    These defaults apply to block writers that are not given these options
+    explicitly (such as the writers of a dataset's buckets).  Arguments that
+    are None leave the corresponding defaults unchanged.
+    """
+    global BLOCK_CODEC, BLOCK_COMPRESS_LEVEL, BLOCK_SIZE
+    if codec is not None:
+        if codec not in codecs_by_name:
+            raise ValueError('Unsupported block codec: %r' % codec)
+        BLOCK_CODEC = codec
+    if level is not None:
+        BLOCK_COMPRESS_LEVEL = level
+    if block_size is not None:
+        BLOCK_SIZE = block_size
+
+
+class BlockWriter(BinWriter):
+    """A key-value store using independently compressed blocks of records.
+
+    Records are framed as in the simple binary format and grouped into blocks
+    of about `block_size` bytes (a record never spans two blocks).  Each block
+    is compressed on its own with the given codec ('zlib', 'bz2', or 'lzma')
+    and level and is preceded by a header giving the codec and the block's
+    uncompressed and compressed sizes.  Unlike ZipWriter output, the file can
+    be decompressed one block at a time.
+
+    If `index` is True (the default), a `BlockInfo` is recorded for each
+    block (see the `blocks` attribute), and the list is written as a footer
+    when the writer finishes.  The footer is an uncompressed block with codec
+    id INDEX_CODEC_ID (where sequential readers stop) followed by a trailer
+    with the offset of the footer, so that a reader of a seekable file can
+    find any block without scanning.  Offsets are relative to the start of
+    the file's header.  Since the index records the range of serialized keys
+    in each block, keys are only encoded with inferred serializers (see
+    `BinWriter`) if there is no index.
+    """
+    ext = 'mrsc'
+    magic = b'MrsC'
+
+    def __init__(self, fileobj, *args, **kwds):
+        codec = kwds.pop('codec', None) or BLOCK_CODEC
+        level = kwds.pop('level', None)
+        block_size = kwds.pop('block_size', None)
+        index = kwds.pop('index', True)
+        try:
+            self.codec = codecs_by_name[codec]
+        except KeyError:
+            raise ValueError('Unsupported block codec: %r' % codec)
+        self.level = BLOCK_COMPRESS_LEVEL if level is None else level
+        kwds['buffer_size'] = block_size or BLOCK_SIZE
+        self.auto_keys = not index
+        super(BlockWriter, self).__init__(fileobj, *args, **kwds)
+        self._block = bytearray()
+        self.fileobj.write(self.magic)
+        self._offset = len(self.magic)
+        self.blocks = [] if index else None
+
+    def finish(self):
+        if self._sample is not None:
+            self._infer_serializers()
+        self._write_block()
+        if self.blocks is not None:
+            self._write_index()
+        super(BlockWriter, self).finish()
+
+    def _write_block(self):
+        """Compress the current block and write it to the file."""
+        if self._block:
+            raw = bytes(self._block)
+            data = self.codec.compress(raw, self.level)
+            header = block_header_struct.pack(self.codec.codec_id, len(raw),
+                    len(data))
+            self.fileobj.write(header)
+            self.fileobj.write(data)
+            if self.blocks is not None:
+                records, min_key, max_key = _scan_block(raw)
+                self.blocks.append(BlockInfo(self._offset, records, len(raw),
+                    len(header) + len(data), min_key, max_key))
+            self._offset += len(header) + len(data)
+            self._block = bytearray()
+
+    def _write_index(self):
+        parts = []
+        for info in self.blocks:
+            parts.append(index_entry_struct.pack(info.offset, info.records,
+                info.raw_size, info.size))
+            for key in (info.min_key, info.max_key):
+                parts.append(len_struct.pack(len(key)))
+                parts.append(key)
+        data = b''.join(parts)
+        self.fileobj.write(block_header_struct.pack(INDEX_CODEC_ID,
+            len(data), len(data)))
+        self.fileobj.write(data)
+        self.fileobj.write(index_trailer_struct.pack(self._offset,
+            INDEX_SENTINEL))
+        self._offset += (block_header_struct.size + len(data) +
+                index_trailer_struct.size)
+
+
+class BlockReader(BinReader):
+    """A key-value store using independently compressed blocks of records.
+
+    If `prefetch` is True (the default), blocks are read and decompressed in
+    a helper thread while records of earlier blocks are consumed.
+
+    If a `key_range` is given, it is a pair of serialized keys (either of
+    which may be None), and only records with `start <= key < stop` (by
+    serialized key) are read.  If the file is seekable and has an index,
+    blocks whose keys are all outside of the range are skipped entirely.
+    """
+    magic = b'MrsC'
+
+    def __init__(self, fileobj, *args, **kwds):
+        self.prefetch = kwds.pop('prefetch', True)
+        self.key_range = kwds.pop('key_range', None)
+        # Compressed blocks cannot be memory-mapped.
+        kwds.pop('use_mmap', None)
+        super(BlockReader, self).__init__(fileobj, *args, **kwds)
+        self._blocks = None
+        self._stop = threading.Event()
+        try:
+            self._start = fileobj.tell()
+        except (AttributeError, EnvironmentError, ValueError):
+            self._start = None
+        if self.key_range is not None:
+            # Keys are compared before they are deserialized.
+            self._loads_range_key = self.loads_key
+            self.loads_key = None
+            self.loads_keys = None
+
+    def __iter__(self):
+        """Iterate over key-value pairs (in the key range, if any)."""
+        if self.key_range is None:
+            return super(BlockReader, self).__iter__()
+        else:
+            return self._iter_range()
+
+    def _iter_range(self):
+        start, stop = self.key_range
+        loads_key = self._loads_range_key
+        for key, value in super(BlockReader, self).__iter__():
+            if start is not None and key < start:
+                continue
+            if stop is not None and key >= stop:
+                continue
+            if loads_key is not None:
+                key = loads_key(key)
+            yield key, value
+
+    def read_index(self):
+        """Returns the list of BlockInfo from the footer of the file.
+
+        Returns None if the file has no index or is not seekable.  The
+        position in the file is not changed.
+        """
+        if self._start is None:
+            return None
+        f = self.fileobj
+        try:
+            position = f.tell()
+            f.seek(0, 2)
+            if f.tell() - self._start < (len(self.magic) +
+                    index_trailer_struct.size):
+                f.seek(position)
+                return None
+            f.seek(-index_trailer_struct.size, 2)
+        except (AttributeError, EnvironmentError, ValueError):
+            return None
+        try:
+            offset, sentinel = index_trailer_struct.unpack(
+                    _read_exactly(f, index_trailer_struct.size))
+            if sentinel != INDEX_SENTINEL:
+                return None
+            f.seek(self._start + offset)
+            header = _read_exactly(f, block_header_struct.size)
+            codec_id, raw_size, _ = block_header_struct.unpack(header)
+            if codec_id != INDEX_CODEC_ID:
+                raise RuntimeError('Invalid block index')
+            data = _read_exactly(f, raw_size)
+        finally:
+            f.seek(position)
+        return _parse_index(data)
+
+    def close(self):
+        self._stop.set()
+        super(BlockReader, self).close()
+
+    def _read_magic(self):
+        header = _read_exactly(self.fileobj, len(self.magic))
+        if header != self.magic:
+            raise RuntimeError('Invalid file header: "%s"'
+                % hex_encoder(header)[0].decode('ascii'))
+        self._magic_read = True
+
+    def _fill_buffer(self):
+        """Discards consumed data and adds the next block to the buffer."""
+        if self._blocks is None:
+            if self.prefetch:
+                self._blocks = self._prefetched_blocks()
+            else:
+                self._blocks = self._read_blocks()
+        buf = self._buffer
+        del buf[:self._pos]
+        self._pos = 0
+        data = next(self._blocks, None)
+        if data is None:
+            return False
+        buf += data
+        return True
+
+    def _read_blocks(self):
+        """Iterates over the decompressed blocks of the file."""
+        index = None
+        if self.key_range is not None:
+            index = self.read_index()
+        if index is None:
+            while not self._stop.is_set():
+                data = self._read_block()
+                if data is None:
+                    return
+                yield data
+        else:
+            start, stop = self.key_range
+            for info in index:
+                if self._stop.is_set():
+                    return
+                if start is not None and info.max_key < start:
+                    continue
+                if stop is not None and info.min_key >= stop:
+                    continue
+                self.fileobj.seek(self._start + info.offset)
+                yield self._read_block()
+
+    def _read_block(self):
+        """Reads and decompresses the block at the current position.
+
+        Returns None at the end of the blocks.
+        """
+        size = block_header_struct.size
+        header = _read_exactly(self.fileobj, size)
+        if not header:
+            return None
+        if len(header) < size:
+            raise RuntimeError('File ended unexpectedly')
+        codec_id, raw_size, data_size = block_header_struct.unpack(header)
+        if codec_id == INDEX_CODEC_ID:
+            return None
+        try:
+            codec = codecs_by_id[codec_id]
+        except KeyError:
+            raise RuntimeError('Unsupported block codec id: %s' % codec_id)
+        data = _read_exactly(self.fileobj, data_size)
+        if len(data) < data_size:
+            raise RuntimeError('File ended unexpectedly')
+        data = codec.decompress(data)
+        if len(data) != raw_size:
+            raise RuntimeError('Corrupt block (expected %s bytes, got %s)'
+                    % (raw_size, len(data)))
+        return data
+
+    def _prefetched_blocks(self):
+        """Iterates over blocks that are decompressed in a helper thread."""
+        blocks = queue.Queue(BLOCK_PREFETCH)
+        thread = threading.Thread(target=self._prefetch_thread,
+                args=(blocks,), name='Block Reader')
+        thread.daemon = True
+        thread.start()
+        while True:
+            item = blocks.get()
+            if item is None:
+                return
+            elif isinstance(item, Exception):
+                raise item
+            yield item
+
+    def _prefetch_thread(self, blocks):
+        try:
+            for data in self._read_blocks():
+                self._put(blocks, data)
+            self._put(blocks, None)
+        except Exception as e:
+            self._put(blocks, e)
+
+    def _put(self, blocks, item):
+        """Adds to the queue unless the reader is closed first."""
+        while not self._stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+
+def _scan_block(raw):
+    """Returns the record count and minimum and maximum keys of a block."""
+    unpack_from = len_struct.unpack_from
+    lensize = len_struct.size
+    records = 0
+    min_key = max_key = None
+    pos = 0
+    size = len(raw)
+    while pos < size:
+        key_start = pos + lensize
+        key_len = unpack_from(raw, pos)[0]
+        if key_len == CONTROL_LENGTH:
+            pos = key_start + lensize + unpack_from(raw, key_start)[0]
+            continue
+        key_end = key_start + key_len
+        key = raw[key_start:key_end]
+        if min_key is None or key < min_key:
+            min_key = key
+        if max_key is None or key > max_key:
+            max_key = key
+        pos = key_end + lensize + unpack_from(raw, key_end)[0]
+        records += 1
+    return records, min_key, max_key
+
+
+def _parse_index(data):
+    """Returns the list of BlockInfo encoded in an index block."""
+    unpack_from = len_struct.unpack_from
+    lensize = len_struct.size
+    blocks = []
+    pos = 0
+    while pos < len(data):
+        offset, records, raw_size, size = index_entry_struct.unpack_from(
+                data, pos)
+        pos += index_entry_struct.size
+        keys = []
+        for _ in range(2):
+            key_end = pos + lensize + unpack_from(data, pos)[0]
+            keys.append(data[pos + lensize:key_end])
+            pos = key_end
+        blocks.append(BlockInfo(offset, records, raw_size, size, *keys))
+    return blocks
+
+
+def _read_exactly(fileobj, size):
+    """Reads the given number of bytes (or fewer at the end of the file)."""
+    data = fileobj.read(size)
+    if len(data) == size or not data:
+        return data
+    chunks = [data]
+    remaining = size - len(data)
+    while remaining:
+        data = fileobj.read(remaining)
+        if not data:
+            break
+        chunks.append(data)
+        remaining -= len(data)
+    return b''.join(chunks)
+
+
 def writerformat(extension):
     """Returns the writer class associated with the given file extension."""
     return writer_map[extension]
@@ -371,13 +1654,111 @@ def fileformat(filename):
     return reader_map.get(extension, default_read_format)
 
 
+def split_url_options(url):
+    """Splits a url into the url proper and a dict of Mrs options.
+
+    Options describe the data at the url and are stored in the url's fragment
+    as '&'-separated items of the form 'name' or 'name=value', where each
+    name is in `URL_OPTIONS` and each value is an integer.  Since the
+    fragment is never sent to a server, options do not affect how the url is
+    opened.  Only the text after the last '#' is parsed, and only if every
+    item is an option, so other uses of '#' (such as in a local path) are
+    left in the url.
+
+    >>> split_url_options('/tmp/source_0_split_1_.mrsb#sorted')
+    ('/tmp/source_0_split_1_.mrsb', {'sorted': ''})
+    >>> split_url_options('/tmp/notes#1.txt')
+    ('/tmp/notes#1.txt', {})
+    >>>
+    """
+    prefix, _, fragment = url.rpartition('#')
+    if not prefix:
+        return url, {}
+    options = {}
+    for item in fragment.split('&'):
+        name, _, value = item.partition('=')
+        if name not in URL_OPTIONS or not (value == '' or value.isdigit()):
+            return url, {}
+        options[name] = value
+    return prefix, options
+
+
+def join_url_options(url, options):
+    """Adds the given dict of Mrs options to the fragment of a url.
+
+    >>> join_url_options('/tmp/source_0_split_1_.mrsb', {'sorted': ''})
+    '/tmp/source_0_split_1_.mrsb#sorted'
+    >>>
+    """
+    url, old_options = split_url_options(url)
+    old_options.update(options)
+    if not old_options:
+        return url
+    items = []
+    for name, value in sorted(old_options.items()):
+        if value == '':
+            items.append(name)
+        else:
+            items.append('%s=%s' % (name, value))
+    return '%s#%s' % (url, '&'.join(items))
+
+
+def set_url_converter(converter):
+    """Sets the URLConverter that `open_url` uses to find local files.
+
+    Urls of buckets that are served by this host's bucket server are then
+    opened as local files instead of being downloaded.
+    """
+    global URL_CONVERTER
+    URL_CONVERTER = converter
+
+
 def open_url(url, **kwds):
-    """Opens a url or file and returns an appropriate key-value reader."""
+    """Opens a url or file and returns an appropriate key-value reader.
+
+    If the url has `start` and `end` options (see `byte_range_urls`) and the
+    reader is splittable, only the given byte range is read.  A `file` option
+    gives the file index of the lines (see `LineReader`).
+
+    Local files (including files served by this host's bucket server, see
+    `set_url_converter`) are memory-mapped by binary readers.
+    """
+    url, options = split_url_options(url)
     reader_cls = fileformat(url)
 
-    parsed_url = urlparse(url, 'file')
+    if reader_cls.splittable and 'file' in options:
+        kwds['file_index'] = int(options['file'])
+
+    start = 0
+    if reader_cls.splittable and 'start' in options:
+        start = int(options['start'])
+        kwds['start'] = start
+        if options.get('end'):
+            kwds['end'] = int(options['end'])
+
+    # Options were already removed, so any '#' left is part of the path.
+    parsed_url = urlparse(url, 'file', allow_fragments=False)
+    if parsed_url.scheme == 'http' and URL_CONVERTER is not None:
+        path = URL_CONVERTER.local_path(url)
+        if path is not None and os.path.exists(path):
+            parsed_url = urlparse(path, 'file', allow_fragments=False)
+
     if parsed_url.scheme == 'file':
         f = open(parsed_url.path, 'rb')
+        if start:
+            f.seek(start)
+        if issubclass(reader_cls, BinReader):
+            kwds.setdefault('use_mmap', True)
+    elif start:
+        if parsed_url.scheme == 'hdfs':
+            server, username, path = hdfs.urlsplit(url)
+            url = hdfs.datanode_url(server, username, path, offset=start)
+            f = urlopen(url)
+        else:
+            f = urlopen(Request(url, headers={'Range': 'bytes=%s-' % start}))
+            if f.getcode() != 206:
+                # The server ignored the range, so skip to the start.
+                _skip(f, start)
     else:
         if parsed_url.scheme == 'hdfs':
             server, username, path = hdfs.urlsplit(url)
@@ -396,6 +1777,69 @@ def open_url(url, **kwds):
     return reader_cls(f, **kwds)
 
 
+def _skip(fileobj, size):
+    """Reads and discards the given number of bytes from the file object."""
+    while size > 0:
+        data = fileobj.read(min(size, READ_BUFFER_SIZE))
+        if not data:
+            break
+        size -= len(data)
+
+
+def url_size(url):
+    """Returns the size in bytes of the file at the url (or None if unknown).
+    """
+    url, _ = split_url_options(url)
+    parsed_url = urlparse(url, 'file', allow_fragments=False)
+    if parsed_url.scheme == 'file':
+        return os.path.getsize(parsed_url.path)
+    elif parsed_url.scheme == 'hdfs':
+        server, username, path = hdfs.urlsplit(url)
+        return hdfs.hdfs_get_file_status(server, username, path)['length']
+    else:
+        # A HEAD request gives the length without sending the data.
+        request = Request(url)
+        request.get_method = lambda: 'HEAD'
+        f = urlopen(request)
+        try:
+            length = f.info().get('Content-Length')
+        finally:
+            f.close()
+        return int(length) if length else None
+
+
+def url_range_size(url):
+    """Returns the size of the byte range (or whole file) at the url.
+
+    Returns None if the size is unknown.
+    """
+    _, options = split_url_options(url)
+    if options.get('end'):
+        return int(options['end']) - int(options.get('start', 0))
+    else:
+        return url_size(url)
+
+
+def byte_range_urls(url, split_size):
+    """Divides the file at the url into byte ranges of about `split_size`.
+
+    Returns a list of urls with `start` and `end` options.  If the file is
+    no larger than `split_size`, its size is unknown, or its format is not
+    splittable (a Mrs format), the list holds just the given url.
+    """
+    if not fileformat(split_url_options(url)[0]).splittable:
+        return [url]
+    size = url_size(url)
+    if size is None or size <= split_size:
+        return [url]
+    urls = []
+    for start in range(0, size, split_size):
+        end = min(start + split_size, size)
+        urls.append(join_url_options(url,
+            {'start': str(start), 'end': str(end)}))
+    return urls
+
+
 def test():
     import doctest
     doctest.testmod()
@@ -405,12 +1849,20 @@ reader_map = {
         'mrsx': HexReader,
         'mrsb': BinReader,
         'mrsz': ZipReader,
+        'mrsc': BlockReader,
+        'mrsv': VarintReader,
+        'tsv': DelimitedReader,
+        'csv': CSVReader,
         }
 writer_map = {
         'mtxt': TextWriter,
         'mrsx': HexWriter,
         'mrsb': BinWriter,
         'mrsz': ZipWriter,
+        'mrsc': BlockWriter,
+        'mrsv': VarintWriter,
+        'tsv': DelimitedWriter,
+        'csv': CSVWriter,
         }
 default_read_format = LineReader
 default_write_format = BinWriter
@@ -15,8 +15,11 @@
 
 from __future__ import division, print_function
 
+import functools
 import multiprocessing
+from operator import itemgetter
 import os
+import random
 import select
 import threading
 import time
@@ -26,6 +29,7 @@ import weakref
 from . import bucket
 from . import computed_data
 from . import datasets
+from . import fileformats
 from . import http
 from . import registry
 from .serializers import Serializers
@@ -53,6 +57,16 @@ class Job(object):
         self._keep_jobdir = getattr(opts, 'mrs__keep_jobdir', False)
         self.default_partition = program.partition
         self.default_reduce_tasks = getattr(opts, 'mrs__reduce_tasks', 1)
+        self.default_salt = getattr(opts, 'mrs__hot_key_salt', 0)
+        self.default_split_size = (getattr(opts, 'mrs__input_split_size', 0)
+                * 1024 * 1024)
+        self.default_pack_size = (getattr(opts, 'mrs__input_pack_size', 0)
+                * 1024 * 1024)
+        intermediate_format = getattr(opts, 'mrs__intermediate_format', '')
+        if intermediate_format:
+            self.default_format = fileformats.writerformat(intermediate_format)
+        else:
+            self.default_format = None
         self.default_reduce_splits = 1
 
     def wait(self, *datasets, **kwds):
@@ -64,9 +78,23 @@ class Job(object):
         """
         return self._manager.wait(*datasets, **kwds)
 
-    def file_data(self, filenames):
-        """Defines a set of data from a list of urls."""
-        ds = datasets.FileData(filenames)
+    def file_data(self, filenames, split_size=None, pack_size=None):
+        """Defines a set of data from a list of urls.
+
+        Text files larger than `split_size` bytes (by default, the value of
+        --mrs-input-split-size) are divided into byte ranges of about that
+        size, so that each range is read by a separate map task.  If
+        `pack_size` is nonzero (by default, the value of
+        --mrs-input-pack-size), consecutive small files are instead packed
+        into splits of about `pack_size` bytes, so that each map task reads
+        several files.
+        """
+        if split_size is None:
+            split_size = self.default_split_size
+        if pack_size is None:
+            pack_size = self.default_pack_size
+        ds = datasets.FileData(filenames, split_size=split_size,
+                pack_size=pack_size)
         self._manager.submit(ds)
         ds._close_callback = self._manager.close_dataset
         return ds
@@ -103,11 +131,16 @@ class Job(object):
         return ds
 
     def map_data(self, input, mapper, splits=None, outdir=None, combiner=None,
-            parter=None, **kwds):
+            parter=None, salt=None, **kwds):
         """Define a set of data computed with a map operation.
 
         Specify the input dataset and a mapper function.  The mapper must be
-        in the program instance.
+        in the program instance.  If a `combiner` is given, the data are
+        combinable, and each hot key in the map output is spread across
+        `salt` splits (by default, the value of --mrs-hot-key-salt).  A
+        reduce of salted data automatically combines the values of each key
+        in an extra step before the reducer is called (unless no keys were
+        hot enough to be salted).
 
         Called from the user-specified run function.
         """
@@ -120,10 +153,11 @@ class Job(object):
             util.try_makedirs(outdir)
         else:
             permanent = False
+            self._set_default_format(kwds)
 
         if parter is None:
             parter = self.default_partition
-        part_name, _ = self._named_attr(parter)
+        part_name, part_args = self._partition_attr(parter)
 
         map_name, mapper = self._named_attr(mapper)
         self._set_serializers(mapper, kwds)
@@ -131,8 +165,10 @@ class Job(object):
             combine_name, _ = self._named_attr(combiner)
         else:
             combine_name = ''
+        salt = self._salt(salt, combine_name)
 
-        op = tasks.MapOperation(map_name, combine_name, part_name)
+        op = tasks.MapOperation(map_name, combine_name, part_name, part_args,
+                salt)
         ds = computed_data.ComputedData(op, input, splits=splits, dir=outdir,
                 permanent=permanent, **kwds)
         self._manager.submit(ds)
@@ -140,51 +176,75 @@ class Job(object):
         return ds
 
     def reduce_data(self, input, reducer, splits=None, outdir=None,
-            parter=None, **kwds):
+            parter=None, hash_reduce=None, combiner=None, **kwds):
         """Define a set of data computed with a reducer operation.
 
         Specify the input dataset and a reducer function.  The reducer must be
-        in the program instance.
+        in the program instance.  If `hash_reduce` is True (or if it is
+        unspecified and the reducer is decorated with `mrs.hash_reducer`),
+        keys are grouped with a hash table instead of sorting, so the reducer
+        sees keys in no particular order.  If a `combiner` is given, reduce
+        tasks apply it to sorted runs that they spill to disk.
 
         Called from the user-specified run function.
         """
         if splits is None:
             splits = self.default_reduce_splits
+        input, merged = self._merge_salted(input)
 
         if outdir:
             permanent = True
             util.try_makedirs(outdir)
         else:
             permanent = False
+            self._set_default_format(kwds)
 
         if parter is None:
             parter = self.default_partition
-        part_name, _ = self._named_attr(parter)
+        part_name, part_args = self._partition_attr(parter)
 
         reduce_name, reducer = self._named_attr(reducer)
         self._set_serializers(reducer, kwds, input.serializers)
 
-        op = tasks.ReduceOperation(reduce_name, part_name)
+        if hash_reduce is None:
+            hash_reduce = getattr(reducer, 'hash_reduce', False)
+        if combiner is not None:
+            combine_name, _ = self._named_attr(combiner)
+        else:
+            combine_name = ''
+
+        op = tasks.ReduceOperation(reduce_name, part_name, hash_reduce,
+                combine_name, part_args)
         ds = computed_data.ComputedData(op, input, splits=splits, dir=outdir,
                 permanent=permanent, **kwds)
         self._manager.submit(ds)
         ds._close_callback = self._manager.close_dataset
+        if merged is not None:
+            merged.close()
         return ds
 
     def reducemap_data(self, input, reducer, mapper, splits=None, outdir=None,
-            combiner=None, parter=None, **kwds):
+            combiner=None, parter=None, hash_reduce=None, salt=None,
+            reduce_combiner=None, **kwds):
         """Define a set of data computed with the reducemap operation.
 
+        The `combiner` and `salt` parameters apply to the map output as in
+        `map_data`, and the `hash_reduce` parameter is as in `reduce_data`.
+        If a `reduce_combiner` is given, it is applied to the sorted runs of
+        reduce input, as the `combiner` of `reduce_data` is.
+
         Called from the user-specified run function.
         """
         if splits is None:
             splits = self.default_reduce_tasks
+        input, merged = self._merge_salted(input)
 
         if outdir:
             permanent = True
             util.try_makedirs(outdir)
         else:
             permanent = False
+            self._set_default_format(kwds)
 
         if not parter:
             parter = self.default_partition
@@ -196,16 +256,86 @@ class Job(object):
             combine_name, _ = self._named_attr(combiner)
         else:
             combine_name = ''
-        part_name, _ = self._named_attr(parter)
+        if reduce_combiner is not None:
+            reduce_combine_name, _ = self._named_attr(reduce_combiner)
+        else:
+            reduce_combine_name = ''
+        part_name, part_args = self._partition_attr(parter)
+        salt = self._salt(salt, combine_name)
+
+        if hash_reduce is None:
+            hash_reduce = getattr(reducer, 'hash_reduce', False)
 
         op = tasks.ReduceMapOperation(reduce_name, map_name, combine_name,
-                part_name)
+                part_name, hash_reduce, part_args, salt, reduce_combine_name)
         ds = computed_data.ComputedData(op, input, splits=splits, dir=outdir,
                 permanent=permanent, **kwds)
         self._manager.submit(ds)
         ds._close_callback = self._manager.close_dataset
+        if merged is not None:
+            merged.close()
         return ds
 
+    def range_partitioner(self, dataset, splits=None, sample_fraction=0.01,
+            max_samples=10000):
+        """Create a range partition function from a sample of dataset keys.
+
+        Keys in the given dataset are sampled with probability
+        `sample_fraction`, and the sample is used to find `splits` - 1
+        boundaries that divide the keys into ranges of roughly equal size.
+        The result may be given as the `parter` of `map_data`,
+        `reduce_data`, or `reducemap_data` so that each output split
+        contains a contiguous range of keys.  Together with a sorted reduce,
+        this produces globally sorted output.  The `splits` parameter
+        defaults to the number of reduce tasks.
+
+        Each split of the dataset is read in full, and at most its share of
+        `max_samples` keys is kept in a uniform (reservoir) sample of its
+        sampled keys, so that the sample is bounded even if the dataset is
+        large and is unbiased even if each split is sorted.  Each kept key is
+        weighted by the number of sampled keys it stands for.
+
+        Waits for the dataset to complete if it is still being computed.
+        """
+        if splits is None:
+            splits = self.default_reduce_tasks
+        if getattr(dataset, 'computing', False):
+            self.wait(dataset)
+
+        rand = random.Random(0)
+        split_samples = max(1, max_samples // max(1, dataset.splits))
+        weighted = []
+        for split in range(dataset.splits):
+            reservoir = []
+            seen = 0
+            for key, _ in dataset.stream_split(split):
+                if rand.random() >= sample_fraction:
+                    continue
+                seen += 1
+                if len(reservoir) < split_samples:
+                    reservoir.append(key)
+                else:
+                    i = rand.randrange(seen)
+                    if i < split_samples:
+                        reservoir[i] = key
+            if reservoir:
+                weight = seen / len(reservoir)
+                weighted.extend((key, weight) for key in reservoir)
+        weighted.sort(key=itemgetter(0))
+
+        boundaries = []
+        total = sum(weight for _, weight in weighted)
+        cumulative = 0
+        i = 1
+        for key, weight in weighted:
+            cumulative += weight
+            while i < splits and cumulative > total * i / splits:
+                if not boundaries or boundaries[-1] < key:
+                    boundaries.append(key)
+                i += 1
+        return functools.partial(self._program.range_partition,
+                boundaries=boundaries)
+
     def progress(self, dataset):
         """Reports the progress (fraction complete) of the given dataset."""
         return self._manager.progress(dataset)
@@ -252,6 +382,59 @@ class Job(object):
         serializers = Serializers(key_s, key_s_name, value_s, value_s_name)
         kwds['serializers'] = serializers
 
+    def _salt(self, salt, combine_name):
+        """Returns the salt for map output (only used if it is combinable)."""
+        if not combine_name:
+            return 0
+        if salt is None:
+            salt = self.default_salt
+        return salt if salt > 1 else 0
+
+    def _merge_salted(self, input):
+        """Add a step that combines the values of keys in salted input.
+
+        Values of a hot key in salted map output are spread across several
+        splits, so they are combined (with the combiner of the map operation)
+        and repartitioned with the partition function of the map operation
+        before they are reduced.  The step is skipped when it runs if no map
+        task actually salted a key.  Returns the dataset to reduce and the
+        new dataset (or the given input and None if it is not salted).
+        """
+        op = getattr(input, 'op', None)
+        if not getattr(op, 'salt', 0):
+            return input, None
+
+        combiner = getattr(self._program, op.combine_name)
+        hash_reduce = getattr(combiner, 'hash_combine', False)
+        merge_op = tasks.ReduceOperation(op.combine_name, op.part_name,
+                hash_reduce, part_args=op.part_args)
+        merged = computed_data.ComputedData(merge_op, input,
+                splits=input.splits, permanent=False,
+                format=self.default_format, serializers=input.serializers,
+                salt_merge=True)
+        self._manager.submit(merged)
+        merged._close_callback = self._manager.close_dataset
+        return merged, merged
+
+    def _set_default_format(self, kwds):
+        """Use the intermediate format for a dataset without an outdir."""
+        if self.default_format is not None:
+            kwds.setdefault('format', self.default_format)
+
+    def _partition_attr(self, parter):
+        """Returns the name and encoded keyword arguments of a partitioner.
+
+        A partitioner may be a `functools.partial` that binds keyword
+        arguments to a partition function of the program.
+        """
+        if isinstance(parter, functools.partial):
+            if parter.args:
+                raise TypeError('Partitioners may only bind keyword arguments')
+            part_name, _ = self._named_attr(parter.func)
+            return part_name, tasks.encode_part_args(parter.keywords)
+        part_name, _ = self._named_attr(parter)
+        return part_name, ''
+
     def _named_attr(self, value):
         if isinstance(value, str):
             return value, getattr(self._program, value)
@@ -275,6 +458,7 @@ def job_process(program_class, opts, args, default_dir, pipe,
         bucket_proc.daemon = True
         bucket_proc.start()
         url_converter = bucket.URLConverter('', bucket_port, default_dir)
+        fileformats.set_url_converter(url_converter)
     else:
         bucket_port = None
         url_converter = None
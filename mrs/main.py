@@ -322,6 +322,33 @@ class TaskRunnerParams(ParamObj):
             doc='Maximum number of tolerable failures per task'),
         max_sort_size=Param(default=100, type='int',
             doc='Maximum amount of data (in MB) to sort in RAM'),
+        map_buffer_size=Param(default=100, type='int',
+            doc='Maximum amount of map output (in MB) to combine in RAM'),
+        sort_map_output=Param(type='bool',
+            doc='Sort map output so that reduce tasks merge instead of sort'),
+        merge_factor=Param(default=100, type='int',
+            doc='Maximum number of sorted runs to merge at once'),
+        hot_key_salt=Param(default=0, type='int',
+            doc='Number of splits to spread each hot key across (for map'
+            ' output with a combiner)'),
+        input_split_size=Param(default=0, type='int',
+            doc='Size (in MB) of the byte ranges that large text input files'
+            ' are divided into (0 to read each file in one task)'),
+        input_pack_size=Param(default=0, type='int',
+            doc='Size (in MB) of the groups that small input files are packed'
+            ' into (0 to read each file in its own task)'),
+        intermediate_format=Param(default='',
+            doc="File extension of the format for intermediate data"
+            " (e.g., 'mrsc' for block-compressed files)"),
+        block_codec=Param(default='zlib',
+            doc="Codec for block-compressed files: 'zlib', 'bz2', or 'lzma'"),
+        block_level=Param(default=1, type='int',
+            doc='Compression level for block-compressed files'),
+        block_size=Param(default=256, type='int',
+            doc='Size (in KB) of the blocks of block-compressed files'),
+        auto_serializers=Param(type='bool',
+            doc='Infer compact serializers for output without serializers'
+            ' (instead of pickling it)'),
         )
 
 
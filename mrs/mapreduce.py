@@ -22,6 +22,9 @@ to create much more complex programs.
 
 from __future__ import division, print_function
 
+import bisect
+from collections import namedtuple
+import functools
 import hashlib
 import sys
 
@@ -31,6 +34,7 @@ from .version import __version__
 
 ITERATIVE_QMAX = 10
 RAND_OFFSET_SHIFT = 64
+BATCH_SIZE = 1000
 
 DEFAULT_USAGE = (""
 """%prog [OPTION]... INPUT_FILE... OUTPUT_DIR
@@ -42,6 +46,98 @@ separately for each implementation."""
 )
 
 
+def hash_combiner(f):
+    """A decorator declaring that a combiner may use a hash table.
+
+    A hash combiner must be associative and commutative: it must produce the
+    same result no matter how the values for a key are grouped or ordered,
+    and it must be safe to apply it again to its own output (as with sums,
+    counts, or maxima).  Map tasks then aggregate map output in a bounded
+    dictionary instead of sorting it, so keys must be hashable.
+    """
+    f.hash_combine = True
+    return f
+
+
+def hash_reducer(f):
+    """A decorator declaring that a reducer does not need keys in order.
+
+    Reduce tasks then group their input with a hash table instead of sorting
+    it, spilling hash partitions to local disk if the table outgrows
+    --mrs-max-sort-size.  The reducer sees keys in no particular order, so
+    keys must be hashable.  See also the `hash_reduce` parameter of
+    `reduce_data` and `reducemap_data`.
+    """
+    f.hash_reduce = True
+    return f
+
+
+def batch_mapper(f=None, size=BATCH_SIZE):
+    """A decorator declaring that a mapper takes batches of input pairs.
+
+    Instead of being called once for each key and value, a batch mapper is
+    called with a list of up to `size` keys and a parallel list of values.
+    It returns an iterable of output (key, value) pairs or a `Batch` of
+    parallel key and value sequences (such as NumPy arrays), which is
+    unpacked in bulk.  This amortizes per-record overhead for mappers that
+    vectorize their work::
+
+        @mrs.batch_mapper(size=10000)
+        def map(self, keys, values):
+            counts = numpy.bincount(numpy.asarray(values) % 10)
+            return mrs.Batch(numpy.arange(10), counts)
+
+    The decorator may be used with or without arguments, and the size may
+    be given positionally (as in ``@mrs.batch_mapper(10000)``).
+    """
+    if not callable(f):
+        if f is not None:
+            size = f
+        return functools.partial(batch_mapper, size=size)
+    f.batch_size = size
+    return f
+
+
+def batch_reducer(f=None, size=BATCH_SIZE, arrays=False):
+    """A decorator declaring that a reducer takes batches of groups.
+
+    Instead of being called once for each key with an iterator over its
+    values, a batch reducer is called with a list of up to `size` (key,
+    values) pairs, where each `values` is a list.  If `arrays` is True and
+    the values have a primitive serializer (see `make_primitive_serializer`),
+    each `values` is instead a NumPy array.  Like a batch mapper, it returns
+    an iterable of output (key, value) pairs or a `Batch`::
+
+        @mrs.batch_reducer(arrays=True)
+        def reduce(self, groups):
+            keys = [key for key, values in groups]
+            sums = [values.sum() for key, values in groups]
+            return mrs.Batch(keys, sums)
+
+    NumPy scalars (such as the sums above) in the output of an array reducer
+    are converted to Python objects, so that they are serialized like the
+    values of other reducers.
+
+    The decorator may be used with or without arguments, and the size may
+    be given positionally (as in ``@mrs.batch_reducer(100)``).
+    """
+    if not callable(f):
+        if f is not None:
+            size = f
+        return functools.partial(batch_reducer, size=size, arrays=arrays)
+    f.batch_size = size
+    f.batch_arrays = arrays
+    return f
+
+
+Batch = namedtuple('Batch', ('keys', 'values'))
+Batch.__doc__ = """Parallel sequences of keys and values returned by a batch function.
+
+Sequences with a `tolist` method (such as NumPy arrays) are converted to
+lists of Python objects before the pairs are serialized.
+"""
+
+
 class MapReduce(object):
     """MapReduce program definition.
 
@@ -209,6 +305,19 @@ class MapReduce(object):
         """
         return int(key) % n
 
+    def range_partition(self, key, serialized_key, n, boundaries=()):
+        """A partition function that assigns contiguous key ranges to splits.
+
+        The sorted `boundaries` divide the key space into len(boundaries) + 1
+        ranges, and keys in each range go to the same split, so the splits
+        are in key order.  Boundaries are normally computed by sampling with
+        `job.range_partitioner`, which binds them to this function.  If `n`
+        differs from the number of ranges, the ranges are spread across the
+        `n` splits in order.
+        """
+        index = bisect.bisect_right(boundaries, key)
+        return index * n // (len(boundaries) + 1)
+
     # The default partition function is md5_partition:
     partition = md5_partition
 
@@ -261,6 +370,10 @@ class MapReduce(object):
     raw_serializer = serializers.raw_serializer
     int_serializer = serializers.int_serializer
     str_serializer = serializers.str_serializer
+    ordered_int_serializer = serializers.ordered_int_serializer
+    ordered_uint_serializer = serializers.ordered_uint_serializer
+    ordered_float_serializer = serializers.ordered_float_serializer
+    numpy_serializer = serializers.numpy_serializer
 
 
 # May be deprecated soon:
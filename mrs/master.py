@@ -155,7 +155,7 @@ class MasterRunner(runner.TaskRunner):
                     dataset_id, task_index = assignment
                     self.task_lost(dataset_id, task_index)
 
-        for slave, dataset_id, source, urls in results:
+        for slave, dataset_id, source, urls, stats in results:
             try:
                 self.result_maps[dataset_id].add(slave, source)
             except KeyError:
@@ -165,7 +165,7 @@ class MasterRunner(runner.TaskRunner):
             # Note: if this is the last task in the dataset, this will wake
             # up datasets.  Thus this happens _after_ slaves are added to
             # the idle_slaves set.
-            success = self.task_done(dataset_id, source, urls)
+            success = self.task_done(dataset_id, source, urls, stats)
             if not success:
                 logger.info('Ignoring a redundant result (%s, %s).' %
                         (dataset_id, source))
@@ -229,7 +229,9 @@ class MasterRunner(runner.TaskRunner):
         return tasklist
 
     def remove_dataset(self, ds):
-        if isinstance(ds, computed_data.ComputedData):
+        # A skipped dataset (see `TaskRunner.skip_salt_merge`) has no results.
+        if (isinstance(ds, computed_data.ComputedData) and
+                ds.id in self.result_maps):
             delete = not ds.permanent
             slave_source_list = self.result_maps[ds.id].all()
             self.remove_sources(ds.id, slave_source_list, delete)
@@ -353,17 +355,18 @@ class MasterInterface(object):
 
     @http.uses_host
     def xmlrpc_done(self, slave_id, dataset_id, source, urls, cookie,
-            host=None):
+            stats=None, host=None):
         """Slave is done with the task it was working on.
 
-        The output is available in the list of urls.
+        The output is available in the list of urls.  The optional stats
+        describe the output (see `Task.outstats`).
         """
         slave = self.slaves.get_slave(slave_id, cookie)
         if slave is not None:
             logger.debug('Slave %s reported completion of task: %s, %s'
                     % (slave_id, dataset_id, source))
             slave.update_timestamp()
-            self.slaves.slave_result(slave, dataset_id, source, urls)
+            self.slaves.slave_result(slave, dataset_id, source, urls, stats)
             return True
         else:
             logger.error('Invalid slave reported done (host %s, id %s).'
@@ -763,7 +766,7 @@ class Slaves(object):
 
         self.trigger_sched()
 
-    def slave_result(self, slave, dataset_id, task_index, urls):
+    def slave_result(self, slave, dataset_id, task_index, urls, stats=None):
         """Called when a slave reports a successfully completed assignment.
 
         Note that in the case of retried timeouts, this may be called multiple
@@ -771,7 +774,8 @@ class Slaves(object):
         """
         success = slave.clear_assignment((dataset_id, task_index))
         if success:
-            self._results.append((slave, dataset_id, task_index, urls))
+            self._results.append((slave, dataset_id, task_index, urls,
+                stats))
             self._changed_slaves.append(slave)
             self.trigger_sched()
         else:
@@ -41,6 +41,11 @@ if not PY3:
 
 INITIAL_PEON_THREADS = 4
 PROGRESS_INTERVAL = 0.25
+# A split is reported as skewed if it is SKEW_FACTOR times the mean size and
+# at least SKEW_MIN_BYTES.
+SKEW_FACTOR = 2
+SKEW_MIN_BYTES = 1024 * 1024
+HOT_KEYS_LOGGED = 5
 
 
 class BaseRunner(object):
@@ -400,7 +405,8 @@ class TaskRunner(BaseRunner):
         tasklist.make_tasks(done_tasks, backlink_tasks, incomplete_sources)
         return tasklist
 
-    def task_done(self, dataset_id, task_index, outurls, backlinked=False):
+    def task_done(self, dataset_id, task_index, outurls, stats=None,
+            backlinked=False):
         """Report that the given source of the given dataset is computed.
 
         Returns False if the task has already been reported as done (duplicate
@@ -411,6 +417,8 @@ class TaskRunner(BaseRunner):
             task_index: integer id of the task that produced the data
             outurls: list of (number, string) pairs representing the split and
                 url of the outputs.
+            stats: optional dict of statistics about the outputs (see
+                `Task.outstats`).
         """
         tasklist = self.tasklists[dataset_id]
         if tasklist.is_task_done(task_index):
@@ -419,6 +427,8 @@ class TaskRunner(BaseRunner):
         if not backlinked:
             self.task_counter += 1
         tasklist.task_done(task_index)
+        if stats:
+            tasklist.add_stats(stats)
 
         dataset = self.datasets[dataset_id]
         for split, url in outurls:
@@ -445,7 +455,7 @@ class TaskRunner(BaseRunner):
                     if forward_ds_id not in self.tasklists:
                         continue
                     self.task_done(forward_ds_id, task_index, outurls,
-                            backlinked=True)
+                            stats, backlinked=True)
 
         self._wakeup_dependents(dataset_id)
         return True
@@ -462,6 +472,7 @@ class TaskRunner(BaseRunner):
 
     def dataset_done(self, dataset):
         self.runnable_datasets.remove(dataset)
+        self.tasklists[dataset.id].report_skew()
         super(TaskRunner, self).dataset_done(dataset)
 
     def _wakeup_dependents(self, dataset_id):
@@ -489,7 +500,8 @@ class TaskRunner(BaseRunner):
                     (fraction_complete == 1 or dep_ds.async_start)):
                 wakeup_count += 1
                 self.pending_datasets.remove(dep_ds)
-                self.runnable_datasets.append(dep_ds)
+                if not self.skip_salt_merge(dep_ds):
+                    self.runnable_datasets.append(dep_ds)
 
         if wakeup_count and fraction_complete < 1:
             logger.info('Wakeup children of %s at %.2f complete' %
@@ -508,10 +520,36 @@ class TaskRunner(BaseRunner):
         if (input_ds is None) or getattr(input_ds, 'computing', False):
             self.pending_datasets.add(ds)
             return False
+        elif self.skip_salt_merge(ds):
+            return False
         else:
             self.runnable_datasets.append(ds)
             return True
 
+    def skip_salt_merge(self, ds):
+        """Skip a salt merge dataset if no keys were salted in its input.
+
+        The input buckets are passed through as the dataset's buckets, and
+        the dataset stays a dependent of its input until it is removed, so
+        that the input files are not deleted while they are still in use.
+        Returns whether the dataset was skipped.
+        """
+        if not ds.salt_merge:
+            return False
+        input_tasklist = self.tasklists.get(ds.input_id)
+        if input_tasklist is None or input_tasklist.salted_keys():
+            return False
+
+        logger.info('Skipping dataset (no keys were salted): %s' % ds.id)
+        input_ds = self.datasets[ds.input_id]
+        for split in range(input_ds.splits):
+            ds.extend_split(split, input_ds[:, split])
+        ds.notify_urls_known()
+        ds.computation_done()
+        self.send_dataset_response(ds)
+        self._wakeup_dependents(ds.id)
+        return True
+
     def schedule(self):
         raise NotImplementedError
 
@@ -575,6 +613,9 @@ class TaskList(object):
         self._num_tasks = 0
         self._last_progress_report = 0.0
         self._failures = collections.defaultdict(int)
+        self._split_bytes = collections.defaultdict(float)
+        self._key_counts = collections.defaultdict(float)
+        self._salted_keys = 0
 
     def make_tasks(self, done_tasks, backlink_tasks, incomplete_sources):
         """Generate tasks for the given dataset, adding them to ready_tasks.
@@ -648,6 +689,46 @@ class TaskList(object):
         except IndexError:
             return None
 
+    def add_stats(self, stats):
+        """Accumulate output statistics reported by a completed task."""
+        for split, nbytes in stats.get('split_bytes', ()):
+            self._split_bytes[split] += nbytes
+        for label, count in stats.get('hot_keys', ()):
+            self._key_counts[label] += count
+        self._salted_keys += stats.get('salted_keys', 0)
+
+    def salted_keys(self):
+        """Returns the number of keys salted by the tasks (summed)."""
+        return self._salted_keys
+
+    def split_bytes(self):
+        """Returns a dict mapping each split to its total size in bytes."""
+        return dict(self._split_bytes)
+
+    def hot_keys(self, n=HOT_KEYS_LOGGED):
+        """Returns (label, count) pairs for the most frequent output keys.
+
+        Counts are summed over the sketches reported by each task, so they
+        are lower bounds.
+        """
+        items = sorted(self._key_counts.items(), key=lambda x: x[1],
+                reverse=True)
+        return items[:n]
+
+    def report_skew(self):
+        """Log a warning if one output split is much larger than average."""
+        splits = self.dataset.splits
+        if splits < 2 or not self._split_bytes:
+            return
+        mean = sum(self._split_bytes.values()) / splits
+        split, nbytes = max(self._split_bytes.items(), key=lambda x: x[1])
+        if nbytes >= SKEW_MIN_BYTES and nbytes > SKEW_FACTOR * mean:
+            hot_keys = ', '.join('%s (%d)' % (label, count)
+                    for label, count in self.hot_keys())
+            logger.warning('Output of dataset %s is skewed: split %s has %d'
+                    ' bytes (mean %d).  Frequent keys: %s'
+                    % (self.dataset.id, split, nbytes, mean, hot_keys))
+
     def task_failed(self, task_index):
         """Push back a failed task.
 
@@ -700,7 +781,7 @@ class MockParallelRunner(TaskRunner, worker.WorkerManager):
 
     def worker_success(self, r):
         """Called when a worker sends a WorkerSuccess."""
-        self.task_done(r.dataset_id, r.task_index, r.outurls)
+        self.task_done(r.dataset_id, r.task_index, r.outurls, r.stats)
         self.schedule()
 
     def worker_failure(self, r):
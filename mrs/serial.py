@@ -21,6 +21,7 @@ import threading
 import traceback
 
 from . import runner
+from . import worker
 
 import logging
 logger = logging.getLogger('mrs')
@@ -36,6 +37,7 @@ class SerialRunner(runner.BaseRunner):
     def run(self):
         try:
             self.program = self.program_class(self.opts, self.args)
+            worker.set_format_defaults(self.opts)
         except Exception as e:
             logger.critical('Exception while instantiating the program: %s'
                     % traceback.format_exc())
@@ -17,6 +17,8 @@ from __future__ import division, print_function
 
 from collections import namedtuple
 import functools
+from itertools import starmap
+from operator import methodcaller
 import struct
 
 try:
@@ -27,6 +29,51 @@ except ImportError:
 
 Serializer = namedtuple('Serializer', ('dumps', 'loads'))
 
+
+class BulkSerializer(Serializer):
+    """A serializer that can also convert lists of objects at once.
+
+    The optional `dumps_many` function takes a sequence of objects and
+    returns a list of bytes objects, and `loads_many` does the reverse.  Bulk
+    functions let readers and writers convert a block of records with a
+    single call instead of one call per key or value (see
+    `dumps_many_functions` and `loads_many_functions`).
+    """
+    def __new__(cls, dumps, loads, dumps_many=None, loads_many=None):
+        self = super(BulkSerializer, cls).__new__(cls, dumps, loads)
+        self.dumps_many = dumps_many
+        self.loads_many = loads_many
+        return self
+
+
+class OrderedSerializer(BulkSerializer):
+    """A serializer whose byte order matches the order of its values.
+
+    Keys serialized with an ordered serializer can be sorted and merged as
+    raw bytes without being deserialized.
+    """
+    ordered = True
+
+
+class PrimitiveSerializer(BulkSerializer):
+    """A serializer for fixed-width values of a single struct type.
+
+    The `format` attribute is the struct format string, which lets batch
+    reducers hold values in arrays of the corresponding type.
+    """
+    def __new__(cls, dumps, loads, format=None, dumps_many=None,
+            loads_many=None):
+        self = super(PrimitiveSerializer, cls).__new__(cls, dumps, loads,
+                dumps_many, loads_many)
+        self.format = format
+        return self
+
+
+def is_ordered(serializer):
+    """Report whether bytes from the serializer sort in value order."""
+    return getattr(serializer, 'ordered', False)
+
+
 def output_serializers(**kwargs):
     """A decorator to specify key and value serializers for map or reduce
     functions.
@@ -123,6 +170,45 @@ def dumps_functions(serializers):
     return dumps_key, dumps_value
 
 
+def dumps_many_functions(serializers):
+    """Return a pair of bulk dumps functions (for keys and values).
+
+    Each function takes a sequence of objects and returns a list of bytes.
+    It is the serializer's `dumps_many` function if it has one, or else it
+    calls `dumps` (or pickle) on each object.  A function is None if the
+    objects are already bytes.
+    """
+    return tuple(_many(dumps, s, 'dumps_many') for dumps, s in
+            zip(dumps_functions(serializers), _serializer_pair(serializers)))
+
+
+def loads_many_functions(serializers):
+    """Return a pair of bulk loads functions (for keys and values).
+
+    Each function takes a sequence of bytes and returns a list of objects
+    (see `dumps_many_functions`).
+    """
+    return tuple(_many(loads, s, 'loads_many') for loads, s in
+            zip(loads_functions(serializers), _serializer_pair(serializers)))
+
+
+def _serializer_pair(serializers):
+    if serializers is None:
+        return None, None
+    else:
+        return serializers.key_s, serializers.value_s
+
+
+def _many(f, serializer, attr):
+    """Returns the bulk version of the given per-object function."""
+    if f is None:
+        return None
+    many = getattr(serializer, attr, None)
+    if many is not None:
+        return many
+    return lambda objs: list(map(f, objs))
+
+
 def loads_functions(serializers):
     """Return a pair of loads functions (for the key and value).
 
@@ -154,7 +240,7 @@ def loads_functions(serializers):
 ###############################################################################
 # bytes <-> bytes (no-op)
 
-raw_serializer = Serializer(None, None)
+raw_serializer = OrderedSerializer(None, None)
 
 ###############################################################################
 # str <-> bytes
@@ -165,7 +251,15 @@ def str_dumps(s):
 def str_loads(b):
     return b.decode('utf-8')
 
-str_serializer = Serializer(str_dumps, str_loads)
+def str_dumps_many(strs):
+    return list(map(methodcaller('encode', 'utf-8'), strs))
+
+def str_loads_many(bs):
+    return list(map(methodcaller('decode', 'utf-8'), bs))
+
+# UTF-8 bytes sort in code point order.
+str_serializer = OrderedSerializer(str_dumps, str_loads, str_dumps_many,
+        str_loads_many)
 
 ###############################################################################
 # int <-> bytes
@@ -176,7 +270,15 @@ def int_dumps(i):
 def int_loads(b):
     return int(b.decode('utf-8'))
 
-int_serializer = Serializer(int_dumps, int_loads)
+def int_dumps_many(ints):
+    # Decimal digits never contain spaces, so they can be split apart again.
+    return ' '.join(map(str, ints)).encode('ascii').split()
+
+def int_loads_many(bs):
+    return list(map(int, bs))
+
+int_serializer = BulkSerializer(int_dumps, int_loads, int_dumps_many,
+        int_loads_many)
 
 ###############################################################################
 # struct <-> bytes
@@ -193,7 +295,25 @@ def make_primitive_serializer(format):
     def loads(b):
         return structure.unpack(b)[0]
 
-    return Serializer(structure.pack, loads)
+    def dumps_many(values):
+        return list(map(structure.pack, values))
+
+    if format[:1] in '@=<>!':
+        prefix, code = format[:1], format[1:]
+    else:
+        prefix, code = '', format
+    def loads_many(bs):
+        # Unpack all of the values at once with a repeated format.  The code
+        # is repeated rather than counted, since a count such as '4s' would
+        # otherwise be read as part of the code.
+        data = b''.join(bs)
+        if len(data) != structure.size * len(bs):
+            raise struct.error('Values must have %s bytes each'
+                    % structure.size)
+        return list(struct.unpack(prefix + code * len(bs), data))
+
+    return PrimitiveSerializer(structure.pack, loads, format, dumps_many,
+            loads_many)
 
 def make_struct_serializer(format):
     """Create a serializer from a struct format string.
@@ -206,7 +326,366 @@ def make_struct_serializer(format):
     def dumps(values):
         return structure.pack(*values)
 
-    return Serializer(dumps, structure.unpack)
+    def dumps_many(tuples):
+        return list(starmap(structure.pack, tuples))
+
+    if hasattr(structure, 'iter_unpack'):
+        def loads_many(bs):
+            data = b''.join(bs)
+            if len(data) != structure.size * len(bs):
+                raise struct.error('Values must have %s bytes each'
+                        % structure.size)
+            return list(structure.iter_unpack(data))
+    else:
+        # Python 2 does not support iter_unpack.
+        def loads_many(bs):
+            return list(map(structure.unpack, bs))
+
+    return BulkSerializer(dumps, structure.unpack, dumps_many, loads_many)
+
+###############################################################################
+# Order-preserving serializers
+
+_uint64 = struct.Struct('>Q')
+_SIGN_BIT = 1 << 63
+_ALL_BITS = (1 << 64) - 1
+
+def ordered_uint_dumps(i):
+    return _uint64.pack(i)
+
+def ordered_uint_loads(b):
+    return _uint64.unpack(b)[0]
+
+ordered_uint_serializer = OrderedSerializer(ordered_uint_dumps,
+        ordered_uint_loads)
+
+def ordered_int_dumps(i):
+    # Offsetting by the sign bit maps [-2**63, 2**63) onto [0, 2**64).
+    return _uint64.pack(i + _SIGN_BIT)
+
+def ordered_int_loads(b):
+    return _uint64.unpack(b)[0] - _SIGN_BIT
+
+ordered_int_serializer = OrderedSerializer(ordered_int_dumps,
+        ordered_int_loads)
+
+_float64 = struct.Struct('>d')
+
+def ordered_float_dumps(x):
+    if x == 0:
+        # -0.0 equals 0.0, so they must be grouped as the same key.
+        x = 0.0
+    bits = _uint64.unpack(_float64.pack(x))[0]
+    # Negative numbers have all bits flipped (so larger magnitudes sort
+    # first), and positive numbers have the sign bit set.
+    if bits & _SIGN_BIT:
+        bits ^= _ALL_BITS
+    else:
+        bits |= _SIGN_BIT
+    return _uint64.pack(bits)
+
+def ordered_float_loads(b):
+    bits = _uint64.unpack(b)[0]
+    if bits & _SIGN_BIT:
+        bits ^= _SIGN_BIT
+    else:
+        bits ^= _ALL_BITS
+    return _float64.unpack(_uint64.pack(bits))[0]
+
+ordered_float_serializer = OrderedSerializer(ordered_float_dumps,
+        ordered_float_loads)
+
+ordered_str_serializer = str_serializer
+
+def make_ordered_tuple_serializer(*component_serializers):
+    """Create an order-preserving serializer for fixed-length tuples.
+
+    Each of the given serializers must be ordered and is used for the
+    corresponding element of the tuple.  Tuples sort first by their first
+    element, then by their second, and so on.  Every element but the last is
+    escaped (each null byte is followed by 0xFF) and terminated by two null
+    bytes, so that a shorter element sorts before any longer element that it
+    is a prefix of.
+
+    >>> s = make_ordered_tuple_serializer(ordered_str_serializer,
+    ...         ordered_int_serializer)
+    >>> s.loads(s.dumps((u'a', -3))) == (u'a', -3)
+    True
+    >>> s.dumps((u'a', 5)) < s.dumps((u'a\\x00', -5)) < s.dumps((u'b', -5))
+    True
+    >>>
+    """
+    for component in component_serializers:
+        if not is_ordered(component):
+            raise TypeError('Tuple components must be ordered serializers')
+    dumps_list = [s.dumps for s in component_serializers]
+    loads_list = [s.loads for s in component_serializers]
+    last = len(component_serializers) - 1
+
+    def dumps(values):
+        if len(values) != len(dumps_list):
+            raise ValueError('Wrong number of tuple elements')
+        parts = []
+        for i, (dumps, value) in enumerate(zip(dumps_list, values)):
+            b = value if dumps is None else dumps(value)
+            if i < last:
+                b = b.replace(b'\x00', b'\x00\xff') + b'\x00\x00'
+            parts.append(b)
+        return b''.join(parts)
+
+    def loads(b):
+        values = []
+        pos = 0
+        for i, loads in enumerate(loads_list):
+            if i < last:
+                chunks = []
+                while True:
+                    end = b.index(b'\x00', pos)
+                    chunks.append(b[pos:end])
+                    marker = b[end + 1:end + 2]
+                    pos = end + 2
+                    if marker == b'\x00':
+                        break
+                    chunks.append(b'\x00')
+                component = b''.join(chunks)
+            else:
+                component = b[pos:]
+            values.append(component if loads is None else loads(component))
+        return tuple(values)
+
+    return OrderedSerializer(dumps, loads)
+
+###############################################################################
+# Inferred schemas <-> bytes
+
+class SchemaError(ValueError):
+    """An object does not match the schema of an inferred serializer."""
+
+_int_types = (int, type(2 ** 64))
+_text_type = type(u'')
+_schema_int = struct.Struct('<q')
+_schema_float = struct.Struct('<d')
+_schema_len = struct.Struct('<I')
+
+def infer_schema(objs):
+    """Returns the schema shared by all of the given objects (or None).
+
+    A schema is a short string: 'i' for ints that fit in 64 bits, 'f' for
+    floats, 's' for strs, 'b' for bytes, and a parenthesized sequence of
+    schemas for a tuple.  None is returned if the objects are of different
+    types or of any other type.
+
+    >>> infer_schema([(1, u'a'), (2, u'bc')])
+    '(is)'
+    >>> infer_schema([1, 2.5]) is None
+    True
+    >>>
+    """
+    schemas = set(map(_schema_of, objs))
+    if len(schemas) == 1:
+        return schemas.pop()
+    return None
+
+def _schema_of(obj):
+    t = type(obj)
+    if t in _int_types:
+        if -2 ** 63 <= obj < 2 ** 63:
+            return 'i'
+    elif t is float:
+        return 'f'
+    elif t is _text_type:
+        return 's'
+    elif t is bytes:
+        return 'b'
+    elif t is tuple:
+        schemas = [_schema_of(x) for x in obj]
+        if None not in schemas:
+            return '(%s)' % ''.join(schemas)
+    return None
+
+_schema_serializers = {}
+
+def schema_serializer(schema):
+    """Returns a BulkSerializer for objects with the given schema.
+
+    Integers and floats are packed in 8 bytes, strs are encoded with UTF-8,
+    and bytes are unchanged.  The elements of a tuple are concatenated, and
+    each element that is not of fixed width is preceded by its length.  The
+    dumps functions raise SchemaError for objects that do not match.
+    """
+    try:
+        return _schema_serializers[schema]
+    except KeyError:
+        pass
+    dumps, loads, width = _schema_functions(schema)
+    if schema == 'i':
+        dumps_many, loads_many = _int64_dumps_many, _int64_loads_many
+    else:
+        dumps_many = _many(dumps, None, 'dumps_many')
+        loads_many = _many(loads, None, 'loads_many')
+    serializer = BulkSerializer(dumps, loads, dumps_many, loads_many)
+    _schema_serializers[schema] = serializer
+    return serializer
+
+def _int64_dumps_many(ints):
+    for i in ints:
+        if type(i) not in _int_types:
+            raise SchemaError('Expected an int: %r' % (i,))
+    try:
+        return list(map(_schema_int.pack, ints))
+    except struct.error:
+        raise SchemaError('Int out of range')
+
+def _int64_loads_many(bs):
+    data = b''.join(bs)
+    if len(data) != 8 * len(bs):
+        raise struct.error('Values must have 8 bytes each')
+    return list(struct.unpack('<%sq' % len(bs), data))
+
+def _schema_functions(schema):
+    """Returns dumps and loads functions and the fixed width (or None)."""
+    if schema == 'i':
+        def dumps(i):
+            if type(i) not in _int_types:
+                raise SchemaError('Expected an int: %r' % (i,))
+            try:
+                return _schema_int.pack(i)
+            except struct.error:
+                raise SchemaError('Int out of range: %r' % (i,))
+        def loads(b):
+            return _schema_int.unpack(b)[0]
+        return dumps, loads, _schema_int.size
+    elif schema == 'f':
+        def dumps(x):
+            if type(x) is not float:
+                raise SchemaError('Expected a float: %r' % (x,))
+            return _schema_float.pack(x)
+        def loads(b):
+            return _schema_float.unpack(b)[0]
+        return dumps, loads, _schema_float.size
+    elif schema == 's':
+        def dumps(s):
+            if type(s) is not _text_type:
+                raise SchemaError('Expected a str: %r' % (s,))
+            try:
+                return s.encode('utf-8')
+            except UnicodeEncodeError:
+                # For example, a str with a lone surrogate.
+                raise SchemaError('Str is not valid UTF-8: %r' % (s,))
+        return dumps, str_loads, None
+    elif schema == 'b':
+        def dumps(b):
+            if type(b) is not bytes:
+                raise SchemaError('Expected bytes: %r' % (b,))
+            return b
+        return dumps, bytes, None
+    elif schema[:1] == '(' and schema[-1:] == ')':
+        return _tuple_schema_functions(_split_schema(schema[1:-1]))
+    raise ValueError('Invalid schema: %r' % schema)
+
+def _split_schema(schema):
+    """Splits the schema of a tuple's elements into a list of schemas."""
+    parts = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(schema):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        if depth == 0:
+            parts.append(schema[start:i + 1])
+            start = i + 1
+    if depth:
+        raise ValueError('Invalid schema: %r' % schema)
+    return parts
+
+def _tuple_schema_functions(schemas):
+    elements = [_schema_functions(s) for s in schemas]
+    n = len(elements)
+    if all(s in ('i', 'f') for s in schemas):
+        # Numbers are packed with a single struct.
+        structure = struct.Struct('<' + ''.join('q' if s == 'i' else 'd'
+            for s in schemas))
+        types = [_int_types if s == 'i' else (float,) for s in schemas]
+        def dumps(t):
+            if type(t) is not tuple or len(t) != n:
+                raise SchemaError('Expected a tuple of length %s: %r'
+                        % (n, t))
+            for x, allowed in zip(t, types):
+                if type(x) not in allowed:
+                    raise SchemaError('Unexpected type in tuple: %r' % (t,))
+            try:
+                return structure.pack(*t)
+            except struct.error:
+                raise SchemaError('Int out of range: %r' % (t,))
+        def loads(b):
+            return structure.unpack(b)
+        return dumps, loads, structure.size
+
+    def dumps(t):
+        if type(t) is not tuple or len(t) != n:
+            raise SchemaError('Expected a tuple of length %s: %r' % (n, t))
+        parts = []
+        for (f, _, width), x in zip(elements, t):
+            data = f(x)
+            if width is None:
+                parts.append(_schema_len.pack(len(data)))
+            parts.append(data)
+        return b''.join(parts)
+    def loads(b):
+        values = []
+        pos = 0
+        for _, f, width in elements:
+            if width is None:
+                width = _schema_len.unpack_from(b, pos)[0]
+                pos += _schema_len.size
+            values.append(f(b[pos:pos + width]))
+            pos += width
+        return tuple(values)
+    return dumps, loads, None
+
+###############################################################################
+# NumPy array <-> bytes
+
+# Header of a serialized array: the length of the dtype string and the number
+# of dimensions.  The dtype string and the shape (as 64-bit ints) follow, and
+# the raw data starts at the next multiple of NUMPY_ALIGNMENT bytes.
+_numpy_header = struct.Struct('<BB')
+NUMPY_ALIGNMENT = 8
+
+def numpy_dumps(array):
+    """Dump a NumPy array to a header followed by its raw data."""
+    # NumPy is imported lazily so that other programs never load it.
+    import numpy
+    array = numpy.asarray(array)
+    if not array.flags.c_contiguous:
+        array = array.copy()
+    dtype = array.dtype
+    if dtype.hasobject or dtype.fields is not None:
+        raise ValueError('numpy_serializer does not support dtype %s' % dtype)
+    dtype_str = dtype.str.encode('ascii')
+    header = (_numpy_header.pack(len(dtype_str), array.ndim) + dtype_str +
+            struct.pack('<%sQ' % array.ndim, *array.shape))
+    padding = -len(header) % NUMPY_ALIGNMENT
+    return b''.join((header, b'\0' * padding, array))
+
+def numpy_loads(b):
+    """Load a NumPy array that shares the memory of the given bytes.
+
+    Arrays loaded from immutable bytes are read-only.
+    """
+    import numpy
+    dtype_len, ndim = _numpy_header.unpack_from(b)
+    pos = _numpy_header.size
+    dtype = numpy.dtype(bytes(b[pos:pos + dtype_len]).decode('ascii'))
+    pos += dtype_len
+    shape = struct.unpack_from('<%sQ' % ndim, b, pos)
+    pos += 8 * ndim
+    pos += -pos % NUMPY_ALIGNMENT
+    return numpy.frombuffer(b, dtype, offset=pos).reshape(shape)
+
+numpy_serializer = Serializer(numpy_dumps, numpy_loads)
 
 ###############################################################################
 # Protocol Buffer <-> bytes
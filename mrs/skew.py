@@ -0,0 +1,205 @@
+# Mrs
+# Copyright 2008-2012 Brigham Young University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Detection and splitting of hot keys in partitioned output."""
+
+from __future__ import division, print_function
+
+from collections import defaultdict
+
+# Number of counters kept by the heavy-hitter sketch of each task.
+HEAVY_HITTER_CAPACITY = 64
+# A key is hot once it holds at least this fraction of an even share of a
+# split (of the records seen so far) and has at least HOT_KEY_MIN_COUNT
+# records.
+HOT_KEY_SHARE = 0.5
+HOT_KEY_MIN_COUNT = 1000
+# Maximum length of the key labels reported to the master.
+KEY_LABEL_LENGTH = 80
+# If hot keys are only reported (not salted), one of every
+# KEY_SAMPLE_INTERVAL keys is counted.
+KEY_SAMPLE_INTERVAL = 16
+
+
+class HeavyHitters(object):
+    """Find the most frequent items of a stream in bounded memory.
+
+    This is the Misra-Gries algorithm.  At most `capacity` counters are
+    kept.  Any item that makes up more than 1 / (capacity + 1) of the stream
+    has a counter, and each count underestimates the true frequency by at
+    most total / (capacity + 1).
+
+    >>> hh = HeavyHitters(2)
+    >>> for item in 'abacadaeaf':
+    ...     hh.add(item)
+    >>> hh.most_common(1)
+    [('a', 3)]
+    >>>
+    """
+    def __init__(self, capacity=HEAVY_HITTER_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0
+
+    def add(self, item):
+        """Count one occurrence of the item."""
+        self.total += 1
+        counts = self.counts
+        if item in counts:
+            counts[item] += 1
+        elif len(counts) < self.capacity:
+            counts[item] = 1
+        else:
+            # Decrement every counter (the new item's count cancels out).
+            for key in list(counts):
+                count = counts[key] - 1
+                if count:
+                    counts[key] = count
+                else:
+                    del counts[key]
+
+    def estimate(self, item):
+        """Returns a lower bound on the number of occurrences of the item."""
+        return self.counts.get(item, 0)
+
+    def most_common(self, n=None):
+        """Returns a list of (item, count) pairs, most frequent first."""
+        items = sorted(self.counts.items(), key=lambda x: x[1], reverse=True)
+        return items[:n]
+
+
+class SaltingPartitioner(object):
+    """Wrap a partition function to find and spread hot keys.
+
+    Every key is counted in a `HeavyHitters` sketch, and the number of
+    records sent to each split is recorded.  If `salt` is greater than 1,
+    records of a hot key are sent round-robin to `salt` consecutive splits
+    (starting with the split chosen by the wrapped partition function) so
+    that no single reduce task receives all of them.  Values of a salted key
+    must be combined again after they are reduced.  Since map output is
+    usually combined before it is partitioned, keys may instead be counted
+    before they are combined (see `count_keys`), and the round-robin starts
+    at an `offset` that differs for each task.
+
+    Keys are tracked by their serialized form.
+    """
+    def __init__(self, parter, salt=0, offset=0,
+            capacity=HEAVY_HITTER_CAPACITY):
+        self.parter = parter
+        self.salt = salt
+        self.offset = offset
+        self.sketch = HeavyHitters(capacity)
+        self.split_records = defaultdict(int)
+        self._salt_counters = {}
+        self._count_partitioned = True
+
+    def __call__(self, key, serialized_key, n):
+        split = self.parter(key, serialized_key, n)
+        if self._count_partitioned:
+            self.sketch.add(serialized_key)
+        if self.salt > 1 and n > 1 and self.is_hot(serialized_key, n):
+            i = self._salt_counters.get(serialized_key, self.offset)
+            self._salt_counters[serialized_key] = i + 1
+            split = (split + i % self.salt) % n
+        self.split_records[split] += 1
+        return split
+
+    def count_keys(self, pairs, dumps_key=None):
+        """Count the keys of the given pairs (instead of partitioned keys).
+
+        Yields each of the pairs, so that it can wrap an iterator over map
+        output before the output is combined.
+        """
+        self._count_partitioned = False
+        add = self.sketch.add
+        for pair in pairs:
+            if dumps_key is None:
+                add(pair[0])
+            else:
+                add(dumps_key(pair[0]))
+            yield pair
+
+    def is_hot(self, serialized_key, n):
+        """Report whether the key is hot among the records seen so far."""
+        count = self.sketch.estimate(serialized_key)
+        if count < HOT_KEY_MIN_COUNT:
+            return False
+        return count * n >= HOT_KEY_SHARE * self.sketch.total
+
+    def hot_keys(self, loads_key=None, n=None):
+        """Returns (label, count) pairs for the most frequent keys.
+
+        Each label is a printable (and possibly truncated) representation of
+        the key, which is deserialized with `loads_key` if it is given.
+        """
+        return _hot_keys(self.sketch, loads_key, n)
+
+    def salted_keys(self):
+        """Returns the number of keys that were spread across splits."""
+        return len(self._salt_counters)
+
+
+class KeySampler(object):
+    """Count a sample of the keys of a stream of pairs to report hot keys.
+
+    Only one of every `interval` keys is counted in a `HeavyHitters` sketch
+    (and serialized), and reported counts are scaled up by the interval.
+    Unlike a `SaltingPartitioner`, this does not wrap the partition function,
+    so it adds little to the cost of writing output that is not salted.
+    """
+    def __init__(self, interval=KEY_SAMPLE_INTERVAL,
+            capacity=HEAVY_HITTER_CAPACITY):
+        self.interval = interval
+        self.sketch = HeavyHitters(capacity)
+
+    def count_keys(self, pairs, dumps_key=None):
+        """Count a sample of the keys of the given pairs.
+
+        Yields each of the pairs, so that it can wrap an iterator over map
+        output.
+        """
+        add = self.sketch.add
+        interval = self.interval
+        for i, pair in enumerate(pairs):
+            if not i % interval:
+                if dumps_key is None:
+                    add(pair[0])
+                else:
+                    add(dumps_key(pair[0]))
+            yield pair
+
+    def hot_keys(self, loads_key=None, n=None):
+        """Returns (label, count) pairs for the most frequent keys.
+
+        Labels are as in `SaltingPartitioner.hot_keys`, and counts are
+        estimated from the sample.
+        """
+        return _hot_keys(self.sketch, loads_key, n, self.interval)
+
+
+def _hot_keys(sketch, loads_key=None, n=None, scale=1):
+    """Returns (label, count) pairs for the most frequent keys of a sketch."""
+    result = []
+    for serialized_key, count in sketch.most_common(n):
+        key = serialized_key
+        if loads_key is not None:
+            try:
+                key = loads_key(serialized_key)
+            except Exception:
+                pass
+        result.append((repr(key)[:KEY_LABEL_LENGTH], count * scale))
+    return result
+
+# vim: et sw=4 sts=4
@@ -198,7 +198,7 @@ class Slave(worker.WorkerManager):
             convert_url = self.url_converter.local_to_global
             outurls = [(s, convert_url(url)) for s, url in outurls]
         self.master_rpc.done(self.id, r.dataset_id, r.task_index, outurls,
-                self.cookie)
+                self.cookie, r.stats or {})
 
     def worker_failure(self, r):
         """Called when a worker sends a WorkerFailure."""
@@ -0,0 +1,164 @@
+# Mrs
+# Copyright 2008-2012 Brigham Young University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compact in-memory buffers of serialized key-value pairs."""
+
+from __future__ import division, print_function
+
+from array import array
+import struct
+import sys
+
+try:
+    array('Q')
+    OFFSET_TYPECODE = 'Q'
+except ValueError:
+    # Python 2 does not support unsigned long long arrays.
+    OFFSET_TYPECODE = 'L'
+
+# Size of a reference in a list.
+POINTER_SIZE = struct.calcsize('P')
+
+# Temporary memory used by the sort for each record: a reference and an int
+# in the sorted list of indices, and a reference to the record's sort key.
+SORT_ENTRY_OVERHEAD = 2 * POINTER_SIZE + sys.getsizeof(2 ** 40)
+
+# Memory used for each record besides the bytes of its raw key and value: the
+# raw key's object header and reference, the value's offset, and the memory
+# needed to sort it.
+RECORD_OVERHEAD = (POINTER_SIZE + sys.getsizeof(b'') +
+        array(OFFSET_TYPECODE).itemsize + SORT_ENTRY_OVERHEAD)
+
+# Number of appended keys that are deserialized together by `key_many`.
+LOAD_BATCH = 1000
+
+
+class SortBuffer(object):
+    """A buffer of raw key-value pairs with values packed into a bytearray.
+
+    Raw keys are kept in a list (they are needed as separate objects to sort
+    them), while values are appended to an arena and an array records the
+    offset where each value ends.  Sorting creates only a list of indices,
+    and the resulting order is stored in a second array.  The `nbytes` method
+    reports the memory actually allocated by the buffer plus the temporary
+    memory needed to sort it, so a memory limit on `nbytes` is a limit on
+    real bytes rather than estimated object sizes.
+
+    If a `key_many` function is given, records are sorted by the result of
+    deserializing their keys rather than by raw key.  It is called with a
+    list of raw keys and returns a list of keys.  Keys are deserialized in
+    batches of `LOAD_BATCH` as they are appended, and the (shallow) size of
+    the deserialized keys is included in `nbytes`.
+
+    >>> buf = SortBuffer()
+    >>> buf.append(b'b', b'1')
+    >>> buf.append(b'a', b'2')
+    >>> buf.sort()
+    >>> list(buf) == [(b'a', b'2'), (b'b', b'1')]
+    True
+    >>>
+    """
+    def __init__(self, key_many=None):
+        self.key_many = key_many
+        self.clear()
+
+    def clear(self):
+        """Remove all records and release their memory."""
+        self._keys = []
+        self._key_bytes = 0
+        self._values = bytearray()
+        self._offsets = array(OFFSET_TYPECODE, [0])
+        self._loaded_keys = []
+        self._loaded_bytes = 0
+        self._unloaded = 0
+        self._order = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def append(self, raw_key, raw_value):
+        """Add a serialized key-value pair to the end of the buffer."""
+        self._keys.append(raw_key)
+        self._key_bytes += len(raw_key)
+        values = self._values
+        values += raw_value
+        self._offsets.append(len(values))
+        self._order = None
+        if self.key_many is not None:
+            self._unloaded += 1
+            if self._unloaded >= LOAD_BATCH:
+                self._load_keys()
+
+    def _load_keys(self):
+        """Deserialize the keys that have not yet been loaded."""
+        loaded = self.key_many(self._keys[len(self._loaded_keys):])
+        self._loaded_keys.extend(loaded)
+        self._loaded_bytes += sum(map(sys.getsizeof, loaded))
+        self._unloaded = 0
+
+    def nbytes(self):
+        """Returns the number of bytes needed to hold and sort the buffer."""
+        n = len(self._keys)
+        return (sys.getsizeof(self._keys) + self._key_bytes +
+                n * (sys.getsizeof(b'') + SORT_ENTRY_OVERHEAD) +
+                sys.getsizeof(self._values) + sys.getsizeof(self._offsets) +
+                sys.getsizeof(self._loaded_keys) + self._loaded_bytes)
+
+    def sort(self, key=None):
+        """Sort the records by key.
+
+        Records are sorted by raw key, by deserialized key if the buffer has a
+        `key_many` function, or else by the result of calling `key` on each
+        raw key.  The sort is stable.
+        """
+        if self.key_many is not None:
+            if self._unloaded:
+                self._load_keys()
+            sort_keys = self._loaded_keys
+        elif key is None:
+            sort_keys = self._keys
+        else:
+            sort_keys = [key(raw_key) for raw_key in self._keys]
+        order = sorted(range(len(self)), key=sort_keys.__getitem__)
+        self._order = array(OFFSET_TYPECODE, order)
+
+    def __iter__(self):
+        """Iterate over (raw_key, raw_value) pairs (in sorted order if sorted).
+
+        Each raw value is copied out of the arena exactly once.
+        """
+        return self._iter_pairs(self._keys)
+
+    def loaded_pairs(self):
+        """Iterate over (key, raw_value) pairs with deserialized keys.
+
+        The keys are the ones that were loaded by `key_many` to sort the
+        buffer, so they are not deserialized again.
+        """
+        if self._unloaded:
+            self._load_keys()
+        return self._iter_pairs(self._loaded_keys)
+
+    def _iter_pairs(self, keys):
+        offsets = self._offsets
+        view = memoryview(self._values)
+        if self._order is None:
+            order = range(len(self))
+        else:
+            order = self._order
+        for i in order:
+            yield keys[i], view[offsets[i]:offsets[i + 1]].tobytes()
+
+# vim: et sw=4 sts=4
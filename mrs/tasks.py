@@ -20,18 +20,32 @@ A Task represents a unit of work and the mechanism for carrying it out.
 
 from __future__ import division, print_function
 
+import base64
 import copy
+import functools
 import itertools
 from operator import itemgetter
+import os
+import sys
 
 from . import datasets
 from . import fileformats
+from .mapreduce import Batch
 from . import serializers
+from . import skew
 from . import util
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 from logging import getLogger
 logger = getLogger('mrs')
 
+# Number of hot keys that each task reports to the master.
+HOT_KEYS_REPORTED = 10
+
 
 class Task(object):
     """Manage input and output for a piece of a map or reduce operation.
@@ -54,10 +68,43 @@ class Task(object):
         self.outdir = None
         self.output = None
         self.sorted_ds = None
+        self.grouped_ds = None
+        self.combined_ds = None
+        self.key_counter = None
 
     def outurls(self):
         return [(b.split, b.url) for b in self.output[:, :] if b.url]
 
+    def outstats(self):
+        """Returns statistics about the output of the task.
+
+        The statistics are a dict (suitable for XML-RPC) with the number of
+        bytes written to each split and the most frequent output keys, which
+        are only tracked for map output.  Salted map output also reports the
+        number of keys that were salted.  The size of an indexed
+        (block-compressed) file is its uncompressed size from the index.
+        Numbers are floats because XML-RPC integers are limited to 32 bits.
+        """
+        split_bytes = []
+        for b in self.output[:, :]:
+            if b.block_index is not None:
+                size = sum(info.raw_size for info in b.block_index)
+                split_bytes.append((b.split, float(size)))
+            elif b.url:
+                path, _ = fileformats.split_url_options(b.url)
+                if os.path.exists(path):
+                    split_bytes.append((b.split, float(os.path.getsize(path))))
+        stats = {'split_bytes': split_bytes}
+
+        if self.key_counter is not None:
+            loads_key, _ = serializers.loads_functions(self.serializers)
+            hot_keys = self.key_counter.hot_keys(loads_key, HOT_KEYS_REPORTED)
+            stats['hot_keys'] = [(label, float(count))
+                    for label, count in hot_keys]
+        if isinstance(self.key_counter, skew.SaltingPartitioner):
+            stats['salted_keys'] = float(self.key_counter.salted_keys())
+        return stats
+
     @staticmethod
     def from_op(op, *args):
         return op.task_class(op, *args)
@@ -111,8 +158,12 @@ class Task(object):
                 self.storage, self.ext, input_ser_names, ser_names)
 
     def _get_all_input(self, serial, sort=False, default_dir=None,
-            max_sort_size=None):
-        """Returns an iterator over all input data."""
+            max_sort_size=None, merge_factor=None, combine=None):
+        """Returns an iterator over all input data.
+
+        If the data are sorted on disk, the optional `combine` function is
+        applied to each sorted run that is written.
+        """
         if serial:
             self.input_ds.fetchall(_called_in_runner=True)
             uncopied_data = self.input_ds.data()
@@ -123,10 +174,15 @@ class Task(object):
             data = (copy.deepcopy(x) for x in uncopied_data)
             if sort:
                 data = sorted(data, key=itemgetter(0))
+        elif sort and self._input_presorted():
+            # Each input bucket is already sorted, so a merge suffices.
+            data = self.input_ds.stream_merged_split(self.task_index,
+                    _called_in_runner=True)
         elif sort:
             tmpdir = util.mktempdir(default_dir, 'merge_%s_' % self.dataset_id)
             sorted_ds = datasets.MergeSortData(self.input_ds, self.task_index,
-                    max_sort_size, dir=tmpdir, _called_in_runner=True)
+                    max_sort_size, merge_factor=merge_factor, combine=combine,
+                    dir=tmpdir, _called_in_runner=True)
             data = sorted_ds.stream_data(_called_in_runner=True)
             self.sorted_ds = sorted_ds
         else:
@@ -134,11 +190,125 @@ class Task(object):
                     _called_in_runner=True)
         return data
 
-    def _outdata_kwds(self, program, permanent, serial):
+    def _get_grouped_input(self, serial, default_dir=None,
+            max_sort_size=None):
+        """Returns an iterator over (key, values) groups of all input data.
+
+        Keys are grouped with a hash table rather than by sorting, so the
+        groups are in no particular order.
+        """
+        if serial or not default_dir:
+            data = self._get_all_input(serial)
+            return hash_group(data)
+
+        tmpdir = util.mktempdir(default_dir, 'hash_%s_' % self.dataset_id)
+        grouped_ds = datasets.HashGroupData(self.input_ds, self.task_index,
+                max_sort_size, dir=tmpdir, _called_in_runner=True)
+        self.grouped_ds = grouped_ds
+        return grouped_ds.stream_groups()
+
+    def _reduce_input(self, program, serial, default_dir, max_sort_size,
+            merge_factor, combine=None):
+        """Returns an iterator over the reduce output for all input data."""
+        input_serializers = self.input_ds.serializers
+        if input_serializers is not None:
+            value_serializer = input_serializers.value_s
+        else:
+            value_serializer = None
+
+        if self.op.hash_reduce:
+            grouped_input = self._get_grouped_input(serial, default_dir,
+                    max_sort_size)
+            return self.op.reduce_groups(program, grouped_input,
+                    value_serializer)
+        else:
+            all_input = self._get_all_input(serial, sort=True,
+                    default_dir=default_dir, max_sort_size=max_sort_size,
+                    merge_factor=merge_factor, combine=combine)
+            return self.op.reduce(program, all_input, value_serializer)
+
+    def _input_presorted(self):
+        """Reports whether every input bucket of the task is sorted by key."""
+        buckets = [b for b in self.input_ds[:, self.task_index] if b.url]
+        return bool(buckets) and all(b.presorted() for b in buckets)
+
+    def _count_map_keys(self, map_itr):
+        """Returns an iterator over map output that counts keys if needed.
+
+        Keys are counted in the map output before it is combined (which would
+        otherwise reduce each key to a few records).
+        """
+        if self.key_counter is None:
+            return map_itr
+        dumps_key, _ = serializers.dumps_functions(self.serializers)
+        return self.key_counter.count_keys(map_itr, dumps_key)
+
+    def _combine_output(self, program, map_itr, serial=False,
+            default_dir=None, max_sort_size=None, sort=False):
+        """Returns an iterator over map output (combined if requested).
+
+        If the operation has a combiner or if `sort` is True, the map output
+        is sorted by key (and combined).  Unless the task is serial, the map
+        output is buffered in at most `max_sort_size` MB of RAM, and sorted
+        runs are spilled to local temporary files and merged.  Hash combiners
+        skip the sort and aggregate in at most `max_sort_size` MB of RAM
+        instead (and their partial aggregates are sorted if requested).
+        """
+        combine = self.op.combiner(program)
+        if combine is None and not sort:
+            return map_itr
+
+        combiner = self.op.hash_combiner(program)
+        if combiner is not None:
+            if max_sort_size:
+                max_ram_bytes = 1024 * 1024 * max_sort_size
+            else:
+                max_ram_bytes = None
+            map_itr = hash_combine(combiner, map_itr, max_ram_bytes)
+            if not sort:
+                return map_itr
+
+        if serial or not default_dir or not max_sort_size:
+            # SORT PHASE
+            sorted_map_itr = sorted(map_itr, key=itemgetter(0))
+            if combine is None:
+                return iter(sorted_map_itr)
+            return combine(sorted_map_itr)
+
+        tmpdir = util.mktempdir(default_dir, 'spill_%s_' % self.dataset_id)
+        combined_ds = datasets.SpillSortData(map_itr, max_sort_size,
+                combine=combine, dir=tmpdir, serializers=self.serializers)
+        self.combined_ds = combined_ds
+        return combined_ds.stream_data()
+
+    def _delete_temporary(self):
+        """Deletes any temporary datasets created while running the task."""
+        if self.sorted_ds is not None:
+            self.sorted_ds.delete()
+        if self.grouped_ds is not None:
+            self.grouped_ds.delete()
+        if self.combined_ds is not None:
+            self.combined_ds.delete()
+
+    def _outdata_kwds(self, program, permanent, serial, sort_output=False,
+            track_keys=False):
         """Returns arguments for the output dataset (common to all task types).
+
+        If `track_keys` is True, hot keys in the output are detected.  If the
+        operation requests salting, the partition function is wrapped to salt
+        them, and otherwise only a sample of keys is counted for reporting.
         """
+        parter = self.op.parter(program)
+        if track_keys and not serial:
+            if self.op.salt > 1:
+                parter = skew.SaltingPartitioner(parter, self.op.salt,
+                        self.task_index)
+                self.key_counter = parter
+            else:
+                self.key_counter = skew.KeySampler()
+
         kwds = {'source': self.task_index,
-                'parter': self.op.parter(program),
+                'parter': parter,
                 'dir': self.outdir,
                 'format': self.format(),
                 'serializers': self.serializers,
@@ -146,6 +316,7 @@ class Task(object):
                 }
         if not serial:
             kwds['write_only'] = True
+            kwds['sort_output'] = sort_output
         return kwds
 
     def make_outdir(self, default_dir):
@@ -178,54 +349,100 @@ class Task(object):
 
 
 class MapTask(Task):
-    def run(self, program, default_dir, serial=False, max_sort_size=None):
+    def run(self, program, default_dir, serial=False, max_sort_size=None,
+            map_buffer_size=None, sort_map_output=False, merge_factor=None):
         assert isinstance(self.op, MapOperation)
 
         all_input = self._get_all_input(serial)
         permanent = self.make_outdir(default_dir)
-        kwds = self._outdata_kwds(program, permanent, serial)
+        kwds = self._outdata_kwds(program, permanent, serial, sort_map_output,
+                track_keys=True)
         map_itr = self.op.map(program, all_input)
+        map_itr = self._count_map_keys(map_itr)
+        map_itr = self._combine_output(program, map_itr, serial, default_dir,
+                map_buffer_size, sort_map_output)
         self.output = datasets.LocalData(map_itr, permanent=permanent, **kwds)
+        self._delete_temporary()
 
 
 class ReduceTask(Task):
-    def run(self, program, default_dir, serial=False, max_sort_size=None):
+    def run(self, program, default_dir, serial=False, max_sort_size=None,
+            map_buffer_size=None, sort_map_output=False, merge_factor=None):
         assert isinstance(self.op, ReduceOperation)
 
-        all_input = self._get_all_input(serial, sort=True,
-                default_dir=default_dir, max_sort_size=max_sort_size)
-
+        reduce_itr = self._reduce_input(program, serial, default_dir,
+                max_sort_size, merge_factor, self.op.reduce_combiner(program))
         permanent = self.make_outdir(default_dir)
         kwds = self._outdata_kwds(program, permanent, serial)
-        reduce_itr = self.op.reduce(program, all_input)
         self.output = datasets.LocalData(reduce_itr, permanent=permanent,
                 **kwds)
-        if self.sorted_ds is not None:
-            self.sorted_ds.delete()
+        self._delete_temporary()
 
 
 class ReduceMapTask(Task):
-    def run(self, program, default_dir, serial=False, max_sort_size=None):
+    def run(self, program, default_dir, serial=False, max_sort_size=None,
+            map_buffer_size=None, sort_map_output=False, merge_factor=None):
         assert isinstance(self.op, ReduceMapOperation)
 
-        all_input = self._get_all_input(serial, sort=True,
-                default_dir=default_dir, max_sort_size=max_sort_size)
-
+        reduce_itr = self._reduce_input(program, serial, default_dir,
+                max_sort_size, merge_factor, self.op.reduce_combiner(program))
         permanent = self.make_outdir(default_dir)
-        kwds = self._outdata_kwds(program, permanent, serial)
-        reduce_itr = self.op.reduce(program, all_input)
+        kwds = self._outdata_kwds(program, permanent, serial, sort_map_output,
+                track_keys=True)
         map_itr = self.op.map(program, reduce_itr)
+        map_itr = self._count_map_keys(map_itr)
+        map_itr = self._combine_output(program, map_itr, serial, default_dir,
+                map_buffer_size, sort_map_output)
         self.output = datasets.LocalData(map_itr, permanent=permanent, **kwds)
-        if self.sorted_ds is not None:
-            self.sorted_ds.delete()
+        self._delete_temporary()
 
 
 class Operation(object):
-    def __init__(self, part_name):
+    combine_name = ''
+    salt = 0
+
+    def __init__(self, part_name, part_args=''):
         self.part_name = part_name
+        self.part_args = part_args
 
     def parter(self, program):
-        return getattr(program, self.part_name)
+        """Returns the partition function.
+
+        If the operation has partition arguments (see `encode_part_args`),
+        they are bound to the function as keyword arguments.
+        """
+        parter = getattr(program, self.part_name)
+        if self.part_args:
+            kwds = decode_part_args(self.part_args)
+            parter = functools.partial(parter, **kwds)
+        return parter
+
+    def combiner(self, program):
+        """Returns a function that combines key-sorted pairs.
+
+        The returned function takes an iterator over key-sorted pairs.  If
+        the operation has no combiner, returns None.
+        """
+        return self._combiner(program, self.combine_name)
+
+    def _combiner(self, program, combine_name):
+        if not combine_name:
+            return None
+        combine_op = ReduceOperation(combine_name, self.part_name)
+        return functools.partial(combine_op.reduce, program)
+
+    def hash_combiner(self, program):
+        """Returns the combiner if it is declared as a hash combiner.
+
+        If the operation has no hash combiner, returns None.
+        """
+        if not self.combine_name:
+            return None
+        combiner = getattr(program, self.combine_name)
+        if getattr(combiner, 'hash_combine', False):
+            return combiner
+        else:
+            return None
 
     @staticmethod
     def from_args(op_name, *args):
@@ -237,10 +454,12 @@ class MapOperation(Operation):
     op_name = 'map'
     task_class = MapTask
 
-    def __init__(self, map_name, combine_name, *args):
-        Operation.__init__(self, *args)
+    def __init__(self, map_name, combine_name, part_name, part_args='',
+            salt=0):
+        Operation.__init__(self, part_name, part_args)
         self.map_name = map_name
         self.combine_name = combine_name
+        self.salt = salt
         self.id = '%s' % self.map_name
 
     def map(self, program, input):
@@ -250,75 +469,297 @@ class MapOperation(Operation):
         else:
             mapper = getattr(program, self.map_name)
 
-        if self.combine_name:
-            combine_op = ReduceOperation(self.combine_name, self.part_name)
-        else:
-            combine_op = None
-
-        map_iter = self._map(mapper, input)
-        if combine_op:
-            # SORT PHASE
-            sorted_map_iter = sorted(map_iter, key=itemgetter(0))
-            combine_iter = combine_op.reduce(program, sorted_map_iter)
-            return combine_iter
-        else:
-            return map_iter
+        batch_size = getattr(mapper, 'batch_size', None)
+        if batch_size:
+            return self._batch_map(mapper, input, batch_size)
+        return self._map(mapper, input)
 
     def _map(self, mapper, input):
         for inkey, invalue in input:
             for key, value in mapper(inkey, invalue):
                 yield (key, value)
 
+    def _batch_map(self, mapper, input, batch_size):
+        """Calls a batch mapper on lists of up to `batch_size` input pairs."""
+        input = iter(input)
+        def outputs():
+            while True:
+                chunk = list(itertools.islice(input, batch_size))
+                if not chunk:
+                    return
+                keys, values = zip(*chunk)
+                yield batch_pairs(mapper(list(keys), list(values)))
+        return itertools.chain.from_iterable(outputs())
+
     def to_args(self):
         return (self.op_name, self.map_name, self.combine_name,
-                self.part_name)
+                self.part_name, self.part_args, self.salt)
 
 
 class ReduceOperation(Operation):
     op_name = 'reduce'
     task_class = ReduceTask
 
-    def __init__(self, reduce_name, *args):
-        Operation.__init__(self, *args)
+    def __init__(self, reduce_name, part_name, hash_reduce=False,
+            combine_name='', part_args=''):
+        Operation.__init__(self, part_name, part_args)
         self.reduce_name = reduce_name
+        self.hash_reduce = hash_reduce
+        self.combine_name = combine_name
         self.id = '%s' % self.reduce_name
 
-    def reduce(self, program, input):
+    def reduce_combiner(self, program):
+        """Returns the combiner for sorted runs of reduce input.
+
+        If the operation has no such combiner, returns None.
+        """
+        return self.combiner(program)
+
+    def reduce(self, program, input, value_serializer=None):
         """Yields reduce output iterating over the entries in input.
 
         A reducer is an iterator taking a key and an iterator over values for
-        that key.  It yields values for that key.
+        that key.  It yields values for that key.  A batch reducer instead
+        takes a list of (key, values) groups (see `_batch_reduce`).
         """
+        reducer = self._reducer(program)
+        groups = itertools.groupby(input, key=itemgetter(0))
+        if getattr(reducer, 'batch_size', None):
+            grouped_input = ((k, map(itemgetter(1), v)) for k, v in groups)
+            return self._batch_reduce(reducer, grouped_input,
+                    value_serializer)
+        grouped_input = ((k, (pair[1] for pair in v)) for k, v in groups)
+        return self._reduce_groups(reducer, grouped_input)
+
+    def reduce_groups(self, program, grouped_input, value_serializer=None):
+        """Yields reduce output iterating over (key, values) groups."""
+        reducer = self._reducer(program)
+        if getattr(reducer, 'batch_size', None):
+            return self._batch_reduce(reducer, grouped_input,
+                    value_serializer)
+        return self._reduce_groups(reducer, grouped_input)
+
+    def _reducer(self, program):
         if self.reduce_name is None:
-            reducer = None
+            return None
         else:
-            reducer = getattr(program, self.reduce_name)
-
-        grouped_input = ((k, (pair[1] for pair in v)) for k, v in
-            itertools.groupby(input, key=itemgetter(0)))
+            return getattr(program, self.reduce_name)
 
+    def _reduce_groups(self, reducer, grouped_input):
         for key, iterator in grouped_input:
             for value in reducer(key, iterator):
                 yield (key, value)
 
+    def _batch_reduce(self, reducer, grouped_input, value_serializer=None):
+        """Calls a batch reducer on lists of (key, values) groups.
+
+        The values of each group are materialized as a list or, if the
+        reducer asks for arrays and the values have a primitive serializer,
+        as a NumPy array of the corresponding type.
+        """
+        batch_size = reducer.batch_size
+        arrays = getattr(reducer, 'batch_arrays', False)
+        if arrays:
+            make_values = values_array_function(value_serializer)
+        else:
+            make_values = list
+        def outputs():
+            while True:
+                chunk = [(key, make_values(values)) for key, values in
+                        itertools.islice(grouped_input, batch_size)]
+                if not chunk:
+                    return
+                pairs = batch_pairs(reducer(chunk))
+                if arrays:
+                    pairs = python_scalar_pairs(pairs)
+                yield pairs
+        return itertools.chain.from_iterable(outputs())
+
     def to_args(self):
-        return (self.op_name, self.reduce_name, self.part_name)
+        return (self.op_name, self.reduce_name, self.part_name,
+                self.hash_reduce, self.combine_name, self.part_args)
 
 
 class ReduceMapOperation(MapOperation, ReduceOperation):
     op_name = 'reducemap'
     task_class = ReduceMapTask
 
-    def __init__(self, reduce_name, map_name, combine_name, *args):
-        Operation.__init__(self, *args)
+    def __init__(self, reduce_name, map_name, combine_name, part_name,
+            hash_reduce=False, part_args='', salt=0, reduce_combine_name=''):
+        Operation.__init__(self, part_name, part_args)
         self.reduce_name = reduce_name
         self.map_name = map_name
         self.combine_name = combine_name
+        self.hash_reduce = hash_reduce
+        self.salt = salt
+        self.reduce_combine_name = reduce_combine_name
         self.id = '%s_%s' % (self.reduce_name, self.map_name)
 
+    def reduce_combiner(self, program):
+        """Returns the combiner for sorted runs of reduce input.
+
+        The `combine_name` of a reducemap operation names the combiner for
+        its map output, so the reduce side has a separate
+        `reduce_combine_name`.
+        """
+        return self._combiner(program, self.reduce_combine_name)
+
     def to_args(self):
         return (self.op_name, self.reduce_name, self.map_name,
-                self.combine_name, self.part_name)
+                self.combine_name, self.part_name, self.hash_reduce,
+                self.part_args, self.salt, self.reduce_combine_name)
+
+
+def batch_pairs(output):
+    """Returns an iterable of pairs from the output of a batch function.
+
+    The output is either an iterable of pairs or a `Batch`, whose keys and
+    values are zipped together (after conversion to lists if they are
+    arrays).
+    """
+    if isinstance(output, Batch):
+        keys, values = output
+        if hasattr(keys, 'tolist'):
+            keys = keys.tolist()
+        if hasattr(values, 'tolist'):
+            values = values.tolist()
+        if len(keys) != len(values):
+            raise ValueError('A Batch must have as many keys as values')
+        return zip(keys, values)
+    return output
+
+
+def python_scalar_pairs(pairs):
+    """Converts NumPy scalars in the given pairs to Python objects.
+
+    A key or value is converted with its `item` method if it is a scalar
+    (with an empty shape), so that NumPy arrays are left alone.
+    """
+    for key, value in pairs:
+        if getattr(key, 'shape', None) == ():
+            key = key.item()
+        if getattr(value, 'shape', None) == ():
+            value = value.item()
+        yield key, value
+
+
+def values_array_function(value_serializer):
+    """Returns a function that converts an iterable of values to an array.
+
+    NumPy (which is imported only if it is needed) converts the values to an
+    array with the type of the given primitive serializer (see
+    `make_primitive_serializer`).  For other serializers, the returned
+    function makes a list instead.
+    """
+    format = getattr(value_serializer, 'format', None)
+    if not format:
+        return list
+    import numpy
+    try:
+        dtype = numpy.dtype(format.lstrip('@=<>!'))
+    except TypeError:
+        return list
+
+    def to_array(values):
+        return numpy.fromiter(values, dtype)
+    return to_array
+
+
+def encode_part_args(kwds):
+    """Encode keyword arguments for a partition function as a string.
+
+    The arguments are pickled, so that they can be sent to workers along
+    with the rest of an operation.
+
+    >>> decode_part_args(encode_part_args({'boundaries': [3, 7]}))
+    {'boundaries': [3, 7]}
+    >>>
+    """
+    if not kwds:
+        return ''
+    data = pickle.dumps(kwds, pickle.HIGHEST_PROTOCOL)
+    return base64.b64encode(data).decode('ascii')
+
+
+def decode_part_args(part_args):
+    """Decode keyword arguments that were encoded with `encode_part_args`."""
+    if not part_args:
+        return {}
+    return pickle.loads(base64.b64decode(part_args.encode('ascii')))
+
+
+def hash_group(pairs):
+    """Group key-value pairs by key in a dictionary (held entirely in RAM).
+
+    Yields (key, values) pairs, where values is an iterator.  The groups are
+    in no particular order.
+    """
+    table = {}
+    for key, value in pairs:
+        try:
+            table[key].append(value)
+        except KeyError:
+            table[key] = [value]
+    while table:
+        key, values = table.popitem()
+        yield key, iter(values)
+
+
+def hash_combine(combiner, map_itr, max_ram_bytes=None):
+    """Combine key-value pairs by aggregating them in a dictionary.
+
+    The combiner must be associative and commutative (see the `hash_combiner`
+    decorator).  Whenever the estimated size of the table exceeds
+    `max_ram_bytes`, the values for each key are combined in place.  If the
+    table is still more than half full, the partial aggregates are yielded
+    and the table is cleared.  The output is not sorted.
+    """
+    getsizeof = sys.getsizeof
+    table = {}
+    current_bytes = 0
+    for key, value in map_itr:
+        try:
+            values = table[key]
+        except KeyError:
+            values = table[key] = []
+            current_bytes += datasets.TABLE_ENTRY_OVERHEAD + getsizeof(key)
+        values.append(value)
+        current_bytes += getsizeof(value) + 8
+
+        if max_ram_bytes and current_bytes > max_ram_bytes:
+            current_bytes = _compact_table(combiner, table)
+            if current_bytes > max_ram_bytes // 2:
+                for kvpair in _iter_table(combiner, table):
+                    yield kvpair
+                table.clear()
+                current_bytes = 0
+
+    for kvpair in _iter_table(combiner, table):
+        yield kvpair
+
+
+def _compact_table(combiner, table):
+    """Combine the values of each key in place.
+
+    Returns the new estimated size of the table.
+    """
+    getsizeof = sys.getsizeof
+    current_bytes = 0
+    for key, values in table.items():
+        if len(values) > 1:
+            values[:] = combiner(key, iter(values))
+        current_bytes += datasets.TABLE_ENTRY_OVERHEAD + getsizeof(key)
+        current_bytes += sum(getsizeof(value) + 8 for value in values)
+    return current_bytes
+
+
+def _iter_table(combiner, table):
+    """Iterate over the combined key-value pairs in the table."""
+    for key, values in table.items():
+        if len(values) > 1:
+            values = combiner(key, iter(values))
+        for value in values:
+            yield (key, value)
 
 
 OP_CLASSES = dict((op.op_name, op) for op in (MapOperation, ReduceOperation,
@@ -24,6 +24,7 @@ import os
 import traceback
 
 from . import datasets
+from . import fileformats
 from . import tasks
 from . import util
 
@@ -31,6 +32,17 @@ from logging import getLogger
 logger = getLogger('mrs')
 
 
+def set_format_defaults(opts):
+    """Applies command-line options for file formats to this process."""
+    block_size = getattr(opts, 'mrs__block_size', None)
+    if block_size is not None:
+        block_size *= 1024
+    fileformats.set_block_defaults(getattr(opts, 'mrs__block_codec', None),
+            getattr(opts, 'mrs__block_level', None), block_size)
+    fileformats.set_auto_serializers(getattr(opts, 'mrs__auto_serializers',
+            False))
+
+
 class WorkerSetupRequest(object):
     """Request the worker to run the setup function."""
 
@@ -85,12 +97,14 @@ class WorkerSetupSuccess(object):
 
 class WorkerSuccess(object):
     """Successful response from worker."""
-    def __init__(self, dataset_id, task_index, outdir, outurls, request_id):
+    def __init__(self, dataset_id, task_index, outdir, outurls, request_id,
+            stats=None):
         self.dataset_id = dataset_id
         self.task_index = task_index
         self.outdir = outdir
         self.outurls = outurls
         self.request_id = request_id
+        self.stats = stats
 
 
 class Worker(object):
@@ -133,6 +147,7 @@ class Worker(object):
                 util.log_ram_usage()
                 self.program = self.program_class(self.opts, self.args)
                 self.default_dir = request.default_dir
+                set_format_defaults(self.opts)
                 response = WorkerSetupSuccess()
 
             elif isinstance(request, WorkerQuitRequest):
@@ -147,12 +162,20 @@ class Worker(object):
                         (request.dataset_id, request.task_index))
                 util.log_ram_usage()
                 max_sort_size = getattr(self.opts, 'mrs__max_sort_size', None)
+                map_buffer_size = getattr(self.opts, 'mrs__map_buffer_size',
+                        None)
+                sort_map_output = getattr(self.opts, 'mrs__sort_map_output',
+                        False)
+                merge_factor = getattr(self.opts, 'mrs__merge_factor', None)
                 t = tasks.Task.from_args(*request.args, program=self.program)
                 t.run(self.program, self.default_dir,
-                        max_sort_size=max_sort_size)
+                        max_sort_size=max_sort_size,
+                        map_buffer_size=map_buffer_size,
+                        sort_map_output=sort_map_output,
+                        merge_factor=merge_factor)
                 response = WorkerSuccess(request.dataset_id,
                         request.task_index, t.outdir, t.outurls(),
-                        request.id())
+                        request.id(), t.outstats())
                 logger.info('Completed task: %s, %s' %
                         (request.dataset_id, request.task_index))
                 util.log_ram_usage()
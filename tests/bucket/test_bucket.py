@@ -1,5 +1,6 @@
 from mrs.bucket import WriteBucket
-from mrs import BinWriter, HexWriter
+from mrs import BinWriter, BlockWriter, HexWriter
+from mrs.bucket import ReadBucket
 
 def test_writebucket():
     b = WriteBucket(0, 0)
@@ -108,4 +109,37 @@ def test_roundtrip_write_only(tmpdir):
     listdir = tmpdir.listdir()
     assert listdir == []
 
+def test_sorted_url(tmpdir):
+    b = WriteBucket(0, 3, dir=tmpdir.strpath, format=BinWriter,
+            sort_output=True)
+    b.collect([(1, 'This'), (2, 'is'), (3, 'sorted')], write_only=True)
+    b.close_writer(do_sync=False)
+
+    path = tmpdir.join(b.prefix() + '.mrsb').strpath
+    readonly_copy = b.readonly_copy()
+    assert readonly_copy.url == path + '#sorted'
+    assert readonly_copy.presorted()
+
+    values = ' '.join(value for key, value in readonly_copy.stream())
+    assert values == 'This is sorted'
+
+    b.clean()
+
+def test_block_index(tmpdir):
+    b = WriteBucket(0, 0, dir=tmpdir.strpath, format=BlockWriter)
+    b.collect([(1, 'This'), (2, 'is'), (3, 'indexed')], write_only=True)
+    b.close_writer(do_sync=False)
+
+    readonly_copy = b.readonly_copy()
+    index = readonly_copy.block_index
+    assert len(index) == 1
+    assert index[0].records == 3
+
+    # The index can also be read from the file.
+    other = ReadBucket(0, 0)
+    other.url = readonly_copy.url
+    assert other.read_block_index() == index
+
+    b.clean()
+
 # vim: et sw=4 sts=4
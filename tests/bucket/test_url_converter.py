@@ -33,4 +33,27 @@ def test_global_to_local_master():
     url = c.global_to_local('http:///xyz.txt', master)
     assert url == 'http://server:8080/xyz.txt'
 
+def test_fragment_roundtrip():
+    c = URLConverter('myhost', 42, '/my/path')
+    master = 'server:8080'
+
+    url = c.local_to_global('/my/path/xyz.mrsb#sorted')
+    assert url == 'http://myhost:42/xyz.mrsb#sorted'
+
+    url = c.global_to_local(url, master)
+    assert url == '/my/path/xyz.mrsb#sorted'
+
+def test_local_path():
+    c = URLConverter('myhost', 42, '/my/path')
+    assert c.local_path('http://myhost:42/xyz.mrsb#sorted') == \
+            '/my/path/xyz.mrsb'
+    assert c.local_path('http://other:42/xyz.mrsb') is None
+    assert c.local_path('http://myhost:43/xyz.mrsb') is None
+    assert c.local_path('/my/path/xyz.mrsb') is None
+
+    # The job's converter has no address, and neither do its urls.
+    c = URLConverter('', 42, '/my/path')
+    assert c.local_path(c.local_to_global('/my/path/xyz.mrsb')) == \
+            '/my/path/xyz.mrsb'
+
 # vim: et sw=4 sts=4
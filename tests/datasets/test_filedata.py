@@ -0,0 +1,99 @@
+import threading
+
+from mrs.datasets import FileData
+from mrs.fileformats import url_size
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+def write_files(tmpdir, sizes):
+    paths = []
+    for i, size in enumerate(sizes):
+        path = tmpdir.join('input%s.txt' % i)
+        path.write('x' * (size - 1) + '\n')
+        paths.append(path.strpath)
+    return paths
+
+
+def test_pack(tmpdir):
+    paths = write_files(tmpdir, [10, 10, 10, 25, 10, 5])
+    ds = FileData(paths, pack_size=30)
+    assert ds.splits == 3
+    assert [len(list(ds[:, split])) for split in range(3)] == [3, 1, 2]
+
+    ds.fetchall()
+    keys = [key for key, value in ds.data()]
+    assert keys == [(i, 0) for i in range(6)]
+
+
+def test_pack_streams_in_sequence(tmpdir):
+    paths = write_files(tmpdir, [10] * 8)
+    ds = FileData(paths, pack_size=100)
+    assert ds.splits == 1
+    for _ in range(5):
+        keys = [key for key, value in ds.stream_split(0)]
+        assert keys == [(i, 0) for i in range(8)]
+
+    # A task reads its split of packed files in the same order.
+    task_ds = FileData([b.url for b in ds[:, 0]], splits=1)
+    keys = [key for key, value in task_ds.stream_split(0)]
+    assert keys == [(i, 0) for i in range(8)]
+
+
+def test_hash_in_path(tmpdir):
+    path = tmpdir.mkdir('notes#1').join('a#b.txt')
+    path.write('line 0\nline 1\n')
+    assert url_size(path.strpath) == 14
+
+    ds = FileData([path.strpath], split_size=7)
+    assert ds.splits == 2
+    ds.fetchall()
+    assert list(ds.data()) == [(0, 'line 0\n'), (7, 'line 1\n')]
+
+
+def test_pack_ranges(tmpdir):
+    path = tmpdir.join('input.txt')
+    path.write(''.join('line %s\n' % i for i in range(100)))
+    small = write_files(tmpdir, [10])
+
+    ds = FileData([path.strpath] + small, split_size=300, pack_size=400)
+    assert ds.splits == 3
+    ds.fetchall()
+    lines = [(key[0], value) for key, value in ds.data()]
+    expected = [(0, 'line %s\n' % i) for i in range(100)]
+    expected.append((1, 'x' * 9 + '\n'))
+    assert lines == expected
+
+
+def test_http_url_size():
+    methods = []
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            methods.append('HEAD')
+            self.send_response(200)
+            self.send_header('Content-Length', '1234')
+            self.end_headers()
+
+        def do_GET(self):
+            methods.append('GET')
+            self.send_response(500)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.handle_request)
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:%s/input.txt' % server.server_port
+        assert url_size(url) == 1234
+    finally:
+        thread.join()
+        server.server_close()
+    assert methods == ['HEAD']
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,56 @@
+from collections import defaultdict
+
+from mrs.bucket import WriteBucket
+from mrs.datasets import FileData, HashGroupData
+from mrs.fileformats import BinWriter
+from mrs.serializers import Serializers, str_serializer, int_serializer
+
+
+def write_input(tmpdir, serializers, pairs):
+    b = WriteBucket(0, 0, dir=tmpdir.mkdir('input').strpath, format=BinWriter,
+            serializers=serializers)
+    b.collect(pairs, write_only=True)
+    b.close_writer(False)
+    return FileData([b.readonly_copy().url], splits=1,
+            serializers=serializers)
+
+
+def collect_groups(ds):
+    groups = defaultdict(list)
+    for key, values in ds.stream_groups():
+        assert key not in groups
+        groups[key].extend(values)
+    return groups
+
+
+def test_in_ram(tmpdir):
+    serializers = Serializers(str_serializer, 'str_serializer',
+            int_serializer, 'int_serializer')
+    pairs = [('b', 1), ('a', 2), ('b', 3)]
+    input = write_input(tmpdir, serializers, pairs)
+
+    groupdir = tmpdir.mkdir('group')
+    ds = HashGroupData(input, 0, 100, dir=groupdir.strpath)
+    groups = collect_groups(ds)
+    assert groups == {'a': [2], 'b': [1, 3]}
+    assert groupdir.listdir() == []
+    ds.delete()
+
+
+def test_partitioned(tmpdir):
+    # Keys are pickled, so they are deserialized for grouping.
+    pairs = [(i % 500, i) for i in range(20000)]
+    input = write_input(tmpdir, None, pairs)
+
+    groupdir = tmpdir.mkdir('group')
+    ds = HashGroupData(input, 0, 0.05, dir=groupdir.strpath)
+    groups = collect_groups(ds)
+    assert len(groups) == 500
+    for key, values in groups.items():
+        assert sorted(values) == list(range(key, 20000, 500))
+    # Each partition file is deleted once it has been grouped.
+    assert groupdir.listdir() == []
+    assert ds._partitions_written > 0
+    ds.delete()
+
+# vim: et sw=4 sts=4
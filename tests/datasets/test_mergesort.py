@@ -0,0 +1,183 @@
+from itertools import groupby
+import math
+from operator import itemgetter
+
+import pytest
+
+from mrs.bucket import WriteBucket
+from mrs.datasets import FileData, MergeSortData
+from mrs.fileformats import BinWriter
+from mrs.serializers import (Serializers, str_serializer, int_serializer,
+        raw_serializer)
+from mrs.sortbuffer import SortBuffer
+
+SOURCES = [[(3, 1), (1, 2)], [(2, 5), (1, 7)]]
+
+
+def write_sources(dir, serializers, to_key):
+    urls = []
+    for source, pairs in enumerate(SOURCES):
+        b = WriteBucket(source, 0, dir=dir, format=BinWriter,
+                serializers=serializers)
+        b.collect(((to_key(k), v) for k, v in pairs), write_only=True)
+        b.close_writer(False)
+        urls.append(b.readonly_copy().url)
+    return urls
+
+
+def check_mergesort(tmpdir, serializers, to_key, raw_sorted):
+    urls = write_sources(tmpdir.mkdir('input').strpath, serializers, to_key)
+    expected = [(to_key(1), 2), (to_key(1), 7), (to_key(2), 5),
+            (to_key(3), 1)]
+
+    for max_sort_size, n_buckets in ((1, 0), (0.000001, 4)):
+        input = FileData(urls, splits=1, serializers=serializers)
+        ds = MergeSortData(input, 0, max_sort_size,
+                dir=tmpdir.mkdir('sort_%s' % n_buckets).strpath)
+        assert ds.raw_sorted == raw_sorted
+        assert len(ds[:, :]) == n_buckets
+        result = list(ds.stream_data())
+        assert sorted(result) == expected
+        assert [k for k, v in result] == [k for k, v in expected]
+        ds.delete()
+
+
+def test_ordered_keys(tmpdir):
+    serializers = Serializers(str_serializer, 'str_serializer',
+            int_serializer, 'int_serializer')
+    check_mergesort(tmpdir, serializers, str, True)
+
+
+def test_unordered_keys(tmpdir):
+    serializers = Serializers(int_serializer, 'int_serializer',
+            int_serializer, 'int_serializer')
+    check_mergesort(tmpdir, serializers, int, False)
+
+def test_background_flush(tmpdir):
+    serializers = Serializers(str_serializer, 'str_serializer',
+            int_serializer, 'int_serializer')
+    b = WriteBucket(0, 0, dir=tmpdir.mkdir('input').strpath, format=BinWriter,
+            serializers=serializers)
+    b.collect(((str(i % 1000), i) for i in range(20000)), write_only=True)
+    b.close_writer(False)
+
+    input = FileData([b.readonly_copy().url], splits=1,
+            serializers=serializers)
+    ds = MergeSortData(input, 0, 0.1, merge_factor=2,
+            dir=tmpdir.mkdir('sort').strpath)
+    assert len(ds[:, :]) == 2
+    result = list(ds.stream_data())
+    assert len(result) == 20000
+    assert [k for k, v in result] == sorted(str(i % 1000) for i in range(20000))
+    ds.delete()
+
+
+def test_background_flush_error(tmpdir, monkeypatch):
+    serializers = Serializers(int_serializer, 'int_serializer',
+            int_serializer, 'int_serializer')
+    urls = write_sources(tmpdir.mkdir('input').strpath, serializers, int)
+
+    def fail(*args):
+        raise IOError('disk full')
+    monkeypatch.setattr(MergeSortData, '_flush_data', fail)
+
+    input = FileData(urls, splits=1, serializers=serializers)
+    with pytest.raises(IOError):
+        MergeSortData(input, 0, 0.000001, dir=tmpdir.mkdir('sort').strpath)
+
+def test_merge_factor(tmpdir):
+    serializers = Serializers(int_serializer, 'int_serializer',
+            int_serializer, 'int_serializer')
+    b = WriteBucket(0, 0, dir=tmpdir.mkdir('input').strpath, format=BinWriter,
+            serializers=serializers)
+    b.collect(((i * 7919 % 1000, i) for i in range(1000)), write_only=True)
+    b.close_writer(False)
+
+    sortdir = tmpdir.mkdir('sort')
+    input = FileData([b.readonly_copy().url], splits=1,
+            serializers=serializers)
+    ds = MergeSortData(input, 0, 0.000001, merge_factor=4,
+            dir=sortdir.strpath)
+    assert len(ds[:, :]) == 4
+    assert len(sortdir.listdir()) == 4
+
+    result = list(ds.stream_data())
+    assert [k for k, v in result] == list(range(1000))
+    ds.delete()
+
+def test_combine_runs(tmpdir):
+    serializers = Serializers(str_serializer, 'str_serializer',
+            int_serializer, 'int_serializer')
+    b = WriteBucket(0, 0, dir=tmpdir.mkdir('input').strpath, format=BinWriter,
+            serializers=serializers)
+    b.collect(((str(i % 10), 1) for i in range(20000)), write_only=True)
+    b.close_writer(False)
+
+    def combine(pairs):
+        for key, group in groupby(pairs, key=itemgetter(0)):
+            yield (key, sum(value for _, value in group))
+
+    sortdir = tmpdir.mkdir('sort')
+    input = FileData([b.readonly_copy().url], splits=1,
+            serializers=serializers)
+    ds = MergeSortData(input, 0, 0.1, merge_factor=2, combine=combine,
+            dir=sortdir.strpath)
+    assert len(ds[:, :]) == 2
+    # Each remaining run holds at most one (combined) pair per key.
+    assert sum(len(list(b.stream())) for b in ds[:, :]) <= 20
+
+    result = list(combine(ds.stream_data()))
+    assert result == [(str(i), 2000) for i in range(10)]
+    ds.delete()
+
+def test_run_count(tmpdir):
+    serializers = Serializers(str_serializer, 'str_serializer',
+            int_serializer, 'int_serializer')
+    b = WriteBucket(0, 0, dir=tmpdir.mkdir('input').strpath, format=BinWriter,
+            serializers=serializers)
+    b.collect(((str(i * 7919 % 20000), i) for i in range(20000)),
+            write_only=True)
+    b.close_writer(False)
+    url = b.readonly_copy().url
+
+    raw_serializers = Serializers(raw_serializer, 'raw_serializer',
+            raw_serializer, 'raw_serializer')
+    input = FileData([url], splits=1, serializers=raw_serializers)
+    buf = SortBuffer()
+    for raw_key, raw_value in input.stream_split(0):
+        buf.append(raw_key, raw_value)
+    total_mb = buf.nbytes() / (1024 * 1024)
+
+    # Data that fits within the limit stays in RAM, and otherwise the first
+    # run uses the whole limit and later runs use half of it each.
+    for max_sort_size in (1.2 * total_mb, 0.6 * total_mb, 0.3 * total_mb):
+        input = FileData([url], splits=1, serializers=serializers)
+        ds = MergeSortData(input, 0, max_sort_size,
+                dir=tmpdir.mkdir('sort_%s' % max_sort_size).strpath)
+        if max_sort_size > total_mb:
+            expected = 0
+        else:
+            expected = 1 + math.ceil((total_mb - max_sort_size) /
+                    (max_sort_size / 2))
+        assert len(ds[:, :]) <= expected
+        assert len(list(ds.stream_data())) == 20000
+        ds.delete()
+def test_unorderable_values(tmpdir):
+    serializers = Serializers(int_serializer, 'int_serializer', None, None)
+    b = WriteBucket(0, 0, dir=tmpdir.mkdir('input').strpath, format=BinWriter,
+            serializers=serializers)
+    b.collect(((i % 10, {'i': i}) for i in range(1000)), write_only=True)
+    b.close_writer(False)
+
+    input = FileData([b.readonly_copy().url], splits=1,
+            serializers=serializers)
+    ds = MergeSortData(input, 0, 0.000001, dir=tmpdir.mkdir('sort').strpath)
+    assert not ds.raw_sorted
+    assert len(ds[:, :]) > 1
+    # Runs are merged by key alone, so dict values are never compared.
+    result = list(ds.stream_data())
+    assert [k for k, v in result] == sorted(i % 10 for i in range(1000))
+    assert sorted(v['i'] for k, v in result) == list(range(1000))
+    ds.delete()
+
+# vim: et sw=4 sts=4
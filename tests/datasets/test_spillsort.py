@@ -0,0 +1,42 @@
+from operator import itemgetter
+
+from mrs.datasets import SpillSortData
+
+
+def sum_combine(sorted_pairs):
+    last_key = None
+    total = 0
+    for key, value in sorted_pairs:
+        if key != last_key and last_key is not None:
+            yield (last_key, total)
+            total = 0
+        last_key = key
+        total += value
+    if last_key is not None:
+        yield (last_key, total)
+
+
+def test_in_ram():
+    pairs = [(3, 'c'), (1, 'a'), (2, 'b'), (1, 'z')]
+    ds = SpillSortData(iter(pairs), 100)
+    assert list(ds.stream_data()) == sorted(pairs, key=itemgetter(0))
+    assert len(ds[:, :]) == 1
+    ds.delete()
+
+
+def test_spill_and_combine(tmpdir):
+    pairs = [(i % 97, 1) for i in range(20000)]
+    # A tiny buffer forces many spills.
+    ds = SpillSortData(iter(pairs), 0.05, combine=sum_combine,
+            dir=tmpdir.strpath)
+    assert len(ds[:, :]) > 1
+
+    result = list(ds.stream_data())
+    keys = [key for key, value in result]
+    assert keys == list(range(97))
+    assert sum(value for key, value in result) == 20000
+
+    ds.delete()
+    assert not tmpdir.check()
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,126 @@
+import pickle
+
+from mrs import fileformats
+from mrs.fileformats import BinReader, BinWriter, BlockReader, BlockWriter
+from mrs.serializers import raw_serializer, Serializers
+
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+RAW = Serializers(raw_serializer, '', raw_serializer, '')
+
+
+def write(kv_pairs, writer_class=BinWriter, **kwds):
+    f = BytesIO()
+    kwds.setdefault('auto_serializers', True)
+    writer = writer_class(f, **kwds)
+    writer.writepairs(kv_pairs)
+    writer.finish()
+    return f.getvalue()
+
+
+def read(data, reader_class=BinReader, **kwds):
+    return list(reader_class(BytesIO(data), **kwds))
+
+
+def test_inferred():
+    kv_pairs = [(u'word %s' % i, i) for i in range(500)]
+    data = write(kv_pairs)
+    assert read(data) == kv_pairs
+    # The header (4 bytes) and control record are followed by records with
+    # 8-byte values.
+    assert data[4:8] == b'\xff\xff\xff\xff'
+    assert len(data) < sum(8 + len(k) + 8 for k, v in kv_pairs) + 20
+
+    # Raw records are pickled as they would have been without inference.
+    raw_pairs = read(data, serializers=RAW)
+    assert [(pickle.loads(k), pickle.loads(v)) for k, v in raw_pairs] == \
+            kv_pairs
+
+
+def test_tuples():
+    kv_pairs = [((i, float(i)), (u'x' * i, b'y', (i, u'z')))
+            for i in range(150)]
+    assert read(write(kv_pairs)) == kv_pairs
+
+
+def test_fallback():
+    kv_pairs = [(i, u'v') for i in range(200)]
+    kv_pairs += [(1.5, u'v'), (2 ** 70, None)]
+    kv_pairs += [(i, u'v') for i in range(2000)]
+    data = write(kv_pairs)
+    assert read(data) == kv_pairs
+    assert data.count(b'\xff\xff\xff\xff') == 2
+
+    f = BytesIO()
+    writer = BinWriter(f, auto_serializers=True)
+    for pair in kv_pairs:
+        writer.writepair(pair)
+    writer.finish()
+    assert f.getvalue() == data
+
+
+def test_unencodable_str():
+    # A lone surrogate matches the str schema but cannot be encoded, so the
+    # pair is pickled instead.
+    kv_pairs = [(u'k%s' % i, u'v') for i in range(200)]
+    kv_pairs += [(u'\ud800', u'v')] + kv_pairs
+    assert read(write(kv_pairs)) == kv_pairs
+
+
+def test_not_inferred():
+    # Mixed types (and small files) are pickled as usual.
+    kv_pairs = [(1, 2), (u'a', b'b')]
+    data = write(kv_pairs)
+    assert data == write(kv_pairs, auto_serializers=False)
+    assert read(data) == kv_pairs
+
+    assert write([]) == write([], auto_serializers=False)
+
+
+def test_default():
+    kv_pairs = [(i, i) for i in range(10)]
+    f = BytesIO()
+    fileformats.set_auto_serializers(True)
+    try:
+        writer = BinWriter(f)
+        writer.writepairs(kv_pairs)
+        writer.finish()
+    finally:
+        fileformats.set_auto_serializers(False)
+    assert b'\xff\xff\xff\xff' in f.getvalue()
+
+    # Writers with serializers never infer them.
+    data = write([(b'k', b'v')] * 10, serializers=RAW)
+    assert b'\xff\xff\xff\xff' not in data
+
+
+def test_one_side():
+    # Only the side without a serializer is inferred.
+    serializers = Serializers(None, '', raw_serializer, '')
+    kv_pairs = [(i, b'raw %d' % i) for i in range(200)]
+    data = write(kv_pairs, serializers=serializers)
+    # The control record has an empty schema for the values.
+    assert data[8:14] == b'\x02\x00\x00\x00i '
+    assert read(data, serializers=serializers) == kv_pairs
+
+    kv_pairs += [(u'x', b'raw')]
+    data = write(kv_pairs, serializers=serializers)
+    assert read(data, serializers=serializers) == kv_pairs
+
+
+def test_block_format():
+    kv_pairs = [(i, u'value %s' % i) for i in range(1000)]
+    # Keys keep their pickled form since the index records key ranges.
+    data = write(kv_pairs, BlockWriter, block_size=1000)
+    assert read(data, BlockReader) == kv_pairs
+    index = BlockReader(BytesIO(data)).read_index()
+    assert sum(info.records for info in index) == len(kv_pairs)
+    assert pickle.loads(index[0].min_key) == 0
+
+    data = write(kv_pairs, BlockWriter, block_size=1000, index=False)
+    assert read(data, BlockReader) == kv_pairs
+
+# vim: et sw=4 sts=4
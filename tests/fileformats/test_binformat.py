@@ -1,5 +1,10 @@
+import pytest
+
+from mrs import fileformats
+from mrs.bucket import URLConverter
 from mrs.fileformats import BinReader, BinWriter
-from mrs.serializers import raw_serializer, Serializers
+from mrs.serializers import (raw_serializer, int_serializer,
+        str_serializer, Serializers)
 
 try:
     from cStringIO import StringIO as BytesIO
@@ -56,4 +61,116 @@ def test_pickle_roundtrip():
 
     assert new_pairs == kv_pairs
 
+def write_raw(f, kv_pairs):
+    serializers = Serializers(raw_serializer, '', raw_serializer, '')
+    writer = BinWriter(f, serializers=serializers)
+    for pair in kv_pairs:
+        writer.writepair(pair)
+    writer.finish()
+    return serializers
+
+
+def test_small_buffer():
+    kv_pairs = [(b'key %d' % i, b'x' * i) for i in range(100)]
+    f = BytesIO()
+    serializers = write_raw(f, kv_pairs)
+    f.seek(0)
+
+    # Records larger than the buffer are read with several reads.
+    reader = BinReader(f, serializers=serializers, buffer_size=7)
+    assert list(reader) == kv_pairs
+
+
+def test_mmap_roundtrip(tmpdir):
+    kv_pairs = [(b'key %d' % i, b'x' * i) for i in range(100)]
+    path = tmpdir.join('test.mrsb').strpath
+    with open(path, 'wb') as f:
+        serializers = write_raw(f, kv_pairs)
+
+    reader = BinReader(open(path, 'rb'), serializers=serializers,
+            use_mmap=True)
+    assert reader._mmap is not None
+    assert list(reader) == kv_pairs
+    reader.close()
+
+
+def test_open_url_mmap(tmpdir):
+    kv_pairs = [(b'key %d' % i, b'x' * i) for i in range(100)]
+    path = tmpdir.join('test.mrsb').strpath
+    with open(path, 'wb') as f:
+        serializers = write_raw(f, kv_pairs)
+
+    with fileformats.open_url(path, serializers=serializers) as reader:
+        assert reader._mmap is not None
+        assert list(reader) == kv_pairs
+
+    # A url of this host's bucket server is read from the local file.
+    converter = URLConverter('myhost', 42, tmpdir.strpath)
+    url = converter.local_to_global(path)
+    assert url.startswith('http:')
+    fileformats.set_url_converter(converter)
+    try:
+        with fileformats.open_url(url, serializers=serializers) as reader:
+            assert reader._mmap is not None
+            assert list(reader) == kv_pairs
+    finally:
+        fileformats.set_url_converter(None)
+
+
+def test_truncated():
+    f = BytesIO()
+    serializers = write_raw(f, [(b'key', b'value'), (b'the', b'end')])
+    data = f.getvalue()
+
+    reader = BinReader(BytesIO(data[:-7]), serializers=serializers)
+    with pytest.raises(RuntimeError) as excinfo:
+        list(reader)
+    assert 'lone key' in str(excinfo.value)
+
+    reader = BinReader(BytesIO(data[:-1]), serializers=serializers)
+    with pytest.raises(RuntimeError) as excinfo:
+        list(reader)
+    assert 'unexpectedly' in str(excinfo.value)
+
+
+def test_writepairs():
+    kv_pairs = [(b'key %d' % i, b'x' * i) for i in range(100)]
+    f = BytesIO()
+    write_raw(f, kv_pairs)
+
+    serializers = Serializers(raw_serializer, '', raw_serializer, '')
+    f2 = BytesIO()
+    writer = BinWriter(f2, serializers=serializers, buffer_size=64)
+    writer.writepairs(kv_pairs)
+    writer.finish()
+    assert f2.getvalue() == f.getvalue()
+
+
+def test_write_buffering():
+    serializers = Serializers(raw_serializer, '', raw_serializer, '')
+    f = BytesIO()
+    writer = BinWriter(f, serializers=serializers, buffer_size=32)
+    writer.writepair((b'key', b'value'))
+    # Nothing is written until the block fills up.
+    assert f.tell() == 0
+    writer.writepair((b'k' * 10, b'v' * 10))
+    assert f.tell() == 4 + 16 + 28
+    writer.writepair((b'the', b'end'))
+    writer.finish()
+    assert f.tell() == 4 + 16 + 28 + 14
+
+
+def test_bulk_roundtrip():
+    # Records cross both the bulk batches and the read buffer boundaries.
+    kv_pairs = [(i, u'value %d' % i) for i in range(2500)]
+    serializers = Serializers(int_serializer, '', str_serializer, '')
+    f = BytesIO()
+    writer = BinWriter(f, serializers=serializers, buffer_size=1000)
+    writer.writepairs(kv_pairs)
+    writer.finish()
+
+    f.seek(0)
+    reader = BinReader(f, serializers=serializers, buffer_size=100)
+    assert list(reader) == kv_pairs
+
 # vim: et sw=4 sts=4
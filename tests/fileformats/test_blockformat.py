@@ -0,0 +1,131 @@
+import pytest
+
+from mrs import fileformats
+from mrs.fileformats import BlockReader, BlockWriter
+from mrs.serializers import raw_serializer, Serializers
+
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+codecs = ['zlib', 'bz2']
+if fileformats.lzma is not None:
+    codecs.append('lzma')
+
+
+@pytest.mark.parametrize('codec', codecs)
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_roundtrip(codec, prefetch):
+    kv_pairs = [(i, 'value %s' % i) for i in range(1000)]
+
+    f = BytesIO()
+    writer = BlockWriter(f, codec=codec, level=6, block_size=1000)
+    writer.writepairs(kv_pairs)
+    writer.finish()
+
+    f.seek(0)
+    reader = BlockReader(f, prefetch=prefetch)
+    assert list(reader) == kv_pairs
+    reader.close()
+
+
+def test_blocks():
+    f = BytesIO()
+    writer = BlockWriter(f, block_size=100, index=False)
+    writer.writepairs((b'key', b'x' * 200) for _ in range(3))
+    writer.finish()
+
+    # Each record is larger than the block size, so it has its own block.
+    data = f.getvalue()
+    pos = len(BlockWriter.magic)
+    blocks = 0
+    while pos < len(data):
+        codec_id, raw_size, data_size = \
+                fileformats.block_header_struct.unpack_from(data, pos)
+        assert codec_id == fileformats.codecs_by_name['zlib'].codec_id
+        pos += fileformats.block_header_struct.size + data_size
+        blocks += 1
+    assert pos == len(data)
+    assert blocks == 3
+
+
+def test_truncated():
+    f = BytesIO()
+    writer = BlockWriter(f, block_size=100, index=False)
+    writer.writepairs((b'key', b'x' * 200) for _ in range(3))
+    writer.finish()
+
+    reader = BlockReader(BytesIO(f.getvalue()[:-1]))
+    with pytest.raises(RuntimeError):
+        list(reader)
+    reader.close()
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        BlockWriter(BytesIO(), codec='rot13')
+
+def write_indexed(f, kv_pairs, block_size=100):
+    serializers = Serializers(raw_serializer, '', raw_serializer, '')
+    writer = BlockWriter(f, serializers=serializers, block_size=block_size)
+    writer.writepairs(kv_pairs)
+    writer.finish()
+    return writer, serializers
+
+
+def test_index():
+    kv_pairs = [(b'key %03d' % i, b'x' * 20) for i in range(100)]
+    f = BytesIO()
+    writer, serializers = write_indexed(f, kv_pairs)
+
+    f.seek(0)
+    reader = BlockReader(f, serializers=serializers)
+    index = reader.read_index()
+    assert index == writer.blocks
+    assert sum(info.records for info in index) == 100
+    assert index[0].offset == len(BlockWriter.magic)
+    assert index[0].min_key == b'key 000'
+    assert index[-1].max_key == b'key 099'
+    # Reading the index does not move the reader.
+    assert list(reader) == kv_pairs
+
+
+def test_key_range():
+    kv_pairs = [(b'key %03d' % i, b'x' * 20) for i in range(100)]
+    f = BytesIO()
+    writer, serializers = write_indexed(f, kv_pairs)
+
+    f.seek(0)
+    reader = BlockReader(f, serializers=serializers,
+            key_range=(b'key 042', b'key 050'))
+    assert list(reader) == kv_pairs[42:50]
+
+    # Without an index, every block is read and filtered.
+    f = BytesIO()
+    writer = BlockWriter(f, serializers=serializers, block_size=100,
+            index=False)
+    writer.writepairs(kv_pairs)
+    writer.finish()
+    f.seek(0)
+    reader = BlockReader(f, serializers=serializers,
+            key_range=(b'key 090', None))
+    assert reader.read_index() is None
+    assert list(reader) == kv_pairs[90:]
+
+
+def test_key_range_skips_blocks():
+    kv_pairs = [(b'key %03d' % i, b'x' * 20) for i in range(100)]
+    f = BytesIO()
+    writer, serializers = write_indexed(f, kv_pairs)
+
+    # Corrupt every block that holds no keys in the range.
+    data = bytearray(f.getvalue())
+    for info in writer.blocks:
+        if info.max_key < b'key 042' or info.min_key >= b'key 050':
+            data[info.offset] = 255
+    reader = BlockReader(BytesIO(bytes(data)), serializers=serializers,
+            key_range=(b'key 042', b'key 050'))
+    assert list(reader) == kv_pairs[42:50]
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,95 @@
+from mrs import fileformats
+from mrs.fileformats import (DelimitedReader, DelimitedWriter, CSVReader,
+        CSVWriter, TextReader, TextWriter)
+from mrs.serializers import Serializers, int_serializer, str_serializer
+
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+
+def test_fields():
+    data = b'a\t1\tx\nb\t2\ty\r\n\nc\t3\tz'
+    reader = DelimitedReader(BytesIO(data))
+    assert list(reader) == [(b'a', b'1'), (b'b', b'2'), (b'c', b'3')]
+
+    reader = DelimitedReader(BytesIO(data), key_field=2, value_field=(0, 1))
+    assert list(reader) == [(b'x', (b'a', b'1')), (b'y', (b'b', b'2')),
+            (b'z', (b'c', b'3'))]
+
+    reader = DelimitedReader(BytesIO(data), key_field=None, value_field=None,
+            encoding='utf-8')
+    assert list(reader) == [(0, u'a\t1\tx'), (1, u'b\t2\ty'), (3, u'c\t3\tz')]
+
+
+def test_crlf_across_reads(monkeypatch):
+    data = b'a\t1\r\nb\t2\r\nc\t3\r\n'
+    # Each '\r\n' is split between two reads of some buffer size.
+    for size in range(1, len(data) + 1):
+        monkeypatch.setattr(fileformats, 'READ_BUFFER_SIZE', size)
+        reader = DelimitedReader(BytesIO(data))
+        assert list(reader) == [(b'a', b'1'), (b'b', b'2'), (b'c', b'3')]
+
+
+def test_range_keys():
+    data = b''.join(b'line %d\r\n' % i for i in range(20))
+    pairs = []
+    for start in range(0, len(data), 16):
+        f = BytesIO(data)
+        f.seek(start)
+        reader = DelimitedReader(f, key_field=None, value_field=None,
+                start=start, end=start + 16)
+        pairs.extend(reader)
+    # Lines are keyed by byte offset, so keys are unique across ranges.
+    assert pairs == [(8 * i, b'line %d' % i) for i in range(10)] + [
+            (80 + 9 * i, b'line %d' % (i + 10)) for i in range(10)]
+
+
+def test_file_index():
+    data = b'a\t1\nb\t2\n'
+    reader = DelimitedReader(BytesIO(data), key_field=None, file_index=3)
+    assert list(reader) == [((3, 0), b'1'), ((3, 1), b'2')]
+
+    # Keys from a field are not changed.
+    reader = DelimitedReader(BytesIO(data), file_index=3)
+    assert list(reader) == [(b'a', b'1'), (b'b', b'2')]
+
+
+def test_roundtrip():
+    serializers = Serializers(str_serializer, '', int_serializer, '')
+    kv_pairs = [(u'key %s' % i, i) for i in range(5000)]
+
+    f = BytesIO()
+    writer = CSVWriter(f, serializers)
+    writer.writepairs(kv_pairs)
+    writer.finish()
+
+    f.seek(0)
+    reader = CSVReader(f, serializers)
+    assert list(reader) == kv_pairs
+
+
+def test_tuples():
+    f = BytesIO()
+    writer = DelimitedWriter(f)
+    writer.writepair((b'k', (1, u'two', b'three')))
+    writer.finish()
+    assert f.getvalue() == b'k\t1\ttwo\tthree\n'
+
+    f.seek(0)
+    reader = DelimitedReader(f, value_field=(1, 3))
+    assert list(reader) == [(b'k', (b'1', b'three'))]
+
+
+def test_text_reader():
+    f = BytesIO()
+    writer = TextWriter(f)
+    writer.writepair((u'key', u'a value with spaces'))
+    writer.finish()
+
+    f.seek(0)
+    reader = TextReader(f)
+    assert list(reader) == [(u'key', u'a value with spaces')]
+
+# vim: et sw=4 sts=4
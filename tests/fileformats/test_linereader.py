@@ -1,6 +1,6 @@
 # coding=utf-8
 
-from mrs.fileformats import LineReader
+from mrs.fileformats import LineReader, BytesLineReader, byte_range_urls, open_url
 import sys
 
 try:
@@ -40,4 +40,50 @@ def test_bytesio():
 
     assert lines == list(enumerate(orig_lines))
 
+def test_ranges():
+    data = b''.join(b'line %d\n' % i for i in range(100)) + b'no newline'
+    expected = []
+    offset = 0
+    for line in data.splitlines(True):
+        expected.append((offset, line))
+        offset += len(line)
+
+    for size in (1, 7, 8, 9, 100, len(data)):
+        lines = []
+        for start in range(0, len(data), size):
+            f = BytesIO(data)
+            f.seek(start)
+            reader = BytesLineReader(f, start=start, end=start + size)
+            lines.extend(reader)
+        assert lines == expected
+
+def test_line_endings():
+    data = b'a\r\nb\rc\nd\r\n\r\ne'
+    values = [u'a\n', u'b\n', u'c\n', u'd\n', u'\n', u'e']
+    assert list(LineReader(BytesIO(data))) == list(enumerate(values))
+
+    # Ranged reads translate line endings in the same way.
+    offsets = [0, 3, 5, 7, 10, 12]
+    for size in (1, 3, len(data)):
+        lines = []
+        for start in range(0, len(data), size):
+            f = BytesIO(data)
+            f.seek(start)
+            lines.extend(LineReader(f, start=start, end=start + size))
+        assert lines == list(zip(offsets, values))
+
+def test_range_urls(tmpdir):
+    path = tmpdir.join('input.txt')
+    path.write(''.join('line %d\n' % i for i in range(1000)))
+
+    urls = byte_range_urls(path.strpath, 1000)
+    assert len(urls) > 1
+    lines = []
+    for url in urls:
+        with open_url(url) as reader:
+            lines.extend(value for key, value in reader)
+    assert lines == ['line %d\n' % i for i in range(1000)]
+
+    assert byte_range_urls(path.strpath, 100000) == [path.strpath]
+
 # vim: et sw=4 sts=4
@@ -0,0 +1,77 @@
+import pytest
+
+from mrs import fileformats
+from mrs.fileformats import (BinWriter, VarintReader, VarintWriter,
+        encode_varint)
+from mrs.serializers import raw_serializer, Serializers
+
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+RAW = Serializers(raw_serializer, '', raw_serializer, '')
+
+
+def write(kv_pairs, writer_class=VarintWriter, **kwds):
+    f = BytesIO()
+    writer = writer_class(f, **kwds)
+    writer.writepairs(kv_pairs)
+    writer.finish()
+    return f.getvalue()
+
+
+def test_varints():
+    for n in (0, 1, 127):
+        assert bytearray(encode_varint(n)) == bytearray([n])
+    for n in (128, 300, 2 ** 32, 2 ** 70):
+        data = bytearray(encode_varint(n) + b'rest')
+        value, pos = fileformats._decode_varint(data, 1, data[0])
+        assert (value, pos) == (n, len(data) - 4)
+
+
+def test_raw_roundtrip():
+    kv_pairs = [(b'apple', b'1'), (b'apple', b'2'), (b'applesauce', b''),
+            (b'banana', b'x' * 1000), (b'', b'empty key'), (b'', b''),
+            (b'k' * 200, b'v' * 200)]
+    data = write(kv_pairs, serializers=RAW)
+    for buffer_size in (1, 7, 1024):
+        reader = VarintReader(BytesIO(data), serializers=RAW,
+                buffer_size=buffer_size)
+        assert list(reader) == kv_pairs
+
+    # A repeated-key marker takes one byte, and a shared prefix is not
+    # repeated.
+    assert data == (b'MrsV' + b'\x02\x05apple\x011' + b'\x00\x012' +
+            b'\x07\x05sauce\x00' + data[24:])
+
+    data = write(kv_pairs, serializers=RAW, prefix_keys=False)
+    assert list(VarintReader(BytesIO(data), serializers=RAW)) == kv_pairs
+
+
+def test_small_records():
+    kv_pairs = [(u'word%s' % (i // 5), i % 3) for i in range(5000)]
+    data = write(kv_pairs)
+    assert list(VarintReader(BytesIO(data))) == kv_pairs
+    assert len(data) < len(write(kv_pairs, BinWriter)) // 2
+
+    data = write(kv_pairs, auto_serializers=True)
+    assert list(VarintReader(BytesIO(data))) == kv_pairs
+
+    kv_pairs.append((None, None))
+    data = write(kv_pairs, auto_serializers=True)
+    assert list(VarintReader(BytesIO(data))) == kv_pairs
+
+
+def test_truncated():
+    data = write([(b'key', b'value')] * 3, serializers=RAW)
+    reader = VarintReader(BytesIO(data[:-1]), serializers=RAW)
+    with pytest.raises(RuntimeError):
+        list(reader)
+
+
+def test_formats():
+    assert fileformats.writerformat('mrsv') is VarintWriter
+    assert fileformats.fileformat('/tmp/x.mrsv') is VarintReader
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,66 @@
+import pickle
+import struct
+
+from mrs.serializers import (str_serializer, int_serializer,
+        make_struct_serializer, make_primitive_serializer, raw_serializer,
+        Serializer, Serializers, dumps_many_functions, loads_many_functions)
+
+
+def check_bulk(serializer, values):
+    raw = serializer.dumps_many(values)
+    assert raw == [serializer.dumps(v) for v in values]
+    assert serializer.loads_many(raw) == [serializer.loads(b) for b in raw]
+    assert serializer.loads_many([]) == []
+
+
+def test_builtin_serializers():
+    check_bulk(str_serializer, [u'', u'abc', u'\xe9\u4e2d'])
+    check_bulk(int_serializer, [0, -1, 2**70, 42])
+    check_bulk(make_primitive_serializer('d'), [0.0, -1.5, 1e300])
+    check_bulk(make_struct_serializer('=LL'), [(1, 2), (3, 4), (0, 2**32 - 1)])
+
+
+def test_counted_primitive():
+    # A count is part of the primitive type rather than a repeat count.
+    s = make_primitive_serializer('4s')
+    check_bulk(s, [b'abcd', b'\x00\x01\x02\x03', b'wxyz'])
+    assert s.loads_many([b'abcd', b'efgh']) == [b'abcd', b'efgh']
+    check_bulk(make_primitive_serializer('>3s'), [b'abc', b'def'])
+
+
+def test_pickle():
+    # Datasets (and their serializers) are sent between processes.
+    for serializer in (str_serializer, int_serializer, raw_serializer):
+        copy = pickle.loads(pickle.dumps(serializer))
+        assert copy == serializer
+        assert copy.dumps_many == serializer.dumps_many
+        assert copy.loads_many == serializer.loads_many
+
+
+def test_primitive_length_check():
+    s = make_primitive_serializer('=I')
+    try:
+        s.loads_many([struct.pack('=I', 1), b'\x00'])
+    except struct.error:
+        pass
+    else:
+        assert False, 'expected a struct error'
+
+
+def test_fallbacks():
+    # A plain serializer is converted one object at a time.
+    upper = Serializer(lambda s: s.upper(), lambda b: b.lower())
+    serializers = Serializers(upper, '', raw_serializer, '')
+    dumps_keys, dumps_values = dumps_many_functions(serializers)
+    loads_keys, loads_values = loads_many_functions(serializers)
+    assert dumps_keys([b'a', b'b']) == [b'A', b'B']
+    assert loads_keys([b'A', b'B']) == [b'a', b'b']
+    assert dumps_values is None
+    assert loads_values is None
+
+    # Without serializers, keys and values are pickled.
+    dumps_keys, _ = dumps_many_functions(None)
+    loads_keys, _ = loads_many_functions(None)
+    assert loads_keys(dumps_keys([1, (2, 3)])) == [1, (2, 3)]
+
+# vim: et sw=4 sts=4
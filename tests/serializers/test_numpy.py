@@ -0,0 +1,60 @@
+import pytest
+
+from mrs.fileformats import BinReader, BinWriter
+from mrs.serializers import numpy_serializer, int_serializer, Serializers
+
+numpy = pytest.importorskip('numpy')
+
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+
+def check_roundtrip(array):
+    new_array = numpy_serializer.loads(numpy_serializer.dumps(array))
+    assert new_array.dtype == array.dtype
+    assert new_array.shape == array.shape
+    assert (new_array == array).all()
+
+
+def test_roundtrip():
+    check_roundtrip(numpy.arange(12.0).reshape(3, 4))
+    check_roundtrip(numpy.array(5, dtype='>i4'))
+    check_roundtrip(numpy.zeros((0, 3), dtype='u1'))
+    check_roundtrip(numpy.array([1 + 2j, -1j]))
+    check_roundtrip(numpy.array([u'ab', u'c']))
+    # Non-contiguous arrays are written in C order.
+    check_roundtrip(numpy.arange(10)[::2])
+    check_roundtrip(numpy.arange(6).reshape(2, 3).T)
+
+
+def test_shared_memory():
+    data = numpy_serializer.dumps(numpy.arange(5, dtype='<i8'))
+    array = numpy_serializer.loads(data)
+    assert not array.flags.owndata
+    assert not array.flags.writeable
+    # The 13-byte header ('<i8' and one dimension) is padded for alignment.
+    assert len(data) == 16 + 40
+
+
+def test_object_dtype():
+    with pytest.raises(ValueError):
+        numpy_serializer.dumps(numpy.array([None, 1]))
+
+
+def test_binformat():
+    serializers = Serializers(int_serializer, '', numpy_serializer, '')
+    kv_pairs = [(i, numpy.arange(i, dtype='f4')) for i in range(50)]
+    f = BytesIO()
+    writer = BinWriter(f, serializers=serializers)
+    writer.writepairs(kv_pairs)
+    writer.finish()
+
+    f.seek(0)
+    reader = BinReader(f, serializers=serializers)
+    for (key, value), (new_key, new_value) in zip(kv_pairs, reader):
+        assert new_key == key
+        assert (new_value == value).all()
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,61 @@
+import random
+
+from mrs.serializers import (ordered_int_serializer, ordered_uint_serializer,
+        ordered_float_serializer, ordered_str_serializer, raw_serializer,
+        int_serializer, make_ordered_tuple_serializer, is_ordered)
+
+
+def check_order(serializer, values):
+    raw = sorted(serializer.dumps(v) for v in values)
+    assert [serializer.loads(b) for b in raw] == sorted(values)
+
+
+def test_is_ordered():
+    assert is_ordered(raw_serializer)
+    assert is_ordered(ordered_str_serializer)
+    assert not is_ordered(int_serializer)
+    assert not is_ordered(None)
+
+
+def test_ints():
+    r = random.Random(42)
+    check_order(ordered_uint_serializer,
+            [0, 1, 2**64 - 1] + [r.randrange(2**64) for _ in range(500)])
+    check_order(ordered_int_serializer,
+            [-2**63, -1, 0, 1, 2**63 - 1] +
+            [r.randrange(-2**63, 2**63) for _ in range(500)])
+
+
+def test_floats():
+    r = random.Random(42)
+    values = [float('-inf'), -1e300, -1.5, -1e-300, 0.0, 1e-300, 2.5,
+            float('inf')]
+    values += [r.uniform(-1e9, 1e9) for _ in range(500)]
+    check_order(ordered_float_serializer, values)
+
+
+def test_negative_zero():
+    s = ordered_float_serializer
+    assert s.dumps(-0.0) == s.dumps(0.0)
+    assert s.dumps(-1e-300) < s.dumps(-0.0) < s.dumps(1e-300)
+
+
+def test_strs():
+    check_order(ordered_str_serializer,
+            [u'', u'a', u'a\x00', u'ab', u'b', u'\xe9', u'\u4e2d'])
+
+
+def test_tuples():
+    s = make_ordered_tuple_serializer(ordered_str_serializer,
+            ordered_int_serializer)
+    values = [(u'', 5), (u'a', -3), (u'a', 2), (u'a\x00', -10),
+            (u'a\x00\x00', 0), (u'ab', -1), (u'b', 0)]
+    check_order(s, values)
+
+
+def test_nested_raw_tuple():
+    s = make_ordered_tuple_serializer(raw_serializer, raw_serializer)
+    values = [(b'', b''), (b'\x00', b'x'), (b'\x00\xff', b''), (b'a', b'\x00')]
+    check_order(s, values)
+
+# vim: et sw=4 sts=4
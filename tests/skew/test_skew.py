@@ -0,0 +1,100 @@
+from collections import Counter
+
+import mrs
+from mrs import skew, tasks
+from mrs.datasets import LocalData
+from mrs.job import Job
+from mrs.runner import TaskList
+from mrs.skew import HeavyHitters, KeySampler, SaltingPartitioner
+
+
+def test_heavy_hitters():
+    items = ['hot'] * 500 + [str(i) for i in range(1000)]
+    items.sort(key=hash)
+    hh = HeavyHitters(16)
+    for item in items:
+        hh.add(item)
+
+    assert hh.total == 1500
+    top, count = hh.most_common(1)[0]
+    assert top == 'hot'
+    assert 500 - 1500 / 17 <= count <= 500
+
+
+def constant_parter(key, serialized_key, n):
+    return 1
+
+
+def test_salting_partitioner(monkeypatch):
+    monkeypatch.setattr(skew, 'HOT_KEY_MIN_COUNT', 10)
+    parter = SaltingPartitioner(constant_parter, salt=3)
+    pairs = [(b'hot', 1)] * 300 + [(str(i).encode(), 1) for i in range(300)]
+    splits = Counter()
+    for key, value in pairs:
+        split = parter(key, key, 4)
+        splits[key == b'hot', split] += 1
+
+    # Cold keys are never salted, and hot keys are spread over 3 splits.
+    assert set(split for hot, split in splits if not hot) == set([1])
+    assert set(split for hot, split in splits if hot) == set([1, 2, 3])
+    [(label, count)] = parter.hot_keys(n=1)
+    assert label == repr(b'hot')
+    assert count > 250
+    assert sum(parter.split_records.values()) == 600
+    assert parter.salted_keys() == 1
+
+
+def test_count_keys(monkeypatch):
+    monkeypatch.setattr(skew, 'HOT_KEY_MIN_COUNT', 10)
+    parter = SaltingPartitioner(constant_parter, salt=2, offset=1)
+    pairs = [('hot', 1)] * 100 + [('cold', 1)]
+    counted = list(parter.count_keys(iter(pairs), str.encode))
+    assert counted == pairs
+
+    # After counting, a combined record of the hot key is salted.
+    assert parter(b'hot', b'hot', 4) == 2
+    assert parter(b'cold', b'cold', 4) == 1
+
+
+def test_key_sampler():
+    sampler = KeySampler(interval=4)
+    pairs = [('hot', 1), ('a', 1), ('b', 1), ('c', 1)] * 100
+    counted = list(sampler.count_keys(iter(pairs), str.encode))
+    assert counted == pairs
+
+    # Only every fourth key is counted, and counts are scaled back up.
+    assert sampler.sketch.total == 100
+    assert sampler.hot_keys(n=1) == [(repr(b'hot'), 400)]
+
+
+def test_merge_salted_keeps_parter():
+    class FakeManager(object):
+        def submit(self, dataset):
+            pass
+
+        def close_dataset(self, dataset):
+            pass
+
+    class FakeJob(object):
+        _program = mrs.MapReduce(None, [])
+        _manager = FakeManager()
+        default_format = None
+
+    part_args = tasks.encode_part_args({'boundaries': [10, 20]})
+    input = LocalData([], splits=3)
+    input.op = tasks.MapOperation('map', 'reduce', 'range_partition',
+            part_args, salt=2)
+    merged, _ = Job._merge_salted(FakeJob(), input)
+    # The salted keys are repartitioned as the map output was.
+    assert merged.op.part_name == 'range_partition'
+    assert merged.op.part_args == part_args
+    assert merged.salt_merge
+
+
+def test_tasklist_salted_keys():
+    tasklist = TaskList(LocalData([], splits=2), None)
+    tasklist.add_stats({'split_bytes': [(0, 10.0)]})
+    assert not tasklist.salted_keys()
+    tasklist.add_stats({'split_bytes': [(1, 10.0)], 'salted_keys': 2.0})
+    assert tasklist.salted_keys() == 2
+
@@ -0,0 +1,78 @@
+import pickle
+
+from mrs.sortbuffer import SortBuffer, LOAD_BATCH
+
+
+def test_insertion_order():
+    buf = SortBuffer()
+    assert len(buf) == 0
+    assert list(buf) == []
+
+    pairs = [(b'c', b''), (b'', b'empty key'), (b'a', b'\x00\x01')]
+    for raw_key, raw_value in pairs:
+        buf.append(raw_key, raw_value)
+    assert len(buf) == 3
+    assert list(buf) == pairs
+
+
+def test_sort_raw_is_stable():
+    buf = SortBuffer()
+    pairs = [(b'b', b'1'), (b'a', b'2'), (b'ab', b'3'), (b'a', b'4')]
+    for raw_key, raw_value in pairs:
+        buf.append(raw_key, raw_value)
+    buf.sort()
+    assert list(buf) == [(b'a', b'2'), (b'a', b'4'), (b'ab', b'3'),
+            (b'b', b'1')]
+
+    # Appending invalidates the sort order.
+    buf.append(b'0', b'5')
+    assert list(buf)[-1] == (b'0', b'5')
+
+
+def test_sort_with_key():
+    buf = SortBuffer()
+    for i in (10, -3, 7, 2):
+        buf.append(pickle.dumps(i), str(i).encode('ascii'))
+    buf.sort(key=pickle.loads)
+    assert [v for k, v in buf] == [b'-3', b'2', b'7', b'10']
+
+
+def test_sort_with_key_many():
+    calls = []
+    def key_many(raw_keys):
+        calls.append(len(raw_keys))
+        return [pickle.loads(k) for k in raw_keys]
+    buf = SortBuffer(key_many)
+    values = [10, -3, 7, 2, 7] * (LOAD_BATCH // 2)
+    for i in values:
+        buf.append(pickle.dumps(i), str(i).encode('ascii'))
+    # Keys are loaded in batches while appending, and the rest when sorting.
+    assert calls == [LOAD_BATCH, LOAD_BATCH]
+    before = buf.nbytes()
+    buf.sort()
+    assert calls == [LOAD_BATCH, LOAD_BATCH, len(values) - 2 * LOAD_BATCH]
+    # The loaded keys count toward the size of the buffer.
+    assert buf.nbytes() > before
+    assert [int(v) for k, v in buf] == sorted(values)
+    # The loaded keys are reused rather than deserialized again.
+    assert [k for k, v in buf.loaded_pairs()] == sorted(values)
+    assert len(calls) == 3
+
+
+def test_nbytes():
+    buf = SortBuffer()
+    empty = buf.nbytes()
+    for i in range(1000):
+        buf.append(str(i).encode('ascii'), b'x' * 100)
+    # The payload is under 103 KB, and the per-record overhead (offsets and
+    # the temporary memory for sorting) is far less than 200 bytes.
+    assert 1000 * 100 < buf.nbytes() < 1000 * 300
+
+    before = buf.nbytes()
+    buf.sort()
+    assert buf.nbytes() == before
+
+    buf.clear()
+    assert buf.nbytes() == empty
+
+# vim: et sw=4 sts=4
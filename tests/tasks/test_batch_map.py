@@ -0,0 +1,47 @@
+import mrs
+from mrs.tasks import MapOperation
+
+
+class BatchProgram(mrs.MapReduce):
+    def __init__(self):
+        self.batch_lengths = []
+
+    @mrs.batch_mapper(size=3)
+    def map(self, keys, values):
+        self.batch_lengths.append(len(keys))
+        return [(value, key) for key, value in zip(keys, values)]
+
+    @mrs.batch_mapper
+    def map_batch(self, keys, values):
+        return mrs.Batch(keys, [2 * value for value in values])
+
+    @mrs.batch_mapper(2)
+    def map_pairs(self, keys, values):
+        return zip(keys, values)
+
+
+def test_batch_map():
+    program = BatchProgram()
+    op = MapOperation('map', '', 'partition')
+    input = [(i, str(i)) for i in range(7)]
+    output = list(op.map(program, iter(input)))
+    assert output == [(str(i), i) for i in range(7)]
+    assert program.batch_lengths == [3, 3, 1]
+
+
+def test_batch_object():
+    program = BatchProgram()
+    assert program.map_batch.batch_size == mrs.mapreduce.BATCH_SIZE
+    op = MapOperation('map_batch', '', 'partition')
+    output = list(op.map(program, iter([(1, 10), (2, 20)])))
+    assert output == [(1, 20), (2, 40)]
+
+
+def test_positional_size():
+    program = BatchProgram()
+    assert program.map_pairs.batch_size == 2
+    op = MapOperation('map_pairs', '', 'partition')
+    output = list(op.map(program, iter([(1, 10), (2, 20), (3, 30)])))
+    assert output == [(1, 10), (2, 20), (3, 30)]
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,64 @@
+import pytest
+
+import mrs
+from mrs.tasks import ReduceOperation, hash_group
+
+
+class BatchProgram(mrs.MapReduce):
+    def __init__(self):
+        self.batch_lengths = []
+
+    @mrs.batch_reducer(size=2)
+    def reduce(self, groups):
+        self.batch_lengths.append(len(groups))
+        return [(key, sum(values)) for key, values in groups]
+
+    @mrs.batch_reducer(arrays=True)
+    def reduce_arrays(self, groups):
+        keys = [key for key, values in groups]
+        return mrs.Batch(keys, [values.sum() for key, values in groups])
+
+    @mrs.batch_reducer(1)
+    def reduce_one(self, groups):
+        self.batch_lengths.append(len(groups))
+        return [(key, len(values)) for key, values in groups]
+
+
+PAIRS = [('a', 1), ('a', 2), ('b', 3), ('c', 4), ('c', 5), ('c', 6)]
+
+
+def test_batch_reduce():
+    program = BatchProgram()
+    op = ReduceOperation('reduce', 'partition')
+    output = list(op.reduce(program, iter(PAIRS)))
+    assert output == [('a', 3), ('b', 3), ('c', 15)]
+    assert program.batch_lengths == [2, 1]
+
+
+def test_batch_reduce_groups():
+    program = BatchProgram()
+    op = ReduceOperation('reduce', 'partition', hash_reduce=True)
+    output = sorted(op.reduce_groups(program, hash_group(iter(PAIRS))))
+    assert output == [('a', 3), ('b', 3), ('c', 15)]
+
+
+def test_batch_reduce_arrays():
+    pytest.importorskip('numpy')
+    program = BatchProgram()
+    op = ReduceOperation('reduce_arrays', 'partition')
+    value_serializer = mrs.make_primitive_serializer('<q')
+    output = list(op.reduce(program, iter(PAIRS), value_serializer))
+    assert output == [('a', 3), ('b', 3), ('c', 15)]
+    # NumPy scalars are converted to Python ints.
+    assert all(type(value) is int for key, value in output)
+
+
+def test_positional_size():
+    program = BatchProgram()
+    assert program.reduce_one.batch_size == 1
+    op = ReduceOperation('reduce_one', 'partition')
+    output = list(op.reduce(program, iter(PAIRS)))
+    assert output == [('a', 2), ('b', 1), ('c', 3)]
+    assert program.batch_lengths == [1, 1, 1]
+
+# vim: et sw=4 sts=4
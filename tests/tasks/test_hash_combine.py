@@ -0,0 +1,28 @@
+from collections import defaultdict
+
+from mrs.tasks import hash_combine
+
+
+def sum_combiner(key, values):
+    yield sum(values)
+
+
+def test_hash_combine():
+    pairs = [('a', 1), ('b', 2), ('a', 3), ('c', 4), ('b', 5)]
+    result = sorted(hash_combine(sum_combiner, iter(pairs)))
+    assert result == [('a', 4), ('b', 7), ('c', 4)]
+
+
+def test_hash_combine_flush():
+    pairs = [(i % 1000, 1) for i in range(50000)]
+    # A tiny table forces partial aggregates to be flushed.
+    result = list(hash_combine(sum_combiner, iter(pairs), 20000))
+    assert len(result) > 1000
+
+    counts = defaultdict(int)
+    for key, value in result:
+        counts[key] += value
+    assert len(counts) == 1000
+    assert all(count == 50 for count in counts.values())
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,70 @@
+import mrs
+from mrs.job import Job
+from mrs.tasks import Operation, ReduceOperation, encode_part_args
+
+
+def test_range_partition():
+    program = mrs.MapReduce(None, [])
+    boundaries = ['f', 'p']
+    keys = ['a', 'f', 'g', 'p', 'z']
+    splits = [program.range_partition(key, None, 3, boundaries)
+            for key in keys]
+    assert splits == [0, 1, 1, 2, 2]
+
+    # With fewer splits than ranges, ranges stay in order.
+    splits = [program.range_partition(key, None, 2, boundaries)
+            for key in keys]
+    assert splits == sorted(splits)
+
+
+def test_part_args_roundtrip():
+    program = mrs.MapReduce(None, [])
+    part_args = encode_part_args({'boundaries': [10, 20]})
+    op = ReduceOperation('reduce', 'range_partition', part_args=part_args)
+
+    args = op.to_args()
+    op2 = Operation.from_args(*args)
+    parter = op2.parter(program)
+    assert [parter(k, None, 3) for k in (5, 10, 15, 25)] == [0, 1, 1, 2]
+
+
+class CountingData(object):
+    """A stand-in for a completed dataset that counts the records read.
+
+    Split i holds `sizes[i]` records, with keys in sorted order.
+    """
+    def __init__(self, sizes):
+        self.splits = len(sizes)
+        self.sizes = sizes
+        self.read = 0
+
+    def stream_split(self, split):
+        for i in range(self.sizes[split]):
+            self.read += 1
+            yield (i * self.splits + split, None)
+
+
+def test_range_partitioner_presorted():
+    class FakeJob(object):
+        default_reduce_tasks = 4
+        _program = mrs.MapReduce(None, [])
+
+    # Each split is sorted by key (as with sorted map output), and the
+    # splits have different sizes.
+    sizes = [30000, 10000, 30000, 10000]
+    dataset = CountingData(sizes)
+    parter = Job.range_partitioner(FakeJob(), dataset, sample_fraction=0.5,
+            max_samples=4000)
+    assert dataset.read == sum(sizes)
+    assert len(parter.keywords['boundaries']) == 3
+
+    counts = [0] * 4
+    for split in range(4):
+        for key, _ in dataset.stream_split(split):
+            counts[parter(key, None, 4)] += 1
+    # Every range holds close to a quarter of the records.
+    mean = sum(sizes) / 4
+    for count in counts:
+        assert abs(count - mean) < 0.1 * mean
+
+# vim: et sw=4 sts=4
@@ -0,0 +1,33 @@
+from mrs.tasks import Operation, ReduceMapOperation, ReduceOperation
+
+
+class Program(object):
+    def map_combine(self, key, values):
+        yield max(values)
+
+    def reduce_combine(self, key, values):
+        yield sum(values)
+
+
+PAIRS = [('a', 1), ('a', 2), ('b', 3)]
+
+
+def test_reduce_combiner():
+    op = ReduceOperation('reduce', 'partition', combine_name='reduce_combine')
+    combine = op.reduce_combiner(Program())
+    assert list(combine(iter(PAIRS))) == [('a', 3), ('b', 3)]
+
+
+def test_reducemap_combiners():
+    op = ReduceMapOperation('reduce', 'map', 'map_combine', 'partition',
+            reduce_combine_name='reduce_combine')
+    op = Operation.from_args(*op.to_args())
+    program = Program()
+    assert list(op.combiner(program)(iter(PAIRS))) == [('a', 2), ('b', 3)]
+    combine = op.reduce_combiner(program)
+    assert list(combine(iter(PAIRS))) == [('a', 3), ('b', 3)]
+
+    op = ReduceMapOperation('reduce', 'map', 'map_combine', 'partition')
+    assert op.reduce_combiner(program) is None
+
+# vim: et sw=4 sts=4